@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import sys
 from utils.db_utils import get_db_engine
+from utils.schema_migrations import run_migrations
 from sqlalchemy import text
 
 def alter_table():
@@ -8,28 +9,12 @@ def alter_table():
         engine = get_db_engine()
         print("✅ 数据库连接成功\n")
         
-        with engine.begin() as conn:
-            # 添加字段到 stock_selected 表
-            print("📋 修改 stock_selected 表，添加新字段...")
-            
-            # 检查字段是否存在，如果不存在则添加
-            def add_column_if_not_exists(table_name, column_name, column_def):
-                try:
-                    conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_def}"))
-                    print(f"  ✅ 添加字段 {column_name} 成功")
-                except Exception as e:
-                    if "Duplicate column name" in str(e):
-                        print(f"  ℹ️  字段 {column_name} 已存在，跳过")
-                    else:
-                        raise e
-            
-            add_column_if_not_exists("stock_selected", "is_favorite", "TINYINT DEFAULT 0")
-            add_column_if_not_exists("stock_selected", "favorite_added_at", "DATETIME")
-            add_column_if_not_exists("stock_selected", "is_observation", "TINYINT DEFAULT 0")
-            add_column_if_not_exists("stock_selected", "observation_added_at", "DATETIME")
-            
-            print("\n🎉 表结构修改完成！")
-            
+        # 字段/索引变更统一由版本化迁移执行（utils/schema_migrations.py），已执行的版本自动跳过
+        print("📋 执行表结构迁移...")
+        applied = run_migrations(engine)
+        print(f"\n🎉 表结构修改完成！本次执行迁移: {applied or '无'}")
+
+        with engine.connect() as conn:
             # 查看修改后的表结构
             print("\n📋 查看修改后的表结构：")
             result = conn.execute(text("DESCRIBE stock_selected"))
@@ -1,9 +1,11 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
 from fastapi.responses import JSONResponse, RedirectResponse, FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
+import base64
 import subprocess
 import sys
 import json
@@ -11,13 +13,29 @@ import queue
 import threading
 import asyncio
 import signal
+import time
 import psutil
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from pydantic import BaseModel
 from datetime import datetime, timedelta
 import jwt
 
-from utils.db_utils import get_db_engine, get_config
+from utils.db_utils import (
+    get_db_engine, get_config, get_int_config, get_async_session, dispose_async_engine
+)
+from utils.select_worker import (
+    submit_selection_job, submit_formulas_job, warm_up_select_executor, shutdown_select_executor
+)
+from utils.formula_engine import FormulaError, list_formulas, get_formula, save_formula, delete_formula
+from utils.backtest import DEFAULT_HORIZONS, backtest_selected
+from utils.daily_row_counts import get_monthly_counts as get_monthly_row_counts
+from utils.data_versions import GET_VERSION_SQL, STOCK_SELECTED, bump_data_version, ensure_data_version_table
+from utils.latest_close import get_overview_stats
+from utils.stock_search import code_query_prefix, get_stock_index, invalidate_stock_index
+from utils.job_queue import (
+    enqueue_job, get_job, list_jobs, claim_next_jobs, heartbeat_jobs,
+    finish_job, cancel_pending_jobs, recover_interrupted_jobs
+)
 
 app = FastAPI(title="Quantum Stock API", version="1.0.0")
 
@@ -142,6 +160,335 @@ class ProcessManager:
 # 全局进程管理器实例
 process_manager = ProcessManager()
 
+
+class TTLCache:
+    """进程内的统计结果缓存：按键缓存接口返回值，超过有效期或数据变更后重新计算"""
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self.entries: Dict[str, tuple] = {}
+        self.lock = threading.Lock()
+
+    def get(self, key: str, loader):
+        """返回未过期的缓存值；否则调用loader()计算并缓存"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and now - entry[0] < self.ttl_seconds:
+                return entry[1]
+        value = loader()
+        with self.lock:
+            self.entries[key] = (now, value)
+        return value
+
+    async def get_async(self, key: str, loader):
+        """异步版本的get：loader()返回可等待对象"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and now - entry[0] < self.ttl_seconds:
+                return entry[1]
+        value = await loader()
+        with self.lock:
+            self.entries[key] = (now, value)
+        return value
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# 首页概览统计缓存（日K线抽取、选股完成或删除选股记录后失效）
+stats_cache = TTLCache(get_int_config("STATS_CACHE_TTL", 300))
+# 选股记录查询的总条数缓存，按 (stock_selected数据版本号, 筛选条件) 区分：
+# 任一进程写入或删除选股记录都会递增版本号，其他API进程的下一次查询即按新版本重新计数
+query_total_cache = TTLCache(get_int_config("QUERY_TOTAL_CACHE_TTL", 60))
+# 执行结束后需要刷新统计缓存的任务类型
+STATS_TASK_TYPES = ("daily_update", "select_stock")
+
+
+def invalidate_selection_caches():
+    """stock_selected或日线数据变更后，清空本进程中依赖它们的统计缓存（释放旧版本号的缓存项）"""
+    stats_cache.invalidate()
+    query_total_cache.invalidate()
+
+
+# 各任务类型默认的并发上限（可通过环境变量 JOB_LIMIT_<任务类型大写> 覆盖）
+DEFAULT_JOB_LIMITS = {
+    "daily_update": 1,
+    "names_update": 1,
+    "tushare_verify": 1,
+    "select_stock": 1,
+}
+
+
+def build_script_command(task_type: str, params: dict, recovered: bool = False):
+    """
+    根据任务类型和参数构造 (脚本相对路径, stdin输入行, 命令行参数)
+    recovered: 任务因服务重启被重新排队；日K线抽取此时按断点续传执行，只重做未完成的交易日
+    """
+    if task_type == "daily_update":
+        args = []
+        if params.get("gaps_only"):
+            args.append("--gaps-only")
+        elif params.get("resume") or recovered:
+            args.append("--resume")
+        return os.path.join("utils", "tushare_update_daily.py"), [params["start_date"], params["end_date"]], args
+    if task_type == "names_update":
+        return os.path.join("utils", "baostock_update_names.py"), [], []
+    if task_type == "tushare_verify":
+        args = []
+        if params.get("start_date"):
+            args.extend(["--start_date", params["start_date"]])
+        if params.get("end_date"):
+            args.extend(["--end_date", params["end_date"]])
+        return os.path.join("utils", "tushare_verify_counts.py"), [], args
+    raise ValueError(f"未知的任务类型: {task_type}")
+
+
+class JobOutput:
+    """单个任务的实时输出缓冲，供流式接口订阅"""
+    def __init__(self):
+        self.lines: list = []
+        self.started = False
+        self.done = False
+        self.returncode: Optional[int] = None
+        self.changed = asyncio.Event()
+
+    def append(self, line: str):
+        self.lines.append(line)
+        self._notify()
+
+    def close(self, returncode: Optional[int]):
+        self.done = True
+        self.returncode = returncode
+        self._notify()
+
+    def _notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+# 任务调度器：数据库持久化的任务队列 + 按任务类型的并发上限 + 重启恢复
+class JobScheduler:
+    def __init__(self, process_manager: ProcessManager):
+        self.process_manager = process_manager
+        self.outputs: Dict[str, JobOutput] = {}
+        self.running: Dict[str, asyncio.Task] = {}
+        self.limits = {}
+        for task_type, default in DEFAULT_JOB_LIMITS.items():
+            limit = get_config(f"JOB_LIMIT_{task_type.upper()}", default)
+            try:
+                self.limits[task_type] = max(int(limit), 1)
+            except (ValueError, TypeError):
+                self.limits[task_type] = default
+        self.wakeup: Optional[asyncio.Event] = None
+        self.loop_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """服务启动：恢复中断的任务并启动调度循环"""
+        self.wakeup = asyncio.Event()
+        try:
+            recovered = await asyncio.to_thread(recover_interrupted_jobs)
+            if recovered:
+                print(f"♻️ 已恢复 {recovered} 个中断的任务，重新排队执行")
+        except Exception as e:
+            print(f"恢复中断任务失败: {e}")
+        self.loop_task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self.loop_task:
+            self.loop_task.cancel()
+
+    def output(self, job_id: str) -> JobOutput:
+        if job_id not in self.outputs:
+            self.outputs[job_id] = JobOutput()
+        return self.outputs[job_id]
+
+    async def enqueue(self, task_type: str, params: dict):
+        """任务入队（相同任务已排队或执行中时直接复用），返回 (job_id, 是否新建)"""
+        job_id, created = await asyncio.to_thread(enqueue_job, task_type, params)
+        self.output(job_id)
+        if self.wakeup:
+            self.wakeup.set()
+        return job_id, created
+
+    async def cancel_pending(self, task_type: str) -> int:
+        return await asyncio.to_thread(cancel_pending_jobs, task_type)
+
+    async def _loop(self):
+        """调度循环：领取可执行的任务、维护心跳、回收心跳超时的任务"""
+        last_maintenance = 0.0
+        while True:
+            try:
+                for job in await asyncio.to_thread(claim_next_jobs, self.limits):
+                    self.running[job["job_id"]] = asyncio.create_task(self._run(job))
+                if time.monotonic() - last_maintenance > 30:
+                    last_maintenance = time.monotonic()
+                    await asyncio.to_thread(heartbeat_jobs, list(self.running))
+                    await asyncio.to_thread(recover_interrupted_jobs)
+                    self._prune_outputs()
+            except Exception as e:
+                print(f"任务调度出错: {e}")
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+    def _prune_outputs(self, keep: int = 20):
+        """只保留最近若干个已结束任务的输出缓冲"""
+        finished = [jid for jid, out in self.outputs.items() if out.done]
+        for jid in finished[:max(len(finished) - keep, 0)]:
+            del self.outputs[jid]
+
+    async def _run(self, job: dict):
+        job_id = job["job_id"]
+        output = self.output(job_id)
+        output.started = True
+        status, result, returncode = "FAIL", None, None
+        try:
+            if job["task_type"] == "select_stock":
+                status, result = await self._run_selection(job, output)
+                returncode = 0 if status == "SUCCESS" else 1
+            else:
+                status, result = await self._run_script(job, output)
+                returncode = result.get("returncode")
+        except Exception as e:
+            output.append(f"❌ 任务执行出错: {e}\n")
+            result = {"error": str(e)}
+        finally:
+            try:
+                await asyncio.to_thread(finish_job, job_id, status, result)
+            except Exception as e:
+                print(f"记录任务 {job_id} 结束状态失败: {e}")
+            if job["task_type"] in STATS_TASK_TYPES:
+                invalidate_selection_caches()
+            elif job["task_type"] == "names_update":
+                invalidate_stock_index()
+            output.close(returncode)
+            self.running.pop(job_id, None)
+            if self.wakeup:
+                self.wakeup.set()
+
+    async def _run_selection(self, job: dict, output: JobOutput):
+        """在常驻选股进程池中执行选股任务"""
+        params = job["params"]
+        future = submit_selection_job(
+            params["start_date"], params["end_date"], params.get("select_text", ""),
+            0, params.get("incremental", False), params.get("workers"), params.get("formula_name")
+        )
+        result = await asyncio.wrap_future(future)
+        output.append(f"共筛选出 {result.get('stocks_selected', 0)} 条符合条件的股票记录\n")
+        return ("SUCCESS" if result.get("ok") else "FAIL"), result
+
+    async def _run_script(self, job: dict, output: JobOutput):
+        """以子进程执行ETL脚本，实时收集输出"""
+        job_id = job["job_id"]
+        recovered = bool((job.get("result") or {}).get("recovered"))
+        script_rel_path, inputs, args = build_script_command(job["task_type"], job["params"], recovered)
+        script_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), script_rel_path)
+        if not os.path.exists(script_path):
+            output.append(f"错误: 脚本不存在: {script_path}\n")
+            return "FAIL", {"returncode": None, "error": "脚本不存在"}
+
+        cmd = [sys.executable, "-u", script_path] + args  # -u 参数禁用Python输出缓冲
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+
+        # 注册进程到管理器
+        self.process_manager.register(job_id, process, task_type=job["task_type"])
+        try:
+            # 发送输入
+            process.stdin.write(("\n".join(inputs) + "\n").encode())
+            await process.stdin.drain()
+            process.stdin.close()
+
+            # 实时读取输出，直到子进程关闭输出流（正常结束或被终止）
+            while True:
+                line = await process.stdout.readline()
+                if not line:
+                    break
+                output.append(line.decode('utf-8', errors='replace'))
+            await process.wait()
+        finally:
+            # 进程已被 /api/process/terminate 终止时，管理器中已无该任务
+            terminated = self.process_manager.get_process(job_id) is None
+            self.process_manager.unregister(job_id)
+
+        if terminated and process.returncode != 0:
+            output.append("\n[进程已被终止]\n")
+            return "CANCELLED", {"returncode": process.returncode}
+        return ("SUCCESS" if process.returncode == 0 else "FAIL"), {"returncode": process.returncode}
+
+
+# 全局任务调度器实例
+job_scheduler = JobScheduler(process_manager)
+
+
+async def stream_job_output(job_id: str):
+    """流式输出任务日志：排队期间给出提示，执行中实时输出，结束时给出返回码"""
+    output = job_scheduler.output(job_id)
+    index = 0
+    queued_notice = False
+    enqueued_at = last_db_check = time.monotonic()
+    while True:
+        while index < len(output.lines):
+            yield output.lines[index]
+            index += 1
+        if output.done:
+            yield f"\n[执行完成，返回码: {output.returncode}]\n"
+            return
+        # 等待超过1秒仍未开始执行时，提示任务正在排队
+        if not output.started and not queued_notice and time.monotonic() - enqueued_at > 1:
+            queued_notice = True
+            yield "任务已进入队列，等待同类任务完成后开始执行...\n"
+
+        # 任务不在本实例执行（例如由其他实例或重启前领取）时，定期从数据库确认是否已结束
+        if job_id not in job_scheduler.running and time.monotonic() - last_db_check > 5:
+            last_db_check = time.monotonic()
+            job = await asyncio.to_thread(get_job, job_id)
+            if job and job["status"] not in ("PENDING", "RUNNING"):
+                returncode = (job.get("result") or {}).get("returncode")
+                yield f"\n[任务已结束，状态: {job['status']}，返回码: {returncode}]\n"
+                return
+
+        changed = output.changed
+        try:
+            await asyncio.wait_for(changed.wait(), timeout=1)
+        except asyncio.TimeoutError:
+            pass
+
+
+def streaming_job_response(job_id: str):
+    return StreamingResponse(
+        stream_job_output(job_id),
+        media_type="text/plain",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "Connection": "keep-alive",
+            "X-Task-ID": job_id,  # 返回任务ID，前端可用于终止
+        }
+    )
+
+
+@app.on_event("startup")
+async def start_job_scheduler():
+    """服务启动时拉起选股工作进程、恢复中断任务并启动调度循环"""
+    warm_up_select_executor()
+    await job_scheduler.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_scheduler():
+    await job_scheduler.stop()
+    shutdown_select_executor()
+    await dispose_async_engine()
+
 # CORS配置 - 允许前端直接请求
 app.add_middleware(
     CORSMiddleware,
@@ -255,74 +602,71 @@ def require_auth(request: Request):
 
 # ========== Auth ==========
 @app.post("/api/auth/login")
-async def login(request: Request, body: dict):
+async def login(request: Request, body: dict, session: AsyncSession = Depends(get_async_session)):
     username = body.get("username", "")
     password = body.get("password", "")
     
-    engine = get_db_engine()
     try:
-        with engine.connect() as conn:
-            conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS app_users (
-                username VARCHAR(50) PRIMARY KEY,
-                password VARCHAR(255) NOT NULL,
-                name VARCHAR(100),
-                role VARCHAR(20) DEFAULT 'user',
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-            )
-            """))
-            conn.commit()
+        await session.execute(text("""
+        CREATE TABLE IF NOT EXISTS app_users (
+            username VARCHAR(50) PRIMARY KEY,
+            password VARCHAR(255) NOT NULL,
+            name VARCHAR(100),
+            role VARCHAR(20) DEFAULT 'user',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """))
+        await session.commit()
         
-        with engine.connect() as conn:
-            row = conn.execute(
-                text("SELECT username, password, name, role FROM app_users WHERE username = :username"),
-                {"username": username}
-            ).fetchone()
-            
-            expected_username = get_config("APP_USERNAME", "admin")
-            expected_password = get_config("APP_PASSWORD", "admin")
-            
-            user_data = None
+        row = (await session.execute(
+            text("SELECT username, password, name, role FROM app_users WHERE username = :username"),
+            {"username": username}
+        )).fetchone()
+        
+        expected_username = get_config("APP_USERNAME", "admin")
+        expected_password = get_config("APP_PASSWORD", "admin")
+        
+        user_data = None
+        
+        if row:
+            if row[0] == expected_username and password == expected_password:
+                await session.execute(
+                    text("UPDATE app_users SET password = :password WHERE username = :username"),
+                    {"password": expected_password, "username": expected_username}
+                )
+                await session.commit()
+                user_data = {"username": row[0], "name": row[2], "role": row[3] or "user"}
+            elif row[1] == password:
+                user_data = {"username": row[0], "name": row[2], "role": row[3] or "user"}
+        else:
+            if username == expected_username and password == expected_password:
+                await session.execute(text("""
+                INSERT INTO app_users (username, password, name, role)
+                VALUES (:username, :password, :name, 'admin')
+                """), {
+                    "username": username,
+                    "password": password,
+                    "name": "Admin"
+                })
+                await session.commit()
+                user_data = {"username": username, "name": "Admin", "role": "admin"}
+        
+        if user_data:
+            request.session["authenticated"] = True
+            request.session["username"] = user_data["username"]
+            request.session["name"] = user_data["name"]
+            request.session["role"] = user_data["role"]
             
-            if row:
-                if row[0] == expected_username and password == expected_password:
-                    with engine.begin() as conn_update:
-                        conn_update.execute(
-                            text("UPDATE app_users SET password = :password WHERE username = :username"),
-                            {"password": expected_password, "username": expected_username}
-                        )
-                    user_data = {"username": row[0], "name": row[2], "role": row[3] or "user"}
-                elif row[1] == password:
-                    user_data = {"username": row[0], "name": row[2], "role": row[3] or "user"}
-            else:
-                if username == expected_username and password == expected_password:
-                    with engine.begin() as conn:
-                        conn.execute(text("""
-                        INSERT INTO app_users (username, password, name, role)
-                        VALUES (:username, :password, :name, 'admin')
-                        """), {
-                            "username": username,
-                            "password": password,
-                            "name": "Admin"
-                        })
-                    user_data = {"username": username, "name": "Admin", "role": "admin"}
+            token = create_token(user_data["username"], user_data["name"], user_data["role"])
             
-            if user_data:
-                request.session["authenticated"] = True
-                request.session["username"] = user_data["username"]
-                request.session["name"] = user_data["name"]
-                request.session["role"] = user_data["role"]
-                
-                token = create_token(user_data["username"], user_data["name"], user_data["role"])
-                
-                return {
-                    "ok": True, 
-                    "username": user_data["username"], 
-                    "name": user_data["name"], 
-                    "role": user_data["role"],
-                    "token": token
-                }
+            return {
+                "ok": True, 
+                "username": user_data["username"], 
+                "name": user_data["name"], 
+                "role": user_data["role"],
+                "token": token
+            }
             
         raise HTTPException(status_code=401, detail="用户名或密码错误")
     except HTTPException:
@@ -376,8 +720,24 @@ def convert_to_yyyymmdd(date_str):
     return date_str
 
 # ========== 查询 ==========
+def encode_query_cursor(row) -> str:
+    """把一页最后一条记录的排序键 (trade_date, ts_code, execute_id) 编码为翻页游标"""
+    key = [str(row["trade_date"]), row["ts_code"], str(row["execute_id"])]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_query_cursor(cursor: str) -> list:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        if isinstance(key, list) and len(key) == 3:
+            return key
+    except (ValueError, UnicodeDecodeError):
+        pass
+    raise HTTPException(status_code=400, detail="cursor无效")
+
+
 @app.get("/api/query/stock_selected")
-def query_stock_selected(
+async def query_stock_selected(
     request: Request,
     ts_code: Optional[str] = None,
     buy_date_start: Optional[str] = None,
@@ -387,15 +747,37 @@ def query_stock_selected(
     execute_id: Optional[str] = None,
     page: int = 1,
     page_size: int = 50,
+    cursor: Optional[str] = None,
     dep=Depends(require_auth),
+    session: AsyncSession = Depends(get_async_session),
 ):
-    engine = get_db_engine()
+    """
+    查询选股记录，按 (trade_date, ts_code, execute_id) 倒序
+    传入上一页返回的next_cursor时按排序键定位（keyset分页），每页耗时与翻页深度无关；
+    不传cursor时按page/page_size偏移分页。总条数按筛选条件缓存QUERY_TOTAL_CACHE_TTL秒，
+    选股记录变更（数据版本号递增）后立即重新计数。
+    """
     base_where = " WHERE 1=1"
     params = {}
 
     if ts_code:
-        base_where += " AND t1.ts_code LIKE :ts_code"
-        params["ts_code"] = f"%{ts_code}%"
+        # 代码/名称/拼音首字母经内存索引解析为精确的代码列表，以IN条件走索引过滤；
+        # 输入形如代码时再按代码前缀直接匹配，stock_name中已删除的（如退市）股票仍可查到
+        try:
+            ts_codes = (await asyncio.to_thread(get_stock_index)).search(ts_code)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        code_prefix = code_query_prefix(ts_code)
+        if not ts_codes and not code_prefix:
+            return {"total": 0, "items": [], "next_cursor": None}
+        code_conditions = []
+        if ts_codes:
+            code_conditions.append("t1.ts_code IN :ts_codes")
+            params["ts_codes"] = ts_codes
+        if code_prefix:
+            code_conditions.append("t1.ts_code LIKE :code_prefix")
+            params["code_prefix"] = code_prefix + "%"
+        base_where += f" AND ({' OR '.join(code_conditions)})"
     if buy_date_start:
         base_where += " AND t1.buy_date >= :buy_start"
         params["buy_start"] = convert_to_yyyymmdd(buy_date_start)
@@ -412,74 +794,74 @@ def query_stock_selected(
         base_where += " AND t1.execute_id = :exec_id"
         params["exec_id"] = execute_id
 
-    offset = (max(page, 1) - 1) * max(page_size, 1)
+    page_size = max(page_size, 1)
+    page_where = base_where
+    page_params = {**params, "limit": page_size + 1}
+    if cursor:
+        page_params["cur_date"], page_params["cur_code"], page_params["cur_exec"] = decode_query_cursor(cursor)
+        page_where += """ AND (t1.trade_date < :cur_date OR (t1.trade_date = :cur_date AND (t1.ts_code < :cur_code
+                          OR (t1.ts_code = :cur_code AND t1.execute_id < :cur_exec))))"""
+        offset_sql = ""
+    else:
+        page_params["offset"] = (max(page, 1) - 1) * page_size
+        offset_sql = " OFFSET :offset"
+
+    def build_sql(sql):
+        q = text(sql)
+        return q.bindparams(bindparam("ts_codes", expanding=True)) if "ts_codes" in params else q
+
+    async def count_total():
+        return (await session.execute(build_sql(f"SELECT COUNT(*) FROM stock_selected t1 {base_where}"), params)).scalar()
 
     try:
-        with engine.connect() as conn:
-            total = conn.execute(text(f"SELECT COUNT(*) FROM stock_selected t1 {base_where}"), params).scalar()
-            q = text(f"""
-                SELECT 
-                    t1.buy_date, t1.gold_date, t1.execute_id, 
-                    t1.ts_code, t2.ts_code_name as stock_name,
-                    t1.trade_date, t1.price_open, t1.price_close, t1.price_high, t1.price_low,
-                    t1.vol, t1.amount,
-                    t1.is_favorite, t1.favorite_added_at,
-                    t1.is_observation, t1.observation_added_at
-                FROM stock_selected t1
-                LEFT JOIN stock_name t2 ON t1.ts_code = t2.ts_code
-                {base_where}
-                ORDER BY t1.trade_date DESC
-                LIMIT :limit OFFSET :offset
-            """)
-            rows = conn.execute(q, {**params, "limit": page_size, "offset": offset}).mappings().all()
-            items = []
-            for row in rows:
-                item = dict(row)
-                item["buy_date"] = format_date_str(item["buy_date"])
-                item["gold_date"] = format_date_str(item["gold_date"])
-                item["execute_id"] = str(item["execute_id"]) if item["execute_id"] else ""
-                items.append(item)
-        return {"total": total, "items": items}
+        await asyncio.to_thread(ensure_data_version_table)
+        version = (await session.execute(text(GET_VERSION_SQL), {"name": STOCK_SELECTED})).scalar() or 0
+        total = await query_total_cache.get_async(f"{version}:{json.dumps(params, sort_keys=True)}", count_total)
+        q = build_sql(f"""
+            SELECT 
+                t1.buy_date, t1.gold_date, t1.execute_id, 
+                t1.ts_code, t2.ts_code_name as stock_name,
+                t1.trade_date, t1.price_open, t1.price_close, t1.price_high, t1.price_low,
+                t1.vol, t1.amount,
+                t1.is_favorite, t1.favorite_added_at,
+                t1.is_observation, t1.observation_added_at
+            FROM stock_selected t1
+            LEFT JOIN stock_name t2 ON t1.ts_code = t2.ts_code
+            {page_where}
+            ORDER BY t1.trade_date DESC, t1.ts_code DESC, t1.execute_id DESC
+            LIMIT :limit{offset_sql}
+        """)
+        rows = (await session.execute(q, page_params)).mappings().all()
+        # 多取一条判断是否还有下一页
+        next_cursor = encode_query_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+        items = []
+        for row in rows[:page_size]:
+            item = dict(row)
+            item["buy_date"] = format_date_str(item["buy_date"])
+            item["gold_date"] = format_date_str(item["gold_date"])
+            item["execute_id"] = str(item["execute_id"]) if item["execute_id"] else ""
+            items.append(item)
+        return {"total": total, "items": items, "next_cursor": next_cursor}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/stock/suggest")
+async def suggest_stocks(q: str = "", limit: int = 10, dep=Depends(require_auth)):
+    """搜索框自动补全：按代码前缀、拼音首字母、名称子串匹配股票（内存索引，不查询数据库）"""
+    try:
+        index = await asyncio.to_thread(get_stock_index)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"items": index.suggest(q, max(1, min(limit, 50)))}
+
+
 # ========== 统计 ==========
 @app.get("/api/stats/overview")
 def get_stats_overview():
-    engine = get_db_engine()
+    """首页概览：选股记录数与按最新收盘价快照计算的整体收益率（结果缓存STATS_CACHE_TTL秒）"""
     try:
-        with engine.connect() as conn:
-            stock_count_result = conn.execute(text("SELECT COUNT(*) as cnt FROM stock_selected"))
-            stock_count = stock_count_result.fetchone()[0]
-            
-            sql = text("""
-                SELECT 
-                    SUM(t2.price_close - t1.price_close) / NULLIF(SUM(t1.price_close), 0) * 100 as yield_rate
-                FROM stock_selected t1
-                INNER JOIN (
-                    SELECT ts_code, price_close 
-                    FROM cn_stock_daily 
-                    WHERE trade_date = (SELECT MAX(trade_date) FROM cn_stock_daily)
-                ) t2 ON CAST(t1.ts_code AS CHAR CHARACTER SET utf8mb4) = CAST(t2.ts_code AS CHAR CHARACTER SET utf8mb4)
-            """)
-            yield_result = conn.execute(sql)
-            yield_row = yield_result.fetchone()
-            
-            yield_rate = yield_row[0] if yield_row and yield_row[0] is not None else None
-            
-            if yield_rate is not None:
-                yield_value = f"{yield_rate:+.2f}%"
-                yield_positive = yield_rate >= 0
-            else:
-                yield_value = "N/A"
-                yield_positive = True
-                
-        return {
-            "stockCount": str(stock_count),
-            "yield": yield_value,
-            "yieldPositive": yield_positive
-        }
+        stats = stats_cache.get("overview", get_overview_stats)
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -489,40 +871,75 @@ def get_stats_overview():
             "yieldPositive": True
         }
 
+    yield_rate = stats["yield_rate"]
+    if yield_rate is not None:
+        yield_value = f"{yield_rate:+.2f}%"
+        yield_positive = yield_rate >= 0
+    else:
+        yield_value = "N/A"
+        yield_positive = True
+    return {
+        "stockCount": str(stats["stock_count"]),
+        "yield": yield_value,
+        "yieldPositive": yield_positive
+    }
+
+
+@app.get("/api/stats/backtest")
+def get_backtest(
+    execute_id: Optional[List[str]] = Query(None),
+    buy_date_start: Optional[str] = None,
+    buy_date_end: Optional[str] = None,
+    horizons: Optional[str] = None,
+    entry: str = "open",
+    dep=Depends(require_auth),
+):
+    """
+    回测选股记录：按execute_id分组计算买入后N个交易日的收益率、最大回撤与胜率
+    execute_id可重复传入多个批次（默认全部）；horizons为逗号分隔的持有期（交易日），默认1,3,5,10,20
+    """
+    if entry not in ("open", "close"):
+        raise HTTPException(status_code=400, detail="entry只能为open或close")
+    try:
+        horizon_list = [int(h) for h in horizons.split(",") if h.strip()] if horizons else list(DEFAULT_HORIZONS)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="horizons格式应为逗号分隔的整数")
+    execute_ids = [e for e in execute_id if e] if execute_id else None
+    try:
+        return backtest_selected(
+            execute_ids,
+            convert_to_yyyymmdd(buy_date_start) if buy_date_start else None,
+            convert_to_yyyymmdd(buy_date_end) if buy_date_end else None,
+            horizon_list,
+            entry,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 
 # ========== 日志 ==========
 @app.get("/api/logs")
-def get_logs(task_name: str, limit: int = 20):
-    engine = get_db_engine()
+async def get_logs(task_name: str, limit: int = 20, session: AsyncSession = Depends(get_async_session)):
     try:
-        with engine.connect() as conn:
-            # 先查询所有任务名称（用于调试）
-            all_tasks = conn.execute(text("SELECT DISTINCT task_name FROM task_logs")).fetchall()
-            print(f"[DEBUG] 所有任务名称: {[r[0] for r in all_tasks]}")
-            print(f"[DEBUG] 查询任务: {task_name}, limit: {limit}")
-            
-            q = text("""
-                SELECT execute_time, status, message
-                FROM task_logs
-                WHERE task_name = :task_name
-                AND status != 'RUNNING'
-                ORDER BY execute_time DESC
-                LIMIT :limit
-            """)
-            rows = conn.execute(q, {"task_name": task_name, "limit": limit}).mappings().all()
-            print(f"[DEBUG] 查询到 {len(rows)} 条记录")
-            
-            items = []
-            for row in rows:
-                item = dict(row)
-                print(f"[DEBUG] 记录: {item}")
-                # 将 datetime 对象转换为 ISO 格式字符串
-                if item.get("execute_time"):
-                    item["execute_time"] = item["execute_time"].isoformat()
-                items.append(item)
-            return {"items": items}
+        q = text("""
+            SELECT execute_time, status, message
+            FROM task_logs
+            WHERE task_name = :task_name
+            AND status != 'RUNNING'
+            ORDER BY execute_time DESC
+            LIMIT :limit
+        """)
+        rows = (await session.execute(q, {"task_name": task_name, "limit": limit})).mappings().all()
+
+        items = []
+        for row in rows:
+            item = dict(row)
+            # 将 datetime 对象转换为 ISO 格式字符串
+            if item.get("execute_time"):
+                item["execute_time"] = item["execute_time"].isoformat()
+            items.append(item)
+        return {"items": items}
     except Exception as e:
-        print(f"[DEBUG] 查询日志出错: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -532,152 +949,35 @@ def get_monthly_counts(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None
 ):
-    """获取按月统计数据条目（仅数据库）"""
-    engine = get_db_engine()
+    """获取按月统计数据条目（读取按交易日预聚合的条目数汇总表，月度汇总在SQL中完成）"""
     try:
-        with engine.connect() as conn:
-            # 构建查询条件
-            where_conditions = []
-            params = {}
-            
-            if start_date:
-                start_ymd = start_date.replace("-", "")
-                where_conditions.append("trade_date >= :start_date")
-                params["start_date"] = start_ymd
-            
-            if end_date:
-                end_ymd = end_date.replace("-", "")
-                where_conditions.append("trade_date <= :end_date")
-                params["end_date"] = end_ymd
-            
-            where_clause = " WHERE " + " AND ".join(where_conditions) if where_conditions else ""
-            
-            # 查询数据库数据
-            q = text(f"""
-                SELECT 
-                    trade_date,
-                    COUNT(*) AS total_count
-                FROM cn_stock_daily
-                {where_clause}
-                GROUP BY trade_date
-                ORDER BY trade_date DESC
-            """)
-            rows = conn.execute(q, params).mappings().all()
-            
-            # 在Python中处理年月分组
-            monthly_data = {}
-            for row in rows:
-                trade_date = row["trade_date"]
-                # 处理 date 类型或字符串类型
-                if hasattr(trade_date, 'year'):
-                    # datetime.date 对象
-                    year_month = f"{trade_date.year}-{trade_date.month:02d}"
-                else:
-                    # 字符串格式 (YYYYMMDD 或 YYYY-MM-DD)
-                    trade_date_str = str(trade_date)
-                    if len(trade_date_str) == 8:
-                        year_month = f"{trade_date_str[:4]}-{trade_date_str[4:6]}"
-                    elif len(trade_date_str) >= 7:
-                        year_month = trade_date_str[:7]
-                    else:
-                        continue
-                
-                if year_month not in monthly_data:
-                    monthly_data[year_month] = 0
-                monthly_data[year_month] += row["total_count"]
-            
-            # 转换为列表格式
-            items = []
-            for ym, cnt in sorted(monthly_data.items(), reverse=True):
-                items.append({
-                    "year_month": ym,
-                    "count": cnt
-                })
-            
-            return {"items": items}
+        start_ymd = start_date.replace("-", "") if start_date else None
+        end_ymd = end_date.replace("-", "") if end_date else None
+        monthly_data = get_monthly_row_counts(start_ymd, end_ymd)
+
+        # 转换为列表格式
+        items = []
+        for ym, cnt in sorted(monthly_data.items(), reverse=True):
+            items.append({
+                "year_month": ym,
+                "count": cnt
+            })
+
+        return {"items": items}
     except Exception as e:
         print(f"[ERROR] 月度统计查询失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-async def run_tushare_verify_script(task_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None):
-    """流式执行Tushare校验脚本"""
-    import asyncio
-    
-    script_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "utils", "tushare_verify_counts.py")
-    if not os.path.exists(script_path):
-        yield "错误: 脚本不存在\n"
-        return
-    
-    # 构建命令行参数
-    cmd = [sys.executable, "-u", script_path]
-    if start_date:
-        cmd.extend(["--start_date", start_date])
-    if end_date:
-        cmd.extend(["--end_date", end_date])
-    
-    # 使用 asyncio 创建子进程
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.STDOUT,
-    )
-    
-    # 注册进程到管理器
-    process_manager.register(task_id, process, task_type="tushare_verify")
-    
-    try:
-        # 实时读取输出
-        while True:
-            # 检查进程是否被终止
-            if process.returncode is not None:
-                yield "\n[进程已被终止]\n"
-                break
-            
-            try:
-                # 使用 wait_for 来允许检查进程状态
-                line = await asyncio.wait_for(process.stdout.readline(), timeout=0.1)
-                if not line:
-                    if process.returncode is not None:
-                        break
-                    continue
-                yield line.decode('utf-8', errors='replace')
-            except asyncio.TimeoutError:
-                # 超时继续循环，允许检查进程状态
-                continue
-        
-        # 等待进程结束
-        if process.returncode is None:
-            await process.wait()
-        
-        # 返回最终结果标记
-        yield f"\n[执行完成，返回码: {process.returncode}]\n"
-    finally:
-        # 从管理器中注销进程
-        process_manager.unregister(task_id)
-
-
 @app.get("/api/stats/tushare_verify")
 async def get_tushare_verify(
     request: Request,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None
 ):
-    """获取Tushare校验数据，流式输出"""
-    # 生成唯一任务ID
-    import uuid
-    task_id = f"tushare_verify_{uuid.uuid4().hex[:8]}"
-    
-    return StreamingResponse(
-        run_tushare_verify_script(task_id, start_date, end_date),
-        media_type="text/plain",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",
-            "Connection": "keep-alive",
-            "X-Task-ID": task_id,  # 返回任务ID，前端可用于终止
-        }
-    )
+    """获取Tushare校验数据，流式输出（任务经队列调度执行）"""
+    job_id, _ = await job_scheduler.enqueue("tushare_verify", {"start_date": start_date, "end_date": end_date})
+    return streaming_job_response(job_id)
 
 
 # ========== 进程管理 API ==========
@@ -686,13 +986,15 @@ async def terminate_process(request: Request, body: dict):
     """终止指定任务的所有相关进程"""
     task_type = body.get("task_type", "tushare_verify")
     
-    # 终止所有指定类型的进程
+    # 先取消排队中的同类任务，再终止所有指定类型的进程
+    cancelled = await job_scheduler.cancel_pending(task_type)
     count = process_manager.terminate_all_by_type(task_type)
     
     return {
         "ok": True,
-        "message": f"已终止 {count} 个进程",
-        "terminated_count": count
+        "message": f"已终止 {count} 个进程，取消 {cancelled} 个排队任务",
+        "terminated_count": count,
+        "cancelled_count": cancelled
     }
 
 
@@ -707,6 +1009,22 @@ async def list_processes():
     }
 
 
+@app.get("/api/jobs")
+async def get_jobs(status: Optional[str] = None, task_type: Optional[str] = None, limit: int = 50, dep=Depends(require_auth)):
+    """列出任务队列中的任务"""
+    items = await asyncio.to_thread(list_jobs, status, task_type, limit)
+    return {"ok": True, "items": items, "limits": job_scheduler.limits}
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_detail(job_id: str, dep=Depends(require_auth)):
+    """获取单个任务的状态与结果"""
+    job = await asyncio.to_thread(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return {"ok": True, **job}
+
+
 # ========== 任务触发（异步执行） ==========
 def run_script_async(script_rel_path: str, inputs: list[str]):
     script_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), script_rel_path)
@@ -728,12 +1046,12 @@ def run_script_async(script_rel_path: str, inputs: list[str]):
         return {"ok": False, "error": str(e)}
 
 
-def run_script(script_rel_path: str, inputs: list[str]) -> dict:
+def run_script(script_rel_path: str, inputs: list[str], args: Optional[list[str]] = None) -> dict:
     script_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), script_rel_path)
     if not os.path.exists(script_path):
         return {"ok": False, "error": f"脚本不存在: {script_path}"}
 
-    cmd = [sys.executable, script_path]
+    cmd = [sys.executable, script_path] + (args or [])
     input_str = "\n".join(inputs) + "\n"
     try:
         res = subprocess.run(
@@ -750,73 +1068,19 @@ def run_script(script_rel_path: str, inputs: list[str]) -> dict:
         return {"ok": False, "error": str(e)}
 
 
-async def run_script_streaming(task_id: str, script_rel_path: str, inputs: list[str], task_type: str = "script"):
-    """流式执行脚本，实时输出日志"""
-    import asyncio
-    
-    script_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), script_rel_path)
-    if not os.path.exists(script_path):
-        yield f"错误: 脚本不存在: {script_path}\n"
-        return
-
-    cmd = [sys.executable, "-u", script_path]  # -u 参数禁用Python输出缓冲
-    input_str = "\n".join(inputs) + "\n"
-    
-    # 使用 asyncio 创建子进程
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdin=asyncio.subprocess.PIPE,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.STDOUT,
-    )
-    
-    # 注册进程到管理器
-    process_manager.register(task_id, process, task_type=task_type)
-    
-    try:
-        # 发送输入
-        process.stdin.write(input_str.encode())
-        await process.stdin.drain()
-        process.stdin.close()
-        
-        # 实时读取输出
-        while True:
-            # 检查进程是否被终止
-            if process.returncode is not None:
-                yield "\n[进程已被终止]\n"
-                break
-            
-            try:
-                # 使用 wait_for 来允许检查进程状态
-                line = await asyncio.wait_for(process.stdout.readline(), timeout=0.1)
-                if not line:
-                    if process.returncode is not None:
-                        break
-                    continue
-                yield line.decode('utf-8', errors='replace')
-            except asyncio.TimeoutError:
-                # 超时继续循环，允许检查进程状态
-                continue
-        
-        # 等待进程结束
-        if process.returncode is None:
-            await process.wait()
-        
-        # 返回最终结果标记
-        yield f"\n[执行完成，返回码: {process.returncode}]\n"
-    finally:
-        # 从管理器中注销进程
-        process_manager.unregister(task_id)
-
-
 class RangePayload(BaseModel):
     start_date: str
     end_date: str
     select_text: str = ""
+    incremental: bool = False
+    resume: bool = False  # 日K线抽取：跳过已有检查点的交易日
+    gaps_only: bool = False  # 日K线抽取：只补条目数不足的交易日
+    workers: Optional[int] = None  # 选股：按股票分片并行的进程数，默认取SELECT_SHARD_WORKERS
+    formula_name: Optional[str] = None  # 选股：select_formulas表中的公式名称，默认使用内置公式
 
 
 @app.post("/api/tasks/select_stock")
-def task_select_stock(payload: RangePayload):
+async def task_select_stock(payload: RangePayload):
     start_date = convert_to_yyyymmdd(payload.start_date)
     end_date = convert_to_yyyymmdd(payload.end_date)
     select_text = payload.select_text or ""
@@ -826,37 +1090,117 @@ def task_select_stock(payload: RangePayload):
     print(f"原始开始日期: {payload.start_date}")
     print(f"原始结束日期: {payload.end_date}")
     print(f"选股说明: {select_text}")
+    print(f"增量模式: {payload.incremental}")
+    print(f"分片进程数: {payload.workers or '默认'}")
+    print(f"选股公式: {payload.formula_name or '内置默认公式'}")
     print(f"转换后开始日期: {start_date}")
     print(f"转换后结束日期: {end_date}")
     print("="*50)
     
-    out = run_script(os.path.join("utils", "tushare_select_stock.py"), [start_date, end_date, select_text])
-    
-    print("="*50)
-    print("执行选股结果")
-    print(f"执行成功: {out.get('ok', False)}")
-    print(f"返回码: {out.get('code', 'N/A')}")
-    print(f"标准输出:")
-    print(out.get("stdout", ""))
-    print(f"标准错误:")
-    print(out.get("stderr", ""))
-    print("="*50)
-    
-    if out["ok"]:
-        stocks_selected = 0
-        stdout = out.get("stdout", "")
-        import re
-        match = re.search(r"共筛选出\s+(\d+)\s+条符合条件的股票记录", stdout)
-        if match:
-            stocks_selected = int(match.group(1))
-        return {
-            "ok": True, 
-            "stocks_selected": stocks_selected, 
-            "stdout": stdout, 
-            "stderr": out.get("stderr", ""),
-            "code": out.get("code", 0)
-        }
-    return out
+    try:
+        job_id, created = await job_scheduler.enqueue("select_stock", {
+            "start_date": start_date,
+            "end_date": end_date,
+            "select_text": select_text,
+            "incremental": payload.incremental,
+            "workers": payload.workers,
+            "formula_name": payload.formula_name
+        })
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    return {"ok": True, "job_id": job_id, "status": "PENDING", "deduplicated": not created}
+
+
+@app.get("/api/tasks/select_stock/{job_id}")
+async def task_select_stock_status(job_id: str):
+    """查询选股任务状态；完成后返回结构化的命中条数与写入行数"""
+    job = await asyncio.to_thread(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    result = job["result"] or {}
+    return {
+        "ok": True,
+        **job,
+        "error": result.get("error"),
+        "stocks_selected": result.get("stocks_selected", 0)
+    }
+
+
+# ========== 选股公式 ==========
+class FormulaPayload(BaseModel):
+    formula_name: str
+    formula_text: str
+    params: Optional[Dict[str, float]] = None
+    description: str = ""
+
+
+class FormulaRunPayload(BaseModel):
+    start_date: str
+    end_date: str
+    formula_names: list[str]
+    d1: int = 0
+    limit: int = 200  # 每个公式返回的命中记录条数上限
+
+
+@app.get("/api/formulas")
+def get_formulas(dep=Depends(require_auth)):
+    """获取已保存的选股公式列表"""
+    try:
+        return {"items": list_formulas()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/formulas/{formula_name}")
+def get_formula_detail(formula_name: str, dep=Depends(require_auth)):
+    """获取单个选股公式"""
+    try:
+        formula = get_formula(formula_name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if formula is None:
+        raise HTTPException(status_code=404, detail="选股公式不存在")
+    return formula
+
+
+@app.post("/api/formulas")
+def upsert_formula(payload: FormulaPayload, dep=Depends(require_auth)):
+    """新增或覆盖选股公式（保存前编译校验）"""
+    try:
+        formula = save_formula(payload.formula_name, payload.formula_text, payload.params, payload.description)
+        return {"success": True, "formula": formula}
+    except FormulaError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.delete("/api/formulas/{formula_name}")
+def remove_formula(formula_name: str, dep=Depends(require_auth)):
+    """删除选股公式"""
+    try:
+        deleted = delete_formula(formula_name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail="选股公式不存在")
+    return {"success": True, "formula_name": formula_name}
+
+
+@app.post("/api/formulas/run")
+async def run_formulas(payload: FormulaRunPayload, dep=Depends(require_auth)):
+    """在同一次数据读取中运行多个已保存的公式，返回各公式的命中条数与命中记录（不写入stock_selected）"""
+    if not payload.formula_names:
+        raise HTTPException(status_code=400, detail="请至少选择一个选股公式")
+    start_date = convert_to_yyyymmdd(payload.start_date)
+    end_date = convert_to_yyyymmdd(payload.end_date)
+    try:
+        future = submit_formulas_job(start_date, end_date, payload.formula_names, payload.d1, payload.limit)
+        return await asyncio.wrap_future(future)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/api/tasks/update_daily")
@@ -870,23 +1214,17 @@ async def task_update_daily(request: Request, payload: RangePayload, dep=Depends
     print(f"原始结束日期: {payload.end_date}")
     print(f"转换后开始日期: {start_date}")
     print(f"转换后结束日期: {end_date}")
+    print(f"断点续传: {payload.resume}, 只补缺口: {payload.gaps_only}")
     print("="*50)
     
-    # 生成唯一任务ID
-    import uuid
-    task_id = f"daily_update_{uuid.uuid4().hex[:8]}"
-    
-    # 使用流式输出
-    return StreamingResponse(
-        run_script_streaming(task_id, os.path.join("utils", "tushare_update_daily.py"), [start_date, end_date], task_type="daily_update"),
-        media_type="text/plain",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",
-            "Connection": "keep-alive",
-            "X-Task-ID": task_id,
-        }
-    )
+    # 任务入队（相同日期区间的抽取已在排队或执行中时直接复用），流式输出执行日志
+    params = {"start_date": start_date, "end_date": end_date}
+    if payload.gaps_only:
+        params["gaps_only"] = True
+    elif payload.resume:
+        params["resume"] = True
+    job_id, _ = await job_scheduler.enqueue("daily_update", params)
+    return streaming_job_response(job_id)
 
 
 @app.post("/api/tasks/update_names")
@@ -895,21 +1233,9 @@ async def task_update_names(request: Request, dep=Depends(require_auth)):
     print("执行股票名称抽取请求(流式)")
     print("="*50)
     
-    # 生成唯一任务ID
-    import uuid
-    task_id = f"names_update_{uuid.uuid4().hex[:8]}"
-    
-    # 使用流式输出
-    return StreamingResponse(
-        run_script_streaming(task_id, os.path.join("utils", "baostock_update_names.py"), [], task_type="names_update"),
-        media_type="text/plain",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",
-            "Connection": "keep-alive",
-            "X-Task-ID": task_id,
-        }
-    )
+    # 任务入队（已在排队或执行中时直接复用），流式输出执行日志
+    job_id, _ = await job_scheduler.enqueue("names_update", {})
+    return streaming_job_response(job_id)
 
 
 # ========== 选股池管理 ==========
@@ -943,6 +1269,8 @@ def manage_delete(execute_id: Optional[str] = None, execute_date: Optional[str]
             log_task_execution("删除", "SUCCESS", f"删除 {execute_date} {execute_time} 的选股数据，共 {count} 条")
         else:
             return {"deleted": 0, "error": "缺少参数"}
+        bump_data_version(conn, STOCK_SELECTED)
+    invalidate_selection_caches()
     return {"deleted": count}
 
 
@@ -1096,20 +1424,18 @@ def delete_user(username: str, dep=Depends(require_auth)):
 
 # ========== 日志管理 ==========
 @app.get("/api/logs/filters")
-def get_log_filters(dep=Depends(require_auth)):
+async def get_log_filters(dep=Depends(require_auth), session: AsyncSession = Depends(get_async_session)):
     """获取日志筛选条件的选项"""
-    engine = get_db_engine()
     try:
-        with engine.connect() as conn:
-            # 获取任务类别
-            task_names = conn.execute(text("SELECT DISTINCT task_name FROM task_logs ORDER BY task_name")).fetchall()
-            
-            # 获取日期范围
-            dates = conn.execute(text("SELECT DISTINCT DATE(execute_time) as dt FROM task_logs ORDER BY dt DESC")).fetchall()
-            
-            # 获取状态
-            statuses = conn.execute(text("SELECT DISTINCT status FROM task_logs ORDER BY status")).fetchall()
-            
+        # 获取任务类别
+        task_names = (await session.execute(text("SELECT DISTINCT task_name FROM task_logs ORDER BY task_name"))).fetchall()
+        
+        # 获取日期范围
+        dates = (await session.execute(text("SELECT DISTINCT DATE(execute_time) as dt FROM task_logs ORDER BY dt DESC"))).fetchall()
+        
+        # 获取状态
+        statuses = (await session.execute(text("SELECT DISTINCT status FROM task_logs ORDER BY status"))).fetchall()
+        
         return {
             "task_names": [row[0] for row in task_names],
             "dates": [str(row[0]) for row in dates],
@@ -1120,16 +1446,16 @@ def get_log_filters(dep=Depends(require_auth)):
 
 
 @app.get("/api/logs/list")
-def get_logs_list(
+async def get_logs_list(
     task_name: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     status: Optional[str] = None,
     limit: int = 100,
-    dep=Depends(require_auth)
+    dep=Depends(require_auth),
+    session: AsyncSession = Depends(get_async_session),
 ):
     """获取日志列表，支持筛选"""
-    engine = get_db_engine()
     try:
         where_conditions = []
         params = {}
@@ -1161,16 +1487,15 @@ def get_logs_list(
         """)
         params["limit"] = limit
         
-        with engine.connect() as conn:
-            rows = conn.execute(query, params).fetchall()
-            items = []
-            for row in rows:
-                items.append({
-                    "task_name": row[0],
-                    "execute_time": str(row[1]) if row[1] else None,
-                    "status": row[2],
-                    "message": row[3]
-                })
+        rows = (await session.execute(query, params)).fetchall()
+        items = []
+        for row in rows:
+            items.append({
+                "task_name": row[0],
+                "execute_time": str(row[1]) if row[1] else None,
+                "status": row[2],
+                "message": row[3]
+            })
         return {"items": items}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1227,15 +1552,14 @@ class ToggleStockPayload(BaseModel):
 
 
 @app.post("/api/stock/toggle_favorite")
-def toggle_favorite(payload: ToggleStockPayload, dep=Depends(require_auth)):
-    engine = get_db_engine()
+async def toggle_favorite(payload: ToggleStockPayload, dep=Depends(require_auth), session: AsyncSession = Depends(get_async_session)):
     try:
-        with engine.begin() as conn:
+        async with session.begin():
             # 先查询当前状态
-            result = conn.execute(
+            result = (await session.execute(
                 text("SELECT is_favorite FROM stock_selected WHERE ts_code = :ts_code AND execute_id = :execute_id"),
                 {"ts_code": payload.ts_code, "execute_id": payload.execute_id}
-            ).fetchone()
+            )).fetchone()
             
             if result:
                 current_is_favorite = result[0] or 0
@@ -1243,13 +1567,13 @@ def toggle_favorite(payload: ToggleStockPayload, dep=Depends(require_auth)):
                 
                 if new_is_favorite == 1:
                     # 添加自选
-                    conn.execute(
+                    await session.execute(
                         text("UPDATE stock_selected SET is_favorite = 1, favorite_added_at = NOW() WHERE ts_code = :ts_code AND execute_id = :execute_id"),
                         {"ts_code": payload.ts_code, "execute_id": payload.execute_id}
                     )
                 else:
                     # 删除自选
-                    conn.execute(
+                    await session.execute(
                         text("UPDATE stock_selected SET is_favorite = 0, favorite_added_at = NULL WHERE ts_code = :ts_code AND execute_id = :execute_id"),
                         {"ts_code": payload.ts_code, "execute_id": payload.execute_id}
                     )
@@ -1264,15 +1588,14 @@ def toggle_favorite(payload: ToggleStockPayload, dep=Depends(require_auth)):
 
 
 @app.post("/api/stock/toggle_observation")
-def toggle_observation(payload: ToggleStockPayload, dep=Depends(require_auth)):
-    engine = get_db_engine()
+async def toggle_observation(payload: ToggleStockPayload, dep=Depends(require_auth), session: AsyncSession = Depends(get_async_session)):
     try:
-        with engine.begin() as conn:
+        async with session.begin():
             # 先查询当前状态
-            result = conn.execute(
+            result = (await session.execute(
                 text("SELECT is_observation FROM stock_selected WHERE ts_code = :ts_code AND execute_id = :execute_id"),
                 {"ts_code": payload.ts_code, "execute_id": payload.execute_id}
-            ).fetchone()
+            )).fetchone()
             
             if result:
                 current_is_observation = result[0] or 0
@@ -1280,13 +1603,13 @@ def toggle_observation(payload: ToggleStockPayload, dep=Depends(require_auth)):
                 
                 if new_is_observation == 1:
                     # 添加观察
-                    conn.execute(
+                    await session.execute(
                         text("UPDATE stock_selected SET is_observation = 1, observation_added_at = NOW() WHERE ts_code = :ts_code AND execute_id = :execute_id"),
                         {"ts_code": payload.ts_code, "execute_id": payload.execute_id}
                     )
                 else:
                     # 删除观察
-                    conn.execute(
+                    await session.execute(
                         text("UPDATE stock_selected SET is_observation = 0, observation_added_at = NULL WHERE ts_code = :ts_code AND execute_id = :execute_id"),
                         {"ts_code": payload.ts_code, "execute_id": payload.execute_id}
                     )
@@ -1301,72 +1624,68 @@ def toggle_observation(payload: ToggleStockPayload, dep=Depends(require_auth)):
 
 
 @app.get("/api/stock/favorite_list")
-def list_favorites(page: int = 1, page_size: int = 50, dep=Depends(require_auth)):
-    engine = get_db_engine()
+async def list_favorites(page: int = 1, page_size: int = 50, dep=Depends(require_auth), session: AsyncSession = Depends(get_async_session)):
     try:
         offset = (max(page, 1) - 1) * max(page_size, 1)
-        with engine.connect() as conn:
-            total = conn.execute(text("SELECT COUNT(*) FROM stock_selected WHERE is_favorite = 1")).scalar()
-            rows = conn.execute(
-                text("""
-                    SELECT 
-                        t1.buy_date, t1.gold_date, t1.execute_id, 
-                        t1.ts_code, t2.ts_code_name as stock_name,
-                        t1.trade_date, t1.price_open, t1.price_close, t1.price_high, t1.price_low,
-                        t1.vol, t1.amount,
-                        t1.is_favorite, t1.favorite_added_at,
-                        t1.is_observation, t1.observation_added_at
-                    FROM stock_selected t1
-                    LEFT JOIN stock_name t2 ON t1.ts_code = t2.ts_code
-                    WHERE t1.is_favorite = 1
-                    ORDER BY t1.favorite_added_at DESC
-                    LIMIT :limit OFFSET :offset
-                """),
-                {"limit": page_size, "offset": offset}
-            ).mappings().all()
-            items = []
-            for row in rows:
-                item = dict(row)
-                item["buy_date"] = format_date_str(item["buy_date"])
-                item["gold_date"] = format_date_str(item["gold_date"])
-                item["execute_id"] = str(item["execute_id"]) if item["execute_id"] else ""
-                items.append(item)
+        total = (await session.execute(text("SELECT COUNT(*) FROM stock_selected WHERE is_favorite = 1"))).scalar()
+        rows = (await session.execute(
+            text("""
+                SELECT 
+                    t1.buy_date, t1.gold_date, t1.execute_id, 
+                    t1.ts_code, t2.ts_code_name as stock_name,
+                    t1.trade_date, t1.price_open, t1.price_close, t1.price_high, t1.price_low,
+                    t1.vol, t1.amount,
+                    t1.is_favorite, t1.favorite_added_at,
+                    t1.is_observation, t1.observation_added_at
+                FROM stock_selected t1
+                LEFT JOIN stock_name t2 ON t1.ts_code = t2.ts_code
+                WHERE t1.is_favorite = 1
+                ORDER BY t1.favorite_added_at DESC
+                LIMIT :limit OFFSET :offset
+            """),
+            {"limit": page_size, "offset": offset}
+        )).mappings().all()
+        items = []
+        for row in rows:
+            item = dict(row)
+            item["buy_date"] = format_date_str(item["buy_date"])
+            item["gold_date"] = format_date_str(item["gold_date"])
+            item["execute_id"] = str(item["execute_id"]) if item["execute_id"] else ""
+            items.append(item)
         return {"total": total, "items": items}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/stock/observation_list")
-def list_observations(page: int = 1, page_size: int = 50, dep=Depends(require_auth)):
-    engine = get_db_engine()
+async def list_observations(page: int = 1, page_size: int = 50, dep=Depends(require_auth), session: AsyncSession = Depends(get_async_session)):
     try:
         offset = (max(page, 1) - 1) * max(page_size, 1)
-        with engine.connect() as conn:
-            total = conn.execute(text("SELECT COUNT(*) FROM stock_selected WHERE is_observation = 1")).scalar()
-            rows = conn.execute(
-                text("""
-                    SELECT 
-                        t1.buy_date, t1.gold_date, t1.execute_id, 
-                        t1.ts_code, t2.ts_code_name as stock_name,
-                        t1.trade_date, t1.price_open, t1.price_close, t1.price_high, t1.price_low,
-                        t1.vol, t1.amount,
-                        t1.is_favorite, t1.favorite_added_at,
-                        t1.is_observation, t1.observation_added_at
-                    FROM stock_selected t1
-                    LEFT JOIN stock_name t2 ON t1.ts_code = t2.ts_code
-                    WHERE t1.is_observation = 1
-                    ORDER BY t1.observation_added_at DESC
-                    LIMIT :limit OFFSET :offset
-                """),
-                {"limit": page_size, "offset": offset}
-            ).mappings().all()
-            items = []
-            for row in rows:
-                item = dict(row)
-                item["buy_date"] = format_date_str(item["buy_date"])
-                item["gold_date"] = format_date_str(item["gold_date"])
-                item["execute_id"] = str(item["execute_id"]) if item["execute_id"] else ""
-                items.append(item)
+        total = (await session.execute(text("SELECT COUNT(*) FROM stock_selected WHERE is_observation = 1"))).scalar()
+        rows = (await session.execute(
+            text("""
+                SELECT 
+                    t1.buy_date, t1.gold_date, t1.execute_id, 
+                    t1.ts_code, t2.ts_code_name as stock_name,
+                    t1.trade_date, t1.price_open, t1.price_close, t1.price_high, t1.price_low,
+                    t1.vol, t1.amount,
+                    t1.is_favorite, t1.favorite_added_at,
+                    t1.is_observation, t1.observation_added_at
+                FROM stock_selected t1
+                LEFT JOIN stock_name t2 ON t1.ts_code = t2.ts_code
+                WHERE t1.is_observation = 1
+                ORDER BY t1.observation_added_at DESC
+                LIMIT :limit OFFSET :offset
+            """),
+            {"limit": page_size, "offset": offset}
+        )).mappings().all()
+        items = []
+        for row in rows:
+            item = dict(row)
+            item["buy_date"] = format_date_str(item["buy_date"])
+            item["gold_date"] = format_date_str(item["gold_date"])
+            item["execute_id"] = str(item["execute_id"]) if item["execute_id"] else ""
+            items.append(item)
         return {"total": total, "items": items}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+选股回测性能基准：矩阵化回测（compute_forward_metrics）与逐条记录计算（模拟每条记录单独查询）对比
+
+用法：
+    python benchmark_backtest.py                       # 默认3000只股票 x 300个交易日，5000条选股记录
+    python benchmark_backtest.py --picks 20000 --check 500
+
+合成数据无需数据库连接；逐条实现只计算前--check条记录，并与矩阵化结果逐条核对。
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from utils.backtest import DEFAULT_HORIZONS, compute_forward_metrics, summarize_metrics
+
+
+def make_synthetic_prices(tickers=3000, days=300, seed=7):
+    """生成随机游走日线（约2%的bar缺失，模拟停牌）"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2024-01-02', periods=days)
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, size=(tickers, days)), axis=1))
+    prices = pd.DataFrame({
+        'ts_code': np.repeat([f"{i:06d}.SZ" for i in range(tickers)], days),
+        'trade_date': np.tile(dates.values, tickers),
+        'price_open': (close * (1 + rng.normal(0, 0.005, size=close.shape))).ravel(),
+        'price_close': close.ravel(),
+    })
+    return prices[rng.random(len(prices)) > 0.02].reset_index(drop=True)
+
+
+def make_picks(prices, count, seed=11):
+    rng = np.random.default_rng(seed)
+    codes = prices['ts_code'].unique()
+    dates = pd.DatetimeIndex(prices['trade_date'].unique()).sort_values()
+    return pd.DataFrame({
+        'execute_id': [f"batch-{i % 20:02d}" for i in range(count)],
+        'ts_code': rng.choice(codes, count),
+        # 含周末日期，验证非交易日顺延
+        'buy_date': dates[rng.integers(0, len(dates), count)] + pd.to_timedelta(rng.integers(0, 2, count), unit='D'),
+    })
+
+
+def per_pick_reference(pick, prices_by_code, horizons):
+    """逐条实现：取该股票买入日之后的日线，逐个持有期计算收益与回撤"""
+    rows = prices_by_code[pick.ts_code]
+    rows = rows[rows['trade_date'] >= pick.buy_date]
+    all_dates = prices_by_code['__dates__']
+    all_dates = all_dates[all_dates >= pick.buy_date]
+    if rows.empty or rows['trade_date'].iloc[0] != all_dates[0]:
+        return {n: (np.nan, np.nan) for n in horizons}
+    entry_price = rows['price_open'].iloc[0]
+    closes = rows.set_index('trade_date')['price_close'].reindex(all_dates).ffill()
+    result = {}
+    for n in horizons:
+        if n >= len(closes):
+            result[n] = (np.nan, np.nan)
+            continue
+        path = closes.iloc[:n + 1].to_numpy() / entry_price
+        peak = np.maximum.accumulate(np.maximum(path, 1.0))
+        result[n] = (path[n] - 1, min((path / peak - 1).min(), 0.0))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='选股回测性能基准')
+    parser.add_argument('--tickers', type=int, default=3000)
+    parser.add_argument('--days', type=int, default=300)
+    parser.add_argument('--picks', type=int, default=5000)
+    parser.add_argument('--check', type=int, default=300, help='逐条实现计算并核对的记录数')
+    args = parser.parse_args()
+
+    prices = make_synthetic_prices(args.tickers, args.days)
+    picks = make_picks(prices, args.picks)
+    print(f"合成数据: {len(prices):,} 条日线，{len(picks):,} 条选股记录")
+
+    t0 = time.perf_counter()
+    metrics = compute_forward_metrics(picks, prices, DEFAULT_HORIZONS)
+    summary = summarize_metrics(metrics, DEFAULT_HORIZONS)
+    t_vec = time.perf_counter() - t0
+    print(f"矩阵化回测: {t_vec:.3f}s（{len(summary)} 个批次）")
+
+    prices_by_code = dict(tuple(prices.groupby('ts_code')))
+    prices_by_code['__dates__'] = pd.DatetimeIndex(prices['trade_date'].unique()).sort_values()
+    t0 = time.perf_counter()
+    for pick in picks.head(args.check).itertuples(index=False):
+        expected = per_pick_reference(pick, prices_by_code, DEFAULT_HORIZONS)
+        got = metrics.iloc[picks.index[picks['ts_code'].eq(pick.ts_code) & picks['buy_date'].eq(pick.buy_date)][0]]
+        for n, (ret, mdd) in expected.items():
+            assert np.allclose([got[f'ret_{n}'], got[f'mdd_{n}']], [ret, mdd], equal_nan=True), (pick, n)
+    t_ref = time.perf_counter() - t0
+    per_pick = t_ref / max(min(args.check, len(picks)), 1)
+    print(f"逐条计算: {t_ref:.3f}s / {args.check} 条（折算全部 {per_pick * len(picks):.1f}s），结果逐条一致")
+
+
+if __name__ == '__main__':
+    main()
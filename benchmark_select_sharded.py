@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+分片并行选股扩展性基准：同一份合成数据分别以1/2/4/8个进程执行select_stocks_sharded
+
+用法：
+    python benchmark_select_sharded.py                       # 默认2000只股票 x 500个交易日
+    python benchmark_select_sharded.py --tickers 5000 --days 1000 --workers 1,2,4,8
+
+合成数据写入临时目录下的Parquet缓存（DAILY_CACHE_VERIFY=0，无需数据库连接）；
+各进程数的结果会与单进程结果逐行核对。加速比受限于机器的CPU核数。
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# 缓存目录与校验开关须在导入选股模块之前设置；spawn启动的工作进程会重新执行本段，
+# 此时环境变量已从父进程继承，须沿用父进程的临时目录
+if 'SELECT_SHARDED_BENCH_DIR' not in os.environ:
+    os.environ['SELECT_SHARDED_BENCH_DIR'] = tempfile.mkdtemp(prefix='select_sharded_')
+os.environ['DAILY_CACHE_DIR'] = os.environ['SELECT_SHARDED_BENCH_DIR']
+os.environ['DAILY_CACHE_VERIFY'] = '0'
+os.environ['DAILY_CACHE_ENABLED'] = '1'
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'utils'))
+import daily_cache
+from benchmark_select_stock import make_synthetic_daily
+from tushare_select_stock import select_stocks_sharded
+
+
+def build_cache(tickers, days):
+    """生成合成日线数据并按月写入缓存分区，返回 (起始日, 结束日, 行数)"""
+    df = make_synthetic_daily(tickers, days)
+    df['vol'] = df['vol'].round().astype('int64')
+    df = df[daily_cache.CACHE_COLUMNS]
+    for year_month, df_month in df.groupby(df['trade_date'].dt.strftime('%Y-%m')):
+        daily_cache._write_partition(year_month, df_month)
+    return df['trade_date'].min().strftime('%Y%m%d'), df['trade_date'].max().strftime('%Y%m%d'), len(df)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分片并行选股扩展性基准')
+    parser.add_argument('--tickers', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=500)
+    parser.add_argument('--workers', default='1,2,4,8', help='逗号分隔的进程数列表')
+    parser.add_argument('--chunk-rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    start_date, end_date, rows = build_cache(args.tickers, args.days)
+    print(f"合成数据: {rows:,} 行 ({args.tickers} 只股票 x {args.days} 个交易日)，CPU核数 {os.cpu_count()}")
+
+    baseline = None
+    for workers in [int(w) for w in args.workers.split(',')]:
+        # 先预热一次（读缓存文件进入系统页缓存）；每次选股都会新建并关闭进程池，计时包含进程启动开销
+        select_stocks_sharded(start_date, end_date, workers=workers, chunk_rows=args.chunk_rows)
+        t0 = time.perf_counter()
+        result = select_stocks_sharded(start_date, end_date, workers=workers, chunk_rows=args.chunk_rows)
+        elapsed = time.perf_counter() - t0
+        if baseline is None:
+            baseline = (result, elapsed)
+        else:
+            pd.testing.assert_frame_equal(result, baseline[0])
+        print(f"{workers} 进程: {elapsed:8.2f}s, 命中 {len(result):,} 条, 加速比 {baseline[1] / elapsed:.2f}x", flush=True)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    finally:
+        shutil.rmtree(os.environ['SELECT_SHARDED_BENCH_DIR'], ignore_errors=True)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+日线写库性能基准：对比原写入路径（iterrows + 逐批SELECT COUNT探测 + executemany）
+与临时表合并路径（按列构造参数 + 多行VALUES + UPDATE JOIN / INSERT ... WHERE NOT EXISTS）
+
+用法：
+    python benchmark_write_daily.py                        # 模拟MySQL（内存存储 + 每次往返固定延迟）
+    python benchmark_write_daily.py --rtt-ms 20 --days 5   # 模拟跨地域访问TiDB Cloud
+    python benchmark_write_daily.py --dsn mysql+pymysql://root@127.0.0.1:4000/test
+                                                           # 使用本地MySQL/TiDB（会在该库创建并清空cn_stock_daily）
+
+每个交易日先写一遍（全部新增）再写一遍（全部更新），两种实现的新增/更新统计会逐日核对。
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# 合成数据不写入本地Parquet缓存
+os.environ['DAILY_CACHE_ENABLED'] = '0'
+import utils.tushare_update_daily as daily
+
+
+# ===================== 原写入路径（对照组） =====================
+def write_with_probe(df_data):
+    """原实现：iterrows构造元组，每1000条先SELECT COUNT(*)探测已存在主键，再executemany"""
+    today = pd.Timestamp.now().strftime('%Y%m%d')
+    insert_sql = """
+    INSERT INTO cn_stock_daily (
+        ts_code, trade_date, price_open, price_high, price_low, price_close,
+        price_pre_close, amt_chg, pct_chg, vol, amount, update_date
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        price_open = VALUES(price_open), price_high = VALUES(price_high), price_low = VALUES(price_low),
+        price_close = VALUES(price_close), price_pre_close = VALUES(price_pre_close), amt_chg = VALUES(amt_chg),
+        pct_chg = VALUES(pct_chg), vol = VALUES(vol), amount = VALUES(amount), update_date = VALUES(update_date)
+    """
+    cols_to_clean = ['open', 'high', 'low', 'close', 'pre_close', 'change', 'pct_chg', 'vol', 'amount']
+    df_data[cols_to_clean] = df_data[cols_to_clean].fillna(0)
+    conn = daily.get_db_engine().raw_connection()
+    cursor = conn.cursor()
+    update_count = 0
+    try:
+        data_tuples = [
+            (row['ts_code'], row['trade_date'], row['open'], row['high'], row['low'], row['close'],
+             row['pre_close'], row['change'], row['pct_chg'], row['vol'], row['amount'], today)
+            for _, row in df_data.iterrows()
+        ]
+        for i in range(0, len(data_tuples), 1000):
+            batch = data_tuples[i:i + 1000]
+            placeholders = ', '.join(['(%s, %s)'] * len(batch))
+            cursor.execute(f"SELECT COUNT(*) FROM cn_stock_daily WHERE (ts_code, trade_date) IN ({placeholders})",
+                           [k for item in batch for k in item[:2]])
+            update_count += cursor.fetchone()[0]
+            cursor.executemany(insert_sql, batch)
+        conn.commit()
+        return len(df_data), update_count
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# ===================== 模拟MySQL =====================
+class FakeCursor:
+    """
+    按语句类型模拟两种写入路径用到的SQL语义，每次execute/executemany计一次网络往返
+    （pymysql的executemany会把INSERT ... VALUES改写为多行语句一次发送，因此同样只计一次）
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.rowcount = 0
+        self._result = None
+
+    def _round_trip(self, rows):
+        self.server.round_trips += 1
+        time.sleep(self.server.rtt + rows * self.server.row_cost)
+
+    def execute(self, sql, params=None):
+        sql = ' '.join(sql.split())
+        store, staging = self.server.store, self.server.staging
+        params = params or []
+        if sql.startswith('SELECT COUNT(*)'):
+            keys = list(zip(params[0::2], params[1::2]))
+            self._result = (sum(1 for k in keys if k in store),)
+            self._round_trip(len(keys))
+        elif sql.startswith('SELECT GET_LOCK') or sql.startswith('SELECT RELEASE_LOCK'):
+            self._result = (1,)
+            self._round_trip(0)
+        elif sql.startswith('SHOW WARNINGS'):
+            self._result = None
+            self._round_trip(0)
+        elif sql.startswith('CREATE TEMPORARY TABLE'):
+            self._round_trip(0)
+        elif sql.startswith('DELETE FROM'):
+            staging.clear()
+            self._round_trip(0)
+        elif sql.startswith(f'INSERT INTO {daily.STAGING_TABLE}'):
+            width = len(daily.DB_COLUMNS)
+            for i in range(0, len(params), width):
+                row = tuple(params[i:i + width])
+                staging[row[:2]] = row
+            self.rowcount = len(params) // width
+            self._round_trip(self.rowcount)
+        elif sql.startswith('UPDATE cn_stock_daily'):
+            matched = [k for k in staging if k in store]
+            for k in matched:
+                store[k] = staging[k]
+            self.rowcount = len(matched)
+            self._round_trip(len(staging))
+        elif sql.startswith('INSERT INTO cn_stock_daily'):
+            new_keys = [k for k in staging if k not in store]
+            for k in new_keys:
+                store[k] = staging[k]
+            self.rowcount = len(new_keys)
+            self._round_trip(len(staging))
+        elif sql.startswith('INSERT INTO daily_row_counts'):
+            trade_date, total, _, inserted = params
+            counts = self.server.row_counts
+            counts[trade_date] = counts[trade_date] + inserted if trade_date in counts else total
+            self._round_trip(1)
+        elif sql.startswith('INSERT INTO tushare_day_counts'):
+            self.server.source_counts[params[0]] = params[1]
+            self._round_trip(1)
+        elif sql.startswith('INSERT INTO ingest_checkpoints'):
+            self.server.checkpoints[params[0]] = params[1:]
+            self._round_trip(1)
+        else:
+            raise ValueError(f"未模拟的SQL: {sql[:60]}")
+
+    def executemany(self, sql, rows):
+        for row in rows:
+            self.server.store[tuple(row[:2])] = tuple(row)
+        self.rowcount = len(rows)
+        self._round_trip(len(rows))
+
+    def fetchone(self):
+        return self._result
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class FakeServer:
+    def __init__(self, rtt_ms, row_us):
+        self.rtt = rtt_ms / 1000.0
+        self.row_cost = row_us / 1e6
+        self.store = {}
+        self.staging = {}
+        self.checkpoints = {}
+        self.row_counts = {}
+        self.source_counts = {}
+        self.round_trips = 0
+
+    def raw_connection(self):
+        return self
+
+    # 连接对象接口
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.round_trips += 1
+        time.sleep(self.rtt)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def make_day(trade_date, tickers, seed):
+    """生成与Tushare pro.daily返回结构一致的单日数据"""
+    rng = np.random.default_rng(seed)
+    close = rng.uniform(3, 100, tickers).round(2)
+    return pd.DataFrame({
+        'ts_code': [f"{i:06d}.SZ" for i in range(tickers)],
+        'trade_date': trade_date,
+        'open': close, 'high': close * 1.02, 'low': close * 0.98, 'close': close,
+        'pre_close': close, 'change': 0.0, 'pct_chg': np.where(rng.random(tickers) < 0.01, np.nan, 0.0),
+        'vol': rng.integers(1000, 10 ** 6, tickers).astype(float), 'amount': close * 1000,
+    })
+
+
+def run(label, write_func, days, tickers, server=None):
+    started = time.perf_counter()
+    round_trips = server.round_trips if server else 0
+    counts = []
+    for d in range(days):
+        trade_date = (pd.Timestamp('2024-01-02') + pd.Timedelta(days=d)).strftime('%Y%m%d')
+        for _ in range(2):  # 第一遍全部新增，第二遍全部更新
+            counts.append(write_func(make_day(trade_date, tickers, d)))
+    elapsed = time.perf_counter() - started
+    trips = f"，往返 {server.round_trips - round_trips} 次" if server else ""
+    print(f"{label:<10} {days}天 x {tickers}只 x 2遍：{elapsed:.2f} 秒{trips}", flush=True)
+    return counts, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='日线写库性能基准')
+    parser.add_argument('--days', type=int, default=10)
+    parser.add_argument('--tickers', type=int, default=5000)
+    parser.add_argument('--rtt-ms', type=float, default=5.0, help='模拟的单次网络往返延迟（毫秒）')
+    parser.add_argument('--row-us', type=float, default=2.0, help='模拟的服务端单行处理耗时（微秒）')
+    parser.add_argument('--dsn', help='使用真实的MySQL兼容数据库（SQLAlchemy URL）代替模拟')
+    args = parser.parse_args()
+
+    results = {}
+    for label, func in (('原实现', write_with_probe), ('临时表合并', daily.write_to_mysql_with_update)):
+        if args.dsn:
+            from sqlalchemy import create_engine, text
+            engine = create_engine(args.dsn)
+            with engine.begin() as conn:
+                conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS cn_stock_daily (
+                    ts_code VARCHAR(20) NOT NULL, trade_date VARCHAR(8) NOT NULL,
+                    price_open FLOAT, price_high FLOAT, price_low FLOAT, price_close FLOAT,
+                    price_pre_close FLOAT, amt_chg FLOAT, pct_chg FLOAT, vol BIGINT, amount FLOAT,
+                    update_date VARCHAR(8) NOT NULL, PRIMARY KEY (ts_code, trade_date)
+                )"""))
+                conn.execute(text("DELETE FROM cn_stock_daily"))
+                conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS daily_row_counts (
+                    trade_date VARCHAR(8) PRIMARY KEY, row_count INT NOT NULL, updated_at DATETIME NOT NULL
+                )"""))
+                conn.execute(text("DELETE FROM daily_row_counts"))
+                conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS tushare_day_counts (
+                    trade_date VARCHAR(8) PRIMARY KEY, row_count INT NOT NULL, fetched_at DATETIME NOT NULL
+                )"""))
+            daily.get_db_engine = lambda: engine
+            daily.ensure_checkpoint_table()
+            results[label] = run(label, func, args.days, args.tickers)
+        else:
+            server = FakeServer(args.rtt_ms, args.row_us)
+            daily.get_db_engine = lambda: server
+            results[label] = run(label, func, args.days, args.tickers, server)
+            if func is daily.write_to_mysql_with_update:
+                # 同一天写两遍，按交易日汇总的条目数仍等于当日股票数
+                assert set(server.row_counts.values()) == {args.tickers}, "daily_row_counts汇总不正确"
+
+    (old_counts, old_time), (new_counts, new_time) = results.values()
+    assert old_counts == new_counts, "两种实现的新增/更新统计不一致"
+    print(f"统计一致（每日首遍更新 0 条、次遍更新 {args.tickers} 条），提速 {old_time / new_time:.1f} 倍")
+
+
+if __name__ == '__main__':
+    main()
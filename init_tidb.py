@@ -1,7 +1,9 @@
 import os
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine
 from dotenv import load_dotenv
 
+from utils.schema_migrations import run_migrations
+
 # 加载环境变量
 load_dotenv()
 
@@ -27,62 +29,10 @@ def init_db():
     engine = create_engine(db_url, connect_args=connect_args)
 
     try:
-        with engine.connect() as conn:
-            # 1. 创建 stock_name 表
-            print("正在创建 stock_name 表...")
-            conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS stock_name (
-                ts_code VARCHAR(20) PRIMARY KEY COMMENT '股票代码',
-                ts_code_name VARCHAR(50) COMMENT '股票名称'
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-            """))
-
-            # 2. 创建 cn_stock_daily 表
-            print("正在创建 cn_stock_daily 表...")
-            conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS cn_stock_daily (
-                ts_code VARCHAR(20) NOT NULL COMMENT '股票代码',
-                trade_date VARCHAR(8) NOT NULL COMMENT '交易日期(YYYYMMDD)',
-                price_open FLOAT COMMENT '开盘价',
-                price_high FLOAT COMMENT '最高价',
-                price_low FLOAT COMMENT '最低价',
-                price_close FLOAT COMMENT '收盘价',
-                price_pre_close FLOAT COMMENT '前收盘价',
-                amt_chg FLOAT COMMENT '涨跌额',
-                pct_chg FLOAT COMMENT '涨跌幅(%)',
-                vol BIGINT COMMENT '成交量(手)',
-                amount FLOAT COMMENT '成交额(千元)',
-                update_date VARCHAR(8) NOT NULL COMMENT '更新时间',
-                PRIMARY KEY (ts_code, trade_date)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='A股日线数据表';
-            """))
-
-            # 3. 创建 stock_selected 表
-            print("正在创建 stock_selected 表...")
-            conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS stock_selected (
-                execute_date DATE NOT NULL COMMENT '选股执行日期',
-                execute_time TIME NOT NULL COMMENT '选股执行时间',
-                ts_code VARCHAR(20) NOT NULL COMMENT '股票代码',
-                trade_date DATE NOT NULL COMMENT '交易日期',
-                stock_name VARCHAR(50) COMMENT '股票名称',
-                price_open DECIMAL(20, 4),
-                price_high DECIMAL(20, 4),
-                price_low DECIMAL(20, 4),
-                price_close DECIMAL(20, 4),
-                price_pre_close DECIMAL(20, 4),
-                amt_chg DECIMAL(20, 4),
-                pct_chg DECIMAL(20, 4),
-                vol DECIMAL(20, 4),
-                amount DECIMAL(20, 4),
-                buy_date DATE COMMENT '建议买入日期',
-                gold_date DATE COMMENT 'AI观察日',
-                PRIMARY KEY (execute_date, execute_time, ts_code, trade_date)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-            """))
-
-            conn.commit()
-            print("✅ 所有表结构初始化完成！")
+        # 建表与后续的表结构变更统一由版本化迁移执行（utils/schema_migrations.py）
+        applied = run_migrations(engine)
+        print(f"本次执行迁移: {applied or '无'}")
+        print("✅ 所有表结构初始化完成！")
 
     except Exception as e:
         print(f"❌ 初始化失败: {e}")
@@ -42,6 +42,7 @@ export default function SearchPage() {
   const [error, setError] = useState(null);
   const [executeDates, setExecuteDates] = useState([]);
   const [selectedRow, setSelectedRow] = useState(null);
+  const [stockSuggestions, setStockSuggestions] = useState([]);
 
   useEffect(() => {
     if (!session) {
@@ -76,6 +77,31 @@ export default function SearchPage() {
       fetchObservationResults(1);
     }
   }, [session]);
+
+  // 股票代码输入框自动补全（代码前缀 / 拼音首字母 / 名称）
+  useEffect(() => {
+    const keyword = formData.stockCode.trim();
+    if (!session || !keyword) {
+      setStockSuggestions([]);
+      return;
+    }
+    const timer = setTimeout(async () => {
+      try {
+        const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
+        const params = new URLSearchParams({ q: keyword, limit: '10' });
+        const response = await fetch(`${API_URL}/api/stock/suggest?${params.toString()}`, {
+          headers: getAuthHeaders(session)
+        });
+        if (response.ok) {
+          const data = await response.json();
+          setStockSuggestions(data.items || []);
+        }
+      } catch (e) {
+        console.error('Failed to load stock suggestions:', e);
+      }
+    }, 200);
+    return () => clearTimeout(timer);
+  }, [formData.stockCode, session]);
   
   const toggleFavorite = async (item) => {
     try {
@@ -395,9 +421,16 @@ export default function SearchPage() {
                     name="stockCode"
                     value={formData.stockCode}
                     onChange={handleInputChange}
-                    placeholder="例如: 000001.SZ"
+                    list="stockSuggestions"
+                    autoComplete="off"
+                    placeholder="例如: 000001.SZ / 平安 / payh"
                     className="block w-full pl-10 pr-3 py-2.5 border border-slate-200 rounded-xl shadow-sm focus:outline-none focus:ring-2 focus:ring-indigo-500 focus:border-indigo-500 text-sm transition-all duration-200 hover:border-slate-300"
                   />
+                  <datalist id="stockSuggestions">
+                    {stockSuggestions.map((s) => (
+                      <option key={s.ts_code} value={s.ts_code}>{s.name}</option>
+                    ))}
+                  </datalist>
                 </div>
               </div>
 
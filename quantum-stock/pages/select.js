@@ -146,16 +146,37 @@ export default function SelectPage() {
         }),
       });
 
-      const result = await response.json();
+      const submitted = await response.json();
 
-      if (result.ok) {
+      if (!submitted.ok) {
+        throw new Error(submitted.error || '选股执行失败');
+      }
+
+      // 选股在后台进程池中执行，轮询任务状态直到完成
+      const startTime = new Date();
+      let result = null;
+      while (true) {
+        await new Promise(resolve => setTimeout(resolve, 2000));
+        const statusRes = await fetch(`${API_URL}/api/tasks/select_stock/${submitted.job_id}`, {
+          headers: getAuthHeaders(session),
+        });
+        result = await statusRes.json();
+        if (!statusRes.ok) {
+          throw new Error(result.detail || '选股任务状态查询失败');
+        }
+        if (result.status !== 'PENDING' && result.status !== 'RUNNING') {
+          break;
+        }
+      }
+
+      if (result.status === 'SUCCESS') {
         setExecutionResult({
           success: true,
           message: '选股执行成功',
           details: {
             stocksSelected: result.stocks_selected || 0,
-            startTime: new Date().toLocaleString(),
-            endTime: new Date(Date.now() + 5000).toLocaleString(),
+            startTime: startTime.toLocaleString(),
+            endTime: new Date().toLocaleString(),
             dateRange: `${formData.startDate} 至 ${formData.endDate}`
           }
         });
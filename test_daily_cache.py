@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+日线本地缓存测试：只含部分交易日的分区不会被当作新鲜分区读取、FLOAT字段与数据库读出的值一致、
+多个进程同时写入同一月份时manifest不丢失记录
+
+缓存目录使用临时目录，检查点/条目数汇总/数据库读取替换为内存数据，无需数据库连接：
+    python test_daily_cache.py
+    python -m pytest test_daily_cache.py
+"""
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import utils.daily_cache as daily_cache
+
+TICKERS = ['000001.SZ', '000002.SZ', '600000.SH']
+# 模拟的cn_stock_daily：2024年1月的前5个交易日
+DB_DAYS = ['20240102', '20240103', '20240104', '20240105', '20240108']
+
+
+def make_day(trade_date, close=8.64):
+    return pd.DataFrame({
+        'ts_code': TICKERS,
+        'trade_date': trade_date,
+        'price_open': 8.0, 'price_high': close, 'price_low': 7.9, 'price_close': close,
+        'price_pre_close': 8.0, 'amt_chg': close - 8.0, 'pct_chg': 8.0, 'vol': 1000.0, 'amount': 123456.789,
+    })
+
+
+def _use_temp_cache(db_days=DB_DAYS):
+    """缓存目录指向新的临时目录，数据库相关查询替换为db_days对应的内存数据"""
+    cache_dir = tempfile.mkdtemp(prefix='daily_cache_')
+    daily_cache.CACHE_DIR = cache_dir
+    daily_cache.MANIFEST_PATH = os.path.join(cache_dir, 'manifest.json')
+    daily_cache.LOCK_PATH = os.path.join(cache_dir, 'manifest.lock')
+    daily_cache._get_checkpoints = lambda start, end: {}
+    daily_cache._get_row_counts = lambda start, end: {d: len(TICKERS) for d in db_days if start <= d <= end}
+
+    def read_db_range(start, end, columns, ts_codes=None):
+        frames = [daily_cache._to_cache_frame(make_day(d)) for d in db_days if start <= d <= end]
+        return pd.concat(frames, ignore_index=True)[columns] if frames else pd.DataFrame(columns=columns)
+
+    daily_cache._read_db_range = read_db_range
+    return cache_dir
+
+
+def test_ingested_day_does_not_create_partial_partition():
+    cache_dir = _use_temp_cache()
+    try:
+        daily_cache.write_day(make_day('20240108'), 'h')
+        assert not os.path.exists(daily_cache._partition_path('2024-01'))
+        fresh, stale = daily_cache.plan_months('20240101', '20240131')
+        assert fresh == [] and [m[0] for m in stale] == ['2024-01']
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_partition_without_complete_flag_is_stale():
+    cache_dir = _use_temp_cache()
+    try:
+        # 旧版本由日K线抽取创建的分区：只有一个交易日，manifest中没有完整构建标记
+        daily_cache._write_partition('2024-01', daily_cache._to_cache_frame(make_day('20240108')))
+        daily_cache._save_manifest({'2024-01': {'20240108': {'rows': 3, 'hash': 'h', 'cached_at': '2024-01-08T18:00:00'}}})
+        assert daily_cache.plan_months('20240101', '20240131')[0] == []
+        # 从月初重建后整体替换为完整分区
+        daily_cache.rebuild_from_db('20240101', '20240131')
+        fresh, _ = daily_cache.plan_months('20240101', '20240131')
+        assert [m[0] for m in fresh] == ['2024-01']
+        assert len(daily_cache.load_daily('20240101', '20240131')) == len(DB_DAYS) * len(TICKERS)
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_missing_day_makes_month_stale():
+    cache_dir = _use_temp_cache(DB_DAYS[:-1])
+    try:
+        daily_cache.rebuild_from_db('20240101', '20240131')
+        assert [m[0] for m in daily_cache.plan_months('20240101', '20240131')[0]] == ['2024-01']
+        # 新交易日已入库（daily_row_counts已更新）但尚未写入缓存：整月回退数据库
+        daily_cache._get_row_counts = lambda start, end: {d: len(TICKERS) for d in DB_DAYS if start <= d <= end}
+        assert daily_cache.plan_months('20240101', '20240131')[0] == []
+        daily_cache.write_day(make_day('20240108'), 'h')
+        assert [m[0] for m in daily_cache.plan_months('20240101', '20240131')[0]] == ['2024-01']
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_rebuild_from_mid_month_is_not_complete():
+    cache_dir = _use_temp_cache()
+    try:
+        daily_cache.rebuild_from_db('20240104', '20240131')
+        assert not os.path.exists(daily_cache._partition_path('2024-01'))
+        assert daily_cache.plan_months('20240104', '20240131')[0] == []
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_cached_floats_match_database_values():
+    frame = daily_cache._to_cache_frame(make_day('20240102', close=8.64))
+    # 数据库FLOAT读出的是单精度值的最短十进制表示
+    assert frame['price_close'].iloc[0] == 8.64
+    assert frame['price_close'].iloc[0] / frame['price_open'].iloc[0] <= 1.08
+    assert frame['amount'].iloc[0] == 123456.79
+
+
+def _write_days(days):
+    for day in days:
+        daily_cache.write_day(make_day(day), day)
+
+
+def test_concurrent_processes_keep_all_manifest_entries():
+    if daily_cache.fcntl is None:
+        return
+    days = [f"202402{d:02d}" for d in range(1, 29)]
+    cache_dir = _use_temp_cache(days)
+    try:
+        daily_cache.rebuild_from_db('20240201', '20240201')
+        ctx = multiprocessing.get_context('fork')
+        workers = [ctx.Process(target=_write_days, args=(days[1 + i::4],)) for i in range(4)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        manifest = daily_cache._load_manifest()
+        assert sorted(manifest['2024-02']) == days
+        table = pq.read_table(daily_cache._partition_path('2024-02')).to_pandas()
+        assert len(table) == len(days) * len(TICKERS)
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
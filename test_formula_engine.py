@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+通达信公式引擎测试（使用合成日线数据，不访问数据库）
+
+运行：python test_formula_engine.py  或  python -m pytest test_formula_engine.py
+"""
+import numpy as np
+import pandas as pd
+
+import utils.tushare_select_stock as select_module
+from benchmark_select_stock import make_synthetic_daily
+from utils.formula_engine import (DEFAULT_FORMULA, DEFAULT_PARAMS, FormulaContext, FormulaError,
+                                  compile_formula, evaluate_formulas)
+from utils.tushare_select_stock import select_stocks, select_stocks_by_group
+
+DF = make_synthetic_daily(tickers=200, days=250)
+
+
+def make_tick_daily():
+    """价格取0.01元最小变动单位（与数据库一致），并加入涨幅恰为GAIN与略高于GAIN的两只股票"""
+    df = make_synthetic_daily(tickers=50, days=60)
+    for col in ['price_open', 'price_high', 'price_low', 'price_close', 'amount']:
+        df[col] = df[col].round(2)
+    df['vol'] = df['vol'].round()
+    dates = pd.bdate_range('2020-01-02', periods=8)
+    crafted = []
+    for code, spike_close in (("999998.SZ", 8.64), ("999999.SZ", 8.65)):
+        # 第4个bar：8.00 -> spike_close（8.64/8.00恰为1.08）且放量，之后缩量、最低价抬高
+        close = [8.0, 8.0, 8.0, 8.0, spike_close, 8.7, 8.8, 8.9]
+        crafted.append(pd.DataFrame({
+            'ts_code': code, 'trade_date': dates,
+            'price_open': close, 'price_high': close,
+            'price_low': [7.9, 7.9, 7.9, 7.9, 8.5, 8.7, 8.7, 8.7],
+            'price_close': close, 'price_pre_close': np.nan, 'amt_chg': np.nan, 'pct_chg': np.nan,
+            'vol': [1000.0, 1000.0, 1000.0, 1000.0, 2000.0, 1500.0, 1200.0, 1000.0],
+            'amount': 0.0,
+        }))
+    return pd.concat([df] + crafted, ignore_index=True)
+
+
+def test_default_formula_matches_legacy_conditions():
+    for d1 in (0, 2):
+        expected = select_stocks_by_group(DF, d1=d1)
+        assert not expected.empty
+        pd.testing.assert_frame_equal(select_stocks(DF, d1=d1), expected)
+
+
+def test_chunked_selection_matches_full_load():
+    tick_df = make_tick_daily()
+    chunks = [group for _, group in tick_df.groupby('ts_code', sort=True)]
+    originals = (select_module.load_daily, select_module.plan_months, select_module.iter_cached_ticker_chunks)
+    select_module.load_daily = lambda start_date, end_date: tick_df.copy()
+    select_module.plan_months = lambda start_date, end_date: ([('2020-01', start_date, end_date)], [])
+    select_module.iter_cached_ticker_chunks = lambda *args, **kwargs: (c.copy() for c in chunks[:25] + [pd.concat(chunks[25:])])
+    try:
+        expected = select_stocks(select_module.load_stock_data('20200101', '20201231'))
+        chunked = select_module.select_stocks_chunked('20200101', '20201231')
+    finally:
+        select_module.load_daily, select_module.plan_months, select_module.iter_cached_ticker_chunks = originals
+    # 恰为阈值的股票不命中，略高于阈值的命中
+    assert "999998.SZ" not in set(expected['ts_code'])
+    assert "999999.SZ" in set(expected['ts_code'])
+    pd.testing.assert_frame_equal(chunked.reset_index(drop=True), expected.reset_index(drop=True),
+                                  check_dtype=False, check_categorical=False)
+
+
+def test_window_functions_match_pandas_rolling():
+    context = FormulaContext(DF)
+    grouped = context.data.groupby('ts_code')
+    cases = {
+        "MA(C,5)": grouped['price_close'].transform(lambda s: s.rolling(5).mean()),
+        "HHV(H,10)": grouped['price_high'].transform(lambda s: s.rolling(10).max()),
+        "LLV(L,10)": grouped['price_low'].transform(lambda s: s.rolling(10).min()),
+        "STD(C,7)": grouped['price_close'].transform(lambda s: s.rolling(7).std()),
+    }
+    for formula_text, expected in cases.items():
+        formula = compile_formula(formula_text)
+        context.evaluate(formula)
+        assert np.allclose(context.cache[formula.root.key], expected.to_numpy(), equal_nan=True), formula_text
+
+
+def test_cross_and_count():
+    context = FormulaContext(DF)
+    close = context.data['price_close']
+    ma = context.data.groupby('ts_code')['price_close'].transform(lambda s: s.rolling(5).mean())
+    codes = context.data['ts_code']
+    expected = (close > ma) & (close.groupby(codes).shift(1) <= ma.groupby(codes).shift(1))
+    assert (context.evaluate(compile_formula("CROSS(C,MA(C,5))")) == expected.to_numpy()).all()
+
+    up = (close > close.groupby(codes).shift(1)).astype(float)
+    count = up.groupby(codes).transform(lambda s: s.rolling(3).sum())
+    assert (context.evaluate(compile_formula("COUNT(C>REF(C,1),3)>=2")) == (count >= 2).to_numpy()).all()
+
+
+def test_shared_subexpressions_are_computed_once():
+    formulas = {
+        'default': compile_formula(DEFAULT_FORMULA, DEFAULT_PARAMS),
+        'other': compile_formula("XG:REF(C,3)>MA(C,20) AND REF(V,3)>=1.5*REF(V,4)"),
+    }
+    context, masks = evaluate_formulas(DF, formulas)
+    # other只新增MA(C,20)、REF(C,3)>MA(C,20)与AND三步；放量条件与默认公式的条件3完全相同，直接复用
+    assert len(context.cache) == len(formulas['default'].plan) + 3
+    assert set(masks) == {'default', 'other'}
+    assert formulas['default'].lookback == 4
+    assert compile_formula(DEFAULT_FORMULA, {**DEFAULT_PARAMS, 'D1': 2}).lookback == 6
+
+
+def test_invalid_formulas_raise():
+    for formula_text in ["REF(C)", "FOO(C,1)", "C >", "REF(C,N)", "MA(C,0)", "C # 1"]:
+        try:
+            compile_formula(formula_text)
+        except FormulaError:
+            continue
+        raise AssertionError(f"应拒绝非法公式: {formula_text}")
+
+
+def test_incremental_window_covers_formula_lookback():
+    captured = {}
+
+    def fake_read_sql(sql, engine, params):
+        captured.update(params)
+        return pd.DataFrame({'trade_date': []})
+
+    read_sql, get_engine = select_module.pd.read_sql, select_module.get_db_engine
+    select_module.pd.read_sql, select_module.get_db_engine = fake_read_sql, lambda: None
+    try:
+        lookback = compile_formula("XG: C>MA(C,60) AND C>REF(C,1)").lookback
+        select_module.load_incremental_stock_data(['20240603'], lookback_bars=lookback)
+    finally:
+        select_module.pd.read_sql, select_module.get_db_engine = read_sql, get_engine
+    # 下限日期之后至少有lookback个工作日
+    workdays = pd.bdate_range(captured['floor_date'], '20240602')
+    assert captured['lookback_bars'] == lookback and len(workdays) >= lookback
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
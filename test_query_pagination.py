@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+选股记录查询接口测试：keyset游标翻页无遗漏、无重复；总条数缓存随数据版本号刷新；
+stock_name中已删除的股票仍可按代码查询
+
+接口通过依赖注入替换为SQLite（aiosqlite）会话，无需数据库连接：
+    python test_query_pagination.py
+    python -m pytest test_query_pagination.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import api.main as api_main
+import utils.data_versions as data_versions
+from utils.stock_search import StockNameIndex
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='query_pagination_'), 'test.db')
+ENGINE = create_async_engine(f"sqlite+aiosqlite:///{DB_PATH}")
+Session = async_sessionmaker(ENGINE, expire_on_commit=False)
+
+
+async def _execute(*statements):
+    async with ENGINE.begin() as conn:
+        for sql, params in statements:
+            await conn.execute(text(sql), params)
+
+
+def _setup():
+    asyncio.run(_execute(
+        ("""CREATE TABLE stock_selected (
+                execute_id TEXT, ts_code TEXT, trade_date TEXT, buy_date TEXT, gold_date TEXT,
+                price_open REAL, price_close REAL, price_high REAL, price_low REAL, vol REAL, amount REAL,
+                is_favorite INTEGER DEFAULT 0, favorite_added_at TEXT,
+                is_observation INTEGER DEFAULT 0, observation_added_at TEXT,
+                PRIMARY KEY (execute_id, ts_code))""", {}),
+        ("CREATE TABLE stock_name (ts_code TEXT PRIMARY KEY, ts_code_name TEXT)", {}),
+        ("CREATE TABLE data_versions (name TEXT PRIMARY KEY, version INTEGER, updated_at TEXT)", {}),
+    ))
+    # 同一交易日多只股票、同一股票多个批次，翻页边界会落在排序键的并列值上
+    rows = [
+        {"e": f"2024-01-0{day} 1{batch}:00:00", "c": f"00000{code}.SZ", "d": f"2023120{day}"}
+        for day in range(1, 5) for code in range(1, 6) for batch in range(1, 4)
+    ]
+    asyncio.run(_execute((
+        "INSERT INTO stock_selected (execute_id, ts_code, trade_date, buy_date, gold_date) "
+        "VALUES (:e, :c, :d, :d, :d)", rows)))
+    data_versions._table_ready = True
+
+    async def session_override():
+        async with Session() as session:
+            yield session
+
+    api_main.app.dependency_overrides[api_main.get_async_session] = session_override
+    api_main.app.dependency_overrides[api_main.require_auth] = lambda: {"username": "test"}
+    # 000005.SZ已退市，不在stock_name中
+    api_main.get_stock_index = lambda: StockNameIndex(
+        [(f"00000{code}.SZ", f"股票{code}") for code in range(1, 5)])
+    return TestClient(api_main.app), rows
+
+
+CLIENT, ROWS = _setup()
+
+
+def _page_through(page_size, **filters):
+    """沿next_cursor翻到最后一页，返回全部记录的 (trade_date, ts_code, execute_id)"""
+    seen, cursor = [], None
+    while True:
+        params = {"page_size": page_size, **filters}
+        if cursor:
+            params["cursor"] = cursor
+        body = CLIENT.get("/api/query/stock_selected", params=params).json()
+        seen += [(item["trade_date"], item["ts_code"], item["execute_id"]) for item in body["items"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return seen, body["total"]
+
+
+def test_cursor_pages_have_no_gaps_or_duplicates():
+    expected = sorted(((r["d"], r["c"], r["e"]) for r in ROWS), reverse=True)
+    for page_size in (1, 2, 3, 7, len(ROWS) - 1, len(ROWS), 100):
+        seen, total = _page_through(page_size)
+        assert seen == expected, page_size
+        assert total == len(ROWS)
+
+
+def test_cursor_pages_with_filter():
+    expected = sorted(((r["d"], r["c"], r["e"]) for r in ROWS
+                       if "20231202" <= r["d"] <= "20231203"), reverse=True)
+    seen, total = _page_through(4, buy_date_start="2023-12-02", buy_date_end="2023-12-03")
+    assert seen == expected and total == len(expected)
+
+
+def test_offset_pages_match_cursor_pages():
+    expected, _ = _page_through(6)
+    seen = []
+    for page in range(1, len(ROWS) // 6 + 2):
+        body = CLIENT.get("/api/query/stock_selected", params={"page": page, "page_size": 6}).json()
+        seen += [(item["trade_date"], item["ts_code"], item["execute_id"]) for item in body["items"]]
+    assert seen == expected
+
+
+def test_total_refreshes_when_version_changes():
+    filters = {"execute_id": "2024-01-01 11:00:00", "page_size": 5}
+    before = CLIENT.get("/api/query/stock_selected", params=filters).json()["total"]
+    # 模拟其他进程删除一条记录：本进程的缓存未失效，只有数据版本号递增
+    asyncio.run(_execute(
+        ("DELETE FROM stock_selected WHERE execute_id = :e AND ts_code = :c AND trade_date = :d",
+         {"e": "2024-01-01 11:00:00", "c": "000001.SZ", "d": "20231201"}),
+    ))
+    assert CLIENT.get("/api/query/stock_selected", params=filters).json()["total"] == before
+    asyncio.run(_execute(
+        ("INSERT INTO data_versions (name, version, updated_at) VALUES (:n, 1, '') "
+         "ON CONFLICT (name) DO UPDATE SET version = version + 1", {"n": data_versions.STOCK_SELECTED}),
+    ))
+    assert CLIENT.get("/api/query/stock_selected", params=filters).json()["total"] == before - 1
+    ROWS[:] = [r for r in ROWS if (r["e"], r["c"], r["d"]) != ("2024-01-01 11:00:00", "000001.SZ", "20231201")]
+
+
+def test_code_filter_finds_codes_missing_from_stock_name():
+    for query in ("000005", "000005.sz"):
+        seen, total = _page_through(10, ts_code=query)
+        assert total == len(seen) > 0 and {code for _, code, _ in seen} == {"000005.SZ"}
+    seen, total = _page_through(10, ts_code="股票2")
+    assert total == len(seen) > 0 and {code for _, code, _ in seen} == {"000002.SZ"}
+    body = CLIENT.get("/api/query/stock_selected", params={"ts_code": "不存在"}).json()
+    assert body["total"] == 0 and body["items"] == []
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
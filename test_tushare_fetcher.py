@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Tushare并发拉取层测试（使用本地模拟的pro对象，不访问网络）
+
+运行：python test_tushare_fetcher.py  或  python -m pytest test_tushare_fetcher.py
+"""
+import threading
+import time
+
+import pandas as pd
+
+from utils.tushare_fetcher import TokenBucket, TushareFetchError, TushareFetcher
+
+
+class FakePro:
+    """
+    模拟Tushare pro对象：
+    - 每个日期前fail_times次调用抛出频率超限异常
+    - 周末返回空DataFrame
+    - 每次调用耗时latency秒，记录最大并发数
+    """
+
+    def __init__(self, fail_times=None, latency=0.05):
+        self.fail_times = dict(fail_times or {})
+        self.latency = latency
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def daily(self, trade_date, fields):
+        with self.lock:
+            self.calls.append((time.monotonic(), trade_date))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.latency)
+            with self.lock:
+                if self.fail_times.get(trade_date, 0) > 0:
+                    self.fail_times[trade_date] -= 1
+                    raise Exception("抱歉，您每分钟最多访问该接口500次")
+            if pd.Timestamp(trade_date).weekday() >= 5:
+                return pd.DataFrame(columns=fields)
+            return pd.DataFrame({"ts_code": ["000001.SZ", "600000.SH"], "trade_date": [trade_date] * 2})
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+DATES = [d.strftime("%Y%m%d") for d in pd.date_range("2024-01-01", "2024-01-14")]
+
+
+def test_results_in_date_order_with_concurrency():
+    pro = FakePro(latency=0.05)
+    fetcher = TushareFetcher(pro, calls_per_minute=6000, max_workers=4, max_retries=3, base_delay=0.01)
+    started = time.monotonic()
+    result = [(d, len(df)) for d, df in fetcher.iter_daily(DATES)]
+    elapsed = time.monotonic() - started
+
+    assert [d for d, _ in result] == DATES
+    assert [n for _, n in result] == [0 if pd.Timestamp(d).weekday() >= 5 else 2 for d in DATES]
+    assert pro.max_active > 1
+    # 14次调用串行至少0.7秒，4线程并发应明显更快
+    assert elapsed < 0.5, elapsed
+
+
+def test_quota_errors_are_retried_with_backoff():
+    pro = FakePro(fail_times={"20240103": 2, "20240105": 1}, latency=0)
+    sleeps = []
+    fetcher = TushareFetcher(pro, calls_per_minute=6000, max_workers=3, max_retries=3,
+                             base_delay=0.01, sleep=lambda s: (sleeps.append(s), time.sleep(s)))
+    result = dict((d, len(df)) for d, df in fetcher.iter_daily(DATES))
+
+    assert result["20240103"] == 2 and result["20240105"] == 2
+    assert sum(1 for _, d in pro.calls if d == "20240103") == 3
+    assert len(pro.calls) == len(DATES) + 3
+
+
+def test_retry_cap_raises():
+    pro = FakePro(fail_times={"20240102": 100}, latency=0)
+    fetcher = TushareFetcher(pro, calls_per_minute=6000, max_workers=2, max_retries=2, base_delay=0.001)
+    got = []
+    try:
+        for d, _ in fetcher.iter_daily(DATES):
+            got.append(d)
+    except TushareFetchError:
+        pass
+    else:
+        raise AssertionError("应在重试上限后抛出TushareFetchError")
+    assert got == ["20240101"]
+    assert sum(1 for _, d in pro.calls if d == "20240102") == 3
+
+
+def test_token_bucket_limits_rate():
+    # 每分钟600次 = 每秒10次，桶容量2：12次调用至少需要 (12-2)/10 = 1秒
+    bucket = TokenBucket(600, capacity=2)
+    started = time.monotonic()
+    threads = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(3)]) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    assert 0.9 <= elapsed < 1.5, elapsed
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+选股结果回测
+====================
+功能说明：
+1. 读取stock_selected中的选股记录（按execute_id分组），以buy_date当天（非交易日顺延到下一交易日）
+   的开盘价（或收盘价）买入
+2. 一次性读取所有涉及股票在回测区间内的日线（优先本地Parquet缓存），构建 股票 x 交易日 的
+   对齐价格矩阵，停牌日沿用最近收盘价
+3. 所有选股记录的持有期路径通过矩阵花式索引一次取出，向量化计算N个交易日后的收益率、
+   持有期内最大回撤与胜率（收益率>0的比例），不再逐条查询
+4. 尚未走完N个交易日的记录不计入该持有期的统计（matured为已走完的条数）
+
+使用方法：
+    python utils/backtest.py --execute-id "2026-01-26 01/19-01/23" --horizons 1,3,5,10,20
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+# 添加当前目录到系统路径，以便导入 db_utils
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from db_utils import get_db_engine
+    from daily_cache import load_daily
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.db_utils import get_db_engine
+    from utils.daily_cache import load_daily
+
+# 默认持有期（交易日）
+DEFAULT_HORIZONS = (1, 3, 5, 10, 20)
+PRICE_COLUMNS = ['ts_code', 'trade_date', 'price_open', 'price_close']
+
+
+def _to_datetime(values):
+    """DATE列或YYYYMMDD字符串统一转换为datetime（无法解析的为NaT）"""
+    return pd.to_datetime(pd.Series(values).astype(str).str.replace('-', '', regex=False).str[:8],
+                          format='%Y%m%d', errors='coerce')
+
+
+def load_picks(execute_ids=None, buy_date_start=None, buy_date_end=None):
+    """
+    读取待回测的选股记录
+
+    参数说明：
+    ----------
+    execute_ids : list[str], 可选
+        选股批次标识，默认全部批次
+    buy_date_start, buy_date_end : str, 可选
+        买入日期区间（YYYYMMDD）
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        execute_id / ts_code / buy_date(datetime)
+    """
+    sql = "SELECT execute_id, ts_code, buy_date FROM stock_selected WHERE buy_date IS NOT NULL"
+    params = {}
+    if execute_ids:
+        sql += " AND execute_id IN :execute_ids"
+        params["execute_ids"] = list(execute_ids)
+    if buy_date_start:
+        sql += " AND buy_date >= :buy_start"
+        params["buy_start"] = buy_date_start
+    if buy_date_end:
+        sql += " AND buy_date <= :buy_end"
+        params["buy_end"] = buy_date_end
+    query = text(sql)
+    if execute_ids:
+        query = query.bindparams(bindparam("execute_ids", expanding=True))
+    df = pd.read_sql(query, get_db_engine(), params=params)
+    df['execute_id'] = df['execute_id'].astype(str)
+    df['buy_date'] = _to_datetime(df['buy_date']).to_numpy()
+    return df.dropna(subset=['buy_date']).reset_index(drop=True)
+
+
+def _ffill_columns(matrix):
+    """沿交易日方向（axis=1）前向填充NaN：停牌日沿用最近一个交易日的价格"""
+    cols = np.arange(matrix.shape[1])
+    last_valid = np.where(np.isnan(matrix), 0, cols)
+    np.maximum.accumulate(last_valid, axis=1, out=last_valid)
+    return matrix[np.arange(matrix.shape[0])[:, None], last_valid]
+
+
+def build_price_matrices(prices):
+    """
+    将日线数据转换为对齐的价格矩阵
+
+    返回值：
+    ----------
+    tuple
+        (tickers, dates, open_matrix, close_matrix)：tickers/dates已排序，
+        矩阵形状为 (股票数, 交易日数)，缺失处为NaN；close_matrix已前向填充停牌日
+    """
+    dates = np.unique(prices['trade_date'].to_numpy())
+    # factorize(sort=True)对字符串哈希编码，比np.unique的整列字符串排序快一个数量级
+    ticker_index, tickers = pd.factorize(prices['ts_code'].astype(str), sort=True)
+    tickers = np.asarray(tickers, dtype=object)
+    date_index = np.searchsorted(dates, prices['trade_date'].to_numpy())
+
+    open_matrix = np.full((len(tickers), len(dates)), np.nan)
+    close_matrix = np.full((len(tickers), len(dates)), np.nan)
+    open_matrix[ticker_index, date_index] = prices['price_open'].to_numpy(dtype='float64')
+    close_matrix[ticker_index, date_index] = prices['price_close'].to_numpy(dtype='float64')
+    return tickers, dates, open_matrix, _ffill_columns(close_matrix)
+
+
+def compute_forward_metrics(picks, prices, horizons=DEFAULT_HORIZONS, entry='open'):
+    """
+    向量化计算每条选股记录在各持有期的收益率与最大回撤
+
+    参数说明：
+    ----------
+    picks : pandas.DataFrame
+        execute_id / ts_code / buy_date(datetime)
+    prices : pandas.DataFrame
+        ts_code / trade_date(datetime) / price_open / price_close
+    horizons : list[int]
+        持有期（买入日之后的交易日数）
+    entry : str
+        'open'按买入日开盘价买入，'close'按买入日收盘价买入
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        picks的副本，新增entry_date、entry_price，以及每个持有期N的 ret_N（收益率）与
+        mdd_N（买入至第N个交易日收盘的最大回撤，≤0），未走完N个交易日或无法买入的为NaN
+    """
+    horizons = sorted({int(h) for h in horizons})
+    result = picks.reset_index(drop=True).copy()
+    result['entry_date'] = pd.NaT
+    result['entry_price'] = np.nan
+    for n in horizons:
+        result[f'ret_{n}'] = np.nan
+        result[f'mdd_{n}'] = np.nan
+    if result.empty or prices.empty:
+        return result
+
+    tickers, dates, open_matrix, close_matrix = build_price_matrices(prices)
+
+    # 定位每条记录的股票行与买入日列（buy_date非交易日时顺延到下一交易日）
+    codes = result['ts_code'].astype(str).to_numpy()
+    row = np.searchsorted(tickers, codes).clip(0, len(tickers) - 1)
+    col = np.searchsorted(dates, result['buy_date'].to_numpy(), side='left')
+    valid = (tickers[row] == codes) & (col < len(dates))
+    col = np.where(valid, col, 0)
+
+    entry_matrix = open_matrix if entry == 'open' else close_matrix
+    entry_price = np.where(valid, entry_matrix[row, col], np.nan)
+    # 买入日停牌（无开盘价）或价格异常的记录无法买入
+    entry_price[~(entry_price > 0)] = np.nan
+    valid &= ~np.isnan(entry_price)
+
+    # 一次取出所有记录的持有期收盘价路径：(记录数, 最长持有期+1)
+    max_h = horizons[-1]
+    path_cols = col[:, None] + np.arange(max_h + 1)[None, :]
+    beyond = path_cols >= len(dates)
+    path = close_matrix[row[:, None], np.minimum(path_cols, len(dates) - 1)]
+    path[beyond] = np.nan
+    relative = path / entry_price[:, None]
+
+    # 最大回撤：以买入价为初始高点，逐日取 收盘/此前最高 - 1 的最小值
+    with np.errstate(invalid='ignore'):
+        peak = np.fmax.accumulate(np.fmax(relative, 1.0), axis=1)
+        drawdown = np.fmin.accumulate(np.fmin(relative / peak - 1, 0.0), axis=1)
+
+    result['entry_date'] = np.where(valid, dates[col], np.datetime64('NaT'))
+    result['entry_price'] = entry_price
+    for n in horizons:
+        matured = valid & ~beyond[:, n]
+        result[f'ret_{n}'] = np.where(matured, relative[:, n] - 1, np.nan)
+        result[f'mdd_{n}'] = np.where(matured, drawdown[:, n], np.nan)
+    return result
+
+
+def summarize_metrics(metrics, horizons=DEFAULT_HORIZONS, by='execute_id'):
+    """
+    按批次汇总各持有期的统计（收益率、回撤以百分比表示，保留2位小数）
+
+    返回值：
+    ----------
+    list[dict]
+        每个批次一项：{execute_id, picks, horizons: {N: {matured, avg_return_pct, median_return_pct,
+        hit_rate_pct, avg_max_drawdown_pct, worst_drawdown_pct}}}；by为None时汇总全部记录
+    """
+    horizons = sorted({int(h) for h in horizons})
+    groups = metrics.groupby(by, sort=True) if by else [(None, metrics)]
+    summary = []
+    for key, group in groups:
+        item = {"picks": len(group), "horizons": {}}
+        if by:
+            item[by] = key
+        for n in horizons:
+            ret = group[f'ret_{n}'].dropna()
+            mdd = group[f'mdd_{n}'].dropna()
+            stats = {"matured": int(len(ret))}
+            if len(ret):
+                stats.update({
+                    "avg_return_pct": round(float(ret.mean()) * 100, 2),
+                    "median_return_pct": round(float(ret.median()) * 100, 2),
+                    "hit_rate_pct": round(float((ret > 0).mean()) * 100, 2),
+                    "avg_max_drawdown_pct": round(float(mdd.mean()) * 100, 2),
+                    "worst_drawdown_pct": round(float(mdd.min()) * 100, 2),
+                })
+            item["horizons"][str(n)] = stats
+        summary.append(item)
+    return summary
+
+
+def backtest_selected(execute_ids=None, buy_date_start=None, buy_date_end=None,
+                      horizons=DEFAULT_HORIZONS, entry='open'):
+    """
+    回测stock_selected中的选股记录
+
+    返回值：
+    ----------
+    dict
+        - picks: 选股记录条数；tradable: 可买入的条数
+        - groups: 按execute_id汇总的统计（见summarize_metrics）
+        - overall: 全部记录的汇总统计
+        - timings: 各阶段耗时（秒）：load_picks / load_prices / compute
+    """
+    horizons = sorted({int(h) for h in horizons if int(h) > 0}) or list(DEFAULT_HORIZONS)
+    timings = {}
+    t0 = time.perf_counter()
+    picks = load_picks(execute_ids, buy_date_start, buy_date_end)
+    timings["load_picks"] = time.perf_counter() - t0
+
+    prices = pd.DataFrame(columns=PRICE_COLUMNS)
+    t0 = time.perf_counter()
+    if not picks.empty:
+        start = picks['buy_date'].min()
+        # 最长持有期折算为日历天数（每周5个交易日，另留出长假余量），截止到今天
+        end = min(picks['buy_date'].max() + timedelta(days=horizons[-1] * 7 // 5 + 15), pd.Timestamp(datetime.now()))
+        prices = load_daily(start.strftime('%Y%m%d'), end.strftime('%Y%m%d'),
+                            columns=PRICE_COLUMNS, ts_codes=picks['ts_code'].astype(str).unique().tolist())
+    timings["load_prices"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    metrics = compute_forward_metrics(picks, prices, horizons, entry)
+    groups = summarize_metrics(metrics, horizons)
+    overall = summarize_metrics(metrics, horizons, by=None)[0]
+    timings["compute"] = time.perf_counter() - t0
+
+    return {
+        "picks": len(picks),
+        "tradable": int(metrics['entry_price'].notna().sum()),
+        "entry": entry,
+        "horizons": horizons,
+        "groups": groups,
+        "overall": overall,
+        "timings": {k: round(v, 3) for k, v in timings.items()},
+    }
+
+
+# ========================== 主程序执行入口 ==========================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='选股结果回测')
+    parser.add_argument('--execute-id', action='append', default=None, help='选股批次标识（可重复，默认全部）')
+    parser.add_argument('--buy-start', default=None, help='买入日期起(YYYYMMDD)')
+    parser.add_argument('--buy-end', default=None, help='买入日期止(YYYYMMDD)')
+    parser.add_argument('--horizons', default=','.join(map(str, DEFAULT_HORIZONS)), help='持有期（交易日），逗号分隔')
+    parser.add_argument('--entry', choices=['open', 'close'], default='open', help='按买入日开盘价或收盘价买入')
+    args = parser.parse_args()
+
+    report = backtest_selected(args.execute_id, args.buy_start, args.buy_end,
+                               [int(h) for h in args.horizons.split(',') if h.strip()], args.entry)
+    print(f"📊 回测 {report['picks']} 条选股记录（可买入 {report['tradable']} 条），耗时 {report['timings']}")
+    for item in report["groups"] + [dict(report["overall"], execute_id="全部")]:
+        print(f"\n{item['execute_id']}（{item['picks']} 条）")
+        for n, stats in item["horizons"].items():
+            if stats["matured"]:
+                print(f"  {n:>3}日: 平均收益 {stats['avg_return_pct']:+.2f}%  胜率 {stats['hit_rate_pct']:.1f}%  "
+                      f"平均最大回撤 {stats['avg_max_drawdown_pct']:.2f}%  （{stats['matured']} 条）")
+            else:
+                print(f"  {n:>3}日: 尚无走完持有期的记录")
@@ -1,13 +1,15 @@
 # -*- coding: utf-8 -*-
 """
 从 Baostock 更新股票名称到数据库
+与表中现有数据比对，只在一个事务中写入新增/改名的股票并删除已不存在的股票，
+更新过程中查询始终能读到完整的名称表
 """
 import baostock as bs
 import pandas as pd
 import os
 import sys
 from datetime import datetime, timedelta
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
 from dotenv import load_dotenv
 
 # 添加当前目录到系统路径，以便导入 db_utils
@@ -24,6 +26,28 @@ except ImportError:
 load_dotenv()
 load_dotenv('.env.local')
 
+# 单条DELETE语句中IN列表的最大长度
+DELETE_BATCH_SIZE = 1000
+
+
+def diff_stock_names(current, df_save):
+    """
+    比对数据库中现有名称与最新名称
+
+    参数：
+        current: 现有数据 {ts_code: ts_code_name}
+        df_save: 最新数据DataFrame（ts_code, ts_code_name）
+    返回：
+        tuple: (新增记录列表, 改名记录列表, 需删除的股票代码列表)，记录为 {'ts_code', 'ts_code_name'} 字典
+    """
+    latest = dict(zip(df_save['ts_code'], df_save['ts_code_name']))
+    added = [{"ts_code": code, "ts_code_name": name} for code, name in latest.items() if code not in current]
+    renamed = [{"ts_code": code, "ts_code_name": name} for code, name in latest.items()
+               if code in current and current[code] != name]
+    removed = [code for code in current if code not in latest]
+    return added, renamed, removed
+
+
 def update_stock_names():
     print("🚀 开始从 Baostock 更新股票名称...")
     
@@ -89,13 +113,12 @@ def update_stock_names():
         df['ts_code'] = df['code'].apply(convert_code)
         df['ts_code_name'] = df['code_name']
         
-        # 只要这两个字段
-        df_save = df[['ts_code', 'ts_code_name']]
+        # 只要这两个字段（同一代码只保留一条）
+        df_save = df[['ts_code', 'ts_code_name']].drop_duplicates('ts_code', keep='last')
         
-        # 4. 存入数据库
-        print(f"准备写入 {len(df_save)} 条数据...")
+        # 4. 与现有数据比对，只写入变化的行（同一事务内完成，读者不会看到空表或中间状态）
         engine = get_db_engine()
-        with engine.connect() as conn:
+        with engine.begin() as conn:
             # 创建表 (如果不存在)
             conn.execute(text("""
             CREATE TABLE IF NOT EXISTS stock_name (
@@ -103,17 +126,24 @@ def update_stock_names():
                 ts_code_name VARCHAR(50)
             )
             """))
-            # 清空表 (全量更新)
-            conn.execute(text("TRUNCATE TABLE stock_name"))
-            conn.commit()
-            
-        # 写入新数据
-        df_save.to_sql('stock_name', engine, if_exists='append', index=False, chunksize=1000)
-        
+            current = dict(conn.execute(text("SELECT ts_code, ts_code_name FROM stock_name")).fetchall())
+            added, renamed, removed = diff_stock_names(current, df_save)
+            print(f"共 {len(df_save)} 条：新增 {len(added)} 条，改名 {len(renamed)} 条，删除 {len(removed)} 条")
+
+            if added or renamed:
+                conn.execute(text("""
+                    INSERT INTO stock_name (ts_code, ts_code_name) VALUES (:ts_code, :ts_code_name)
+                    ON DUPLICATE KEY UPDATE ts_code_name = VALUES(ts_code_name)
+                """), added + renamed)
+            delete_sql = text("DELETE FROM stock_name WHERE ts_code IN :codes").bindparams(
+                bindparam("codes", expanding=True))
+            for i in range(0, len(removed), DELETE_BATCH_SIZE):
+                conn.execute(delete_sql, {"codes": removed[i:i + DELETE_BATCH_SIZE]})
+
         bs.logout()
-        engine.dispose()
-        
-        success_msg = f"成功更新 {len(df_save)} 条股票名称数据"
+
+        success_msg = (f"成功更新 {len(df_save)} 条股票名称数据"
+                       f"（新增 {len(added)}，改名 {len(renamed)}，删除 {len(removed)}）")
         print(success_msg)
         log_task_execution("股票名称抽取", "SUCCESS", success_msg)
         
@@ -0,0 +1,533 @@
+# -*- coding: utf-8 -*-
+"""
+日线数据本地列式缓存（Parquet，按年/月分区）
+====================
+功能说明：
+1. 日K线抽取在写入MySQL后同步写入本地缓存：cache/daily/year=YYYY/month=MM.parquet
+2. manifest.json记录每个交易日的条目数、内容哈希与缓存时间，以及由rebuild_from_db完整构建过的月份
+3. 选股、Tushare校验、数据统计接口通过load_daily/get_daily_counts读取，只读取需要的列和日期范围
+4. 分区缺失或已过期（与ingest_checkpoints检查点不一致）时，该月自动回退到数据库查询
+5. 日K线抽取只向已完整构建的月份追加交易日，不会为新月份创建只含部分交易日的分区；
+   新月份在rebuild_from_db之前一直从数据库读取
+
+过期判定（按月，任一条件成立即整月回退数据库）：
+- 该月未由rebuild_from_db从月初完整构建（manifest中不在完整月份列表中）
+- 区间内任一交易日的缓存条目数与daily_row_counts不一致，或缓存中有daily_row_counts没有的交易日
+- 检查点条目数与缓存不一致、内容哈希不一致、或检查点完成时间晚于缓存时间（重新抽取过）
+
+价格字段在数据库中为FLOAT：写入缓存前按FLOAT的精度取值，缓存与数据库读出的数值一致，
+选股结果不因某月是否命中缓存而不同。
+
+配置说明（环境变量）：
+- DAILY_CACHE_DIR: 缓存目录，默认项目根目录下 cache/daily
+- DAILY_CACHE_ENABLED: 设为0时禁用缓存，读取全部走数据库
+- DAILY_CACHE_VERIFY: 设为0时不与检查点比对，直接使用已有分区（离线分析/基准测试）
+"""
+
+import argparse
+import json
+import os
+from contextlib import contextmanager
+import sys
+import threading
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    import fcntl
+except ImportError:  # Windows：只做进程内互斥
+    fcntl = None
+
+# 添加当前目录到系统路径，以便导入 db_utils
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from db_utils import get_config, get_db_engine, to_yyyymmdd
+    from sqlalchemy import bindparam, text
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.db_utils import get_config, get_db_engine, to_yyyymmdd
+    from sqlalchemy import bindparam, text
+
+CACHE_DIR = get_config('DAILY_CACHE_DIR') or os.path.join(os.path.dirname(current_dir), 'cache', 'daily')
+MANIFEST_PATH = os.path.join(CACHE_DIR, 'manifest.json')
+LOCK_PATH = os.path.join(CACHE_DIR, 'manifest.lock')
+# manifest中记录完整构建过的月份的键（其余键均为年月）
+COMPLETE_MONTHS_KEY = '_complete_months'
+
+# 缓存中保存的列（与cn_stock_daily一致，trade_date保存为日期类型，读取时无需再解析字符串）
+CACHE_COLUMNS = [
+    'ts_code', 'trade_date', 'price_open', 'price_high', 'price_low', 'price_close',
+    'price_pre_close', 'amt_chg', 'pct_chg', 'vol', 'amount'
+]
+# cn_stock_daily中为FLOAT的字段
+FLOAT_COLUMNS = ['price_open', 'price_high', 'price_low', 'price_close', 'price_pre_close', 'amt_chg', 'pct_chg', 'amount']
+
+# 分区文件的行组大小：文件按ts_code排序，较小的行组使按股票代码区间读取时能跳过无关行组
+ROW_GROUP_SIZE = 20000
+
+# 同一进程内多个写入线程共享缓存文件与manifest（跨进程互斥见_cache_lock）
+_lock = threading.Lock()
+
+
+def cache_enabled():
+    """是否启用本地缓存"""
+    return str(get_config('DAILY_CACHE_ENABLED', '1')).lower() not in ('0', 'false', 'no')
+
+
+def cache_verify_enabled():
+    """读取缓存前是否与ingest_checkpoints比对（判断分区是否过期）"""
+    return str(get_config('DAILY_CACHE_VERIFY', '1')).lower() not in ('0', 'false', 'no')
+
+
+def _partition_path(year_month):
+    year, month = year_month.split('-')
+    return os.path.join(CACHE_DIR, f"year={year}", f"month={month}.parquet")
+
+
+@contextmanager
+def _cache_lock():
+    """
+    分区文件与manifest的读-改-写互斥：进程内用线程锁，跨进程（多个日K线抽取进程、rebuild命令行）
+    用manifest.lock上的文件锁
+    """
+    with _lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(LOCK_PATH, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _load_manifest():
+    """
+    读取manifest：{年月: {交易日: {"rows": 条目数, "hash": 内容哈希, "cached_at": 缓存时间}},
+                  COMPLETE_MONTHS_KEY: [完整构建过的年月, ...]}
+    """
+    try:
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _atomic_write(path, write_func):
+    """先写临时文件再替换，进程中断时不会留下写了一半的文件"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    write_func(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _save_manifest(manifest):
+    def write(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, sort_keys=True)
+    _atomic_write(MANIFEST_PATH, write)
+
+
+def _month_ranges(start_date, end_date):
+    """将日期区间切分为按月的子区间：[(年月, 起始日, 结束日), ...]，日期格式均为YYYYMMDD"""
+    ranges = []
+    for month_start in pd.date_range(pd.Timestamp(start_date).replace(day=1), pd.Timestamp(end_date), freq='MS'):
+        month_end = month_start + pd.offsets.MonthEnd(0)
+        ranges.append((
+            month_start.strftime('%Y-%m'),
+            max(start_date, month_start.strftime('%Y%m%d')),
+            min(end_date, month_end.strftime('%Y%m%d'))
+        ))
+    return ranges
+
+
+def _as_db_float(series):
+    """
+    按数据库FLOAT字段读出的值转换：数据库以单精度保存，查询结果是单精度值的最短十进制表示
+    （如8.64而不是8.640000343），因此经float32的最短字符串表示转回float64
+    """
+    return series.astype('float32').astype(str).astype('float64')
+
+
+def _to_cache_frame(df_day):
+    """
+    将cn_stock_daily字段的数据转换为缓存格式：trade_date转为日期类型，vol与数据库BIGINT一致取整，
+    FLOAT字段与数据库读出的数值一致
+    """
+    df = df_day[CACHE_COLUMNS].copy()
+    df['trade_date'] = pd.to_datetime(df['trade_date'].astype(str), format='%Y%m%d')
+    df['vol'] = df['vol'].fillna(0).round().astype('int64')
+    for col in FLOAT_COLUMNS:
+        df[col] = _as_db_float(df[col])
+    return df
+
+
+def _write_partition(year_month, df_month):
+    table = pa.Table.from_pandas(
+        df_month.sort_values(['ts_code', 'trade_date'], kind='mergesort'), preserve_index=False
+    )
+    _atomic_write(_partition_path(year_month), lambda path: pq.write_table(table, path, row_group_size=ROW_GROUP_SIZE))
+
+
+def write_day(df_day, content_hash=None):
+    """
+    将单个交易日的数据写入对应月份分区（覆盖该交易日已有的缓存）
+    该月尚未由rebuild_from_db完整构建时跳过：只含部分交易日的分区无法用于读取
+
+    参数说明：
+    ----------
+    df_day : pandas.DataFrame
+        单日数据，字段与cn_stock_daily一致（trade_date为YYYYMMDD字符串）
+    content_hash : str, 可选
+        与ingest_checkpoints一致的内容哈希，用于过期判定
+    """
+    if not cache_enabled() or df_day.empty:
+        return
+    trade_date = str(df_day['trade_date'].iloc[0])
+    year_month = f"{trade_date[:4]}-{trade_date[4:6]}"
+    new_rows = _to_cache_frame(df_day)
+
+    with _cache_lock():
+        manifest = _load_manifest()
+        path = _partition_path(year_month)
+        if year_month not in manifest.get(COMPLETE_MONTHS_KEY, []) or not os.path.exists(path):
+            return
+        existing = pq.read_table(path).to_pandas()
+        new_rows = pd.concat(
+            [existing[existing['trade_date'] != new_rows['trade_date'].iloc[0]], new_rows],
+            ignore_index=True
+        )
+        _write_partition(year_month, new_rows)
+
+        manifest.setdefault(year_month, {})[trade_date] = {
+            "rows": len(df_day),
+            "hash": content_hash,
+            "cached_at": datetime.now().isoformat(timespec='seconds')
+        }
+        _save_manifest(manifest)
+
+
+def _get_checkpoints(start_date, end_date):
+    """查询日期区间内的抽取检查点：{trade_date: (row_count, content_hash, completed_at)}"""
+    engine = get_db_engine()
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT trade_date, row_count, content_hash, completed_at FROM ingest_checkpoints
+            WHERE trade_date BETWEEN :start_date AND :end_date
+        """), {"start_date": start_date, "end_date": end_date}).fetchall()
+    return {row[0]: (row[1], row[2], row[3]) for row in rows}
+
+
+def _get_row_counts(start_date, end_date):
+    """查询日期区间内cn_stock_daily按交易日的条目数（daily_row_counts汇总表）：{trade_date: 条目数}"""
+    engine = get_db_engine()
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT trade_date, row_count FROM daily_row_counts
+            WHERE trade_date BETWEEN :start_date AND :end_date
+        """), {"start_date": start_date, "end_date": end_date}).fetchall()
+    return {to_yyyymmdd(row[0]): row[1] for row in rows}
+
+
+def _month_is_fresh(cached_days, row_counts, checkpoints, month_start, month_end):
+    """
+    判断某月分区在[month_start, month_end]内的缓存是否完整且与检查点一致：
+    交易日集合及每日条目数须与daily_row_counts完全一致（没有检查点的交易日也逐日核对）
+    """
+    if not cached_days:
+        return False
+    cached_counts = {d: info["rows"] for d, info in cached_days.items() if month_start <= d <= month_end}
+    expected_counts = {d: n for d, n in row_counts.items() if month_start <= d <= month_end}
+    if cached_counts != expected_counts:
+        return False
+    for trade_date, (row_count, day_hash, completed_at) in checkpoints.items():
+        if not (month_start <= trade_date <= month_end):
+            continue
+        cached = cached_days.get(trade_date)
+        if cached is None or cached["rows"] != row_count:
+            return False
+        if cached.get("hash") and day_hash and cached["hash"] != day_hash:
+            return False
+        if completed_at and completed_at > datetime.fromisoformat(cached["cached_at"]):
+            return False
+    return True
+
+
+def plan_months(start_date, end_date):
+    """
+    将日期区间按月拆分为可从缓存读取、需回退数据库的两部分
+
+    返回值：
+    ----------
+    tuple
+        (fresh, stale)，均为[(年月, 起始日, 结束日), ...]
+    """
+    ranges = _month_ranges(start_date, end_date)
+    if not cache_enabled():
+        return [], ranges
+    manifest = _load_manifest()
+    if not cache_verify_enabled():
+        # 不与检查点比对：有分区文件即视为可用（离线分析、基准测试等无数据库环境）
+        fresh = [r for r in ranges if os.path.exists(_partition_path(r[0]))]
+        return fresh, [r for r in ranges if r not in fresh]
+    try:
+        checkpoints = _get_checkpoints(start_date, end_date)
+        row_counts = _get_row_counts(start_date, end_date)
+    except Exception as e:
+        # 检查点表/条目数汇总表不存在等情况：无法判断缓存是否过期，全部回退数据库
+        print(f"⚠️ 读取抽取检查点失败，回退数据库查询: {e}", flush=True)
+        return [], ranges
+
+    complete_months = set(manifest.get(COMPLETE_MONTHS_KEY, []))
+    fresh, stale = [], []
+    for year_month, month_start, month_end in ranges:
+        cached_days = manifest.get(year_month, {})
+        if (year_month in complete_months and os.path.exists(_partition_path(year_month))
+                and _month_is_fresh(cached_days, row_counts, checkpoints, month_start, month_end)):
+            fresh.append((year_month, month_start, month_end))
+        else:
+            stale.append((year_month, month_start, month_end))
+    return fresh, stale
+
+
+def _read_db_range(start_date, end_date, columns, ts_codes=None):
+    """从cn_stock_daily读取日期区间内的指定列（回退路径），ts_codes非空时只读取这些股票"""
+    sql = f"""
+    SELECT {', '.join(columns)}
+    FROM cn_stock_daily
+    WHERE trade_date BETWEEN :start_date AND :end_date
+    """
+    params = {"start_date": start_date, "end_date": end_date}
+    if ts_codes is not None:
+        sql += " AND ts_code IN :ts_codes"
+        params["ts_codes"] = list(ts_codes)
+        query = text(sql).bindparams(bindparam("ts_codes", expanding=True))
+    else:
+        query = text(sql)
+    df = pd.read_sql(query, get_db_engine(), params=params)
+    if 'trade_date' in df.columns:
+        df['trade_date'] = pd.to_datetime(df['trade_date'].astype(str).str.replace('-', '', regex=False), format='%Y%m%d')
+    return df
+
+
+def load_daily(start_date, end_date, columns=None, ts_codes=None):
+    """
+    读取日期区间内的日线数据：新鲜分区读本地Parquet，缺失或过期的月份回退数据库
+
+    参数说明：
+    ----------
+    start_date, end_date : str
+        日期区间，格式为YYYYMMDD
+    columns : list, 可选
+        需要的列（默认全部CACHE_COLUMNS），只读取这些列
+    ts_codes : list, 可选
+        只读取这些股票（默认全部股票）
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        trade_date为datetime类型，按ts_code、trade_date排序
+    """
+    columns = list(columns or CACHE_COLUMNS)
+    if ts_codes is not None:
+        ts_codes = sorted(set(ts_codes))
+        if not ts_codes:
+            return pd.DataFrame(columns=columns)
+    ticker_filters = [('ts_code', 'in', ts_codes)] if ts_codes is not None else []
+    fresh, stale = plan_months(start_date, end_date)
+
+    frames = []
+    for year_month, month_start, month_end in fresh:
+        table = pq.read_table(
+            _partition_path(year_month),
+            columns=columns,
+            filters=ticker_filters + [
+                ('trade_date', '>=', pd.Timestamp(month_start)),
+                ('trade_date', '<=', pd.Timestamp(month_end))
+            ]
+        )
+        frames.append(table.to_pandas())
+
+    # 连续的过期月份合并为一次数据库查询
+    merged = []
+    for _, month_start, month_end in stale:
+        if merged and pd.Timestamp(month_start) - pd.Timestamp(merged[-1][1]) <= pd.Timedelta(days=1):
+            merged[-1][1] = month_end
+        else:
+            merged.append([month_start, month_end])
+    for db_start, db_end in merged:
+        frames.append(_read_db_range(db_start, db_end, columns, ts_codes))
+
+    if stale:
+        print(f"📦 本地缓存命中 {len(fresh)} 个月，{len(stale)} 个月回退数据库查询", flush=True)
+
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    df = pd.concat(frames, ignore_index=True)
+    sort_cols = [c for c in ('ts_code', 'trade_date') if c in df.columns]
+    if sort_cols:
+        df = df.sort_values(sort_cols, kind='mergesort', ignore_index=True)
+    return df
+
+
+def iter_cached_ticker_chunks(months, columns=None, chunk_tickers=500, ticker_filter=None):
+    """
+    按股票代码分组逐块读取缓存分区，每块包含若干只股票在整个区间内的完整数据
+
+    参数说明：
+    ----------
+    months : list
+        plan_months返回的新鲜月份 [(年月, 起始日, 结束日), ...]
+    columns : list, 可选
+        需要的列（默认全部CACHE_COLUMNS）
+    chunk_tickers : int, 可选
+        每块包含的股票数量
+    ticker_filter : callable, 可选
+        只读取ticker_filter(ts_code)为True的股票（用于多进程分片）
+
+    返回值：
+    ----------
+    generator
+        逐块产出DataFrame（trade_date为datetime类型，按ts_code、trade_date排序）
+    """
+    columns = list(columns or CACHE_COLUMNS)
+    tickers = set()
+    for year_month, _, _ in months:
+        tickers.update(pq.read_table(_partition_path(year_month), columns=['ts_code']).column(0).unique().to_pylist())
+    tickers = sorted(t for t in tickers if ticker_filter is None or ticker_filter(t))
+
+    for i in range(0, len(tickers), chunk_tickers):
+        group = tickers[i:i + chunk_tickers]
+        ticker_filters = [('ts_code', '>=', group[0]), ('ts_code', '<=', group[-1])]
+        if ticker_filter is not None:
+            # 分片后的股票代码不连续，区间条件用于跳过行组，in条件保证只取本分片
+            ticker_filters.append(('ts_code', 'in', group))
+        frames = []
+        for year_month, month_start, month_end in months:
+            filters = ticker_filters + [
+                ('trade_date', '>=', pd.Timestamp(month_start)),
+                ('trade_date', '<=', pd.Timestamp(month_end))
+            ]
+            table = pq.read_table(_partition_path(year_month), columns=columns, filters=filters)
+            if table.num_rows:
+                frames.append(table.to_pandas())
+        if frames:
+            yield pd.concat(frames, ignore_index=True).sort_values(
+                ['ts_code', 'trade_date'], kind='mergesort', ignore_index=True
+            )
+
+
+def get_daily_counts(start_date=None, end_date=None):
+    """
+    按交易日统计条目数：新鲜月份直接取manifest中的条目数（不读取数据文件），其余月份查询数据库
+
+    返回值：
+    ----------
+    dict
+        {trade_date(YYYYMMDD): 条目数}
+    """
+    if not start_date or not end_date:
+        engine = get_db_engine()
+        with engine.connect() as conn:
+            row = conn.execute(text("SELECT MIN(trade_date), MAX(trade_date) FROM cn_stock_daily")).fetchone()
+        if not row or row[0] is None:
+            return {}
+        start_date = start_date or to_yyyymmdd(row[0])
+        end_date = end_date or to_yyyymmdd(row[1])
+
+    fresh, stale = plan_months(start_date, end_date)
+    manifest = _load_manifest() if fresh else {}
+    counts = {}
+    for year_month, month_start, month_end in fresh:
+        for trade_date, info in manifest.get(year_month, {}).items():
+            if month_start <= trade_date <= month_end:
+                counts[trade_date] = info["rows"]
+
+    if stale:
+        engine = get_db_engine()
+        with engine.connect() as conn:
+            for _, month_start, month_end in stale:
+                rows = conn.execute(text("""
+                    SELECT trade_date, COUNT(*) FROM cn_stock_daily
+                    WHERE trade_date BETWEEN :start_date AND :end_date
+                    GROUP BY trade_date
+                """), {"start_date": month_start, "end_date": month_end}).fetchall()
+                counts.update({to_yyyymmdd(r[0]): r[1] for r in rows})
+    return counts
+
+
+def rebuild_from_db(start_date, end_date):
+    """
+    从数据库按月重建缓存分区（用于初始化或检查点出现之前入库的历史数据）
+    从月初开始重建的月份记为完整构建，之后日K线抽取才会向其追加交易日、读取时才会使用
+
+    返回值：
+    ----------
+    int
+        写入缓存的条目数
+    """
+    total = 0
+    for year_month, month_start, month_end in _month_ranges(start_date, end_date):
+        df = _read_db_range(month_start, month_end, CACHE_COLUMNS)
+        if df.empty:
+            continue
+        df['vol'] = df['vol'].fillna(0).astype('int64')
+        cached_at = datetime.now().isoformat(timespec='seconds')
+        with _cache_lock():
+            manifest = _load_manifest()
+            complete_months = manifest.setdefault(COMPLETE_MONTHS_KEY, [])
+            path = _partition_path(year_month)
+            if os.path.exists(path) and year_month in complete_months:
+                # 只替换本次重建覆盖的日期，保留分区中区间以外的交易日
+                existing = pq.read_table(path).to_pandas()
+                in_range = existing['trade_date'].between(pd.Timestamp(month_start), pd.Timestamp(month_end))
+                df = pd.concat([existing[~in_range], df], ignore_index=True)
+            elif month_start[6:] != '01':
+                # 未从月初重建且没有完整分区：月初至重建起始日之间的数据缺失，不写入分区
+                print(f"{year_month} 未从月初重建，跳过（请从 {year_month.replace('-', '')}01 开始重建）", flush=True)
+                continue
+            else:
+                # 原分区不完整（如旧版本只写入了部分交易日）：整体替换，清空旧的逐日记录
+                manifest[year_month] = {}
+            _write_partition(year_month, df)
+
+            # 重建区间内的逐日记录以本次读取为准（数据库中已不存在的交易日一并移除）
+            month_days = {d: info for d, info in manifest.get(year_month, {}).items()
+                          if not month_start <= d <= month_end}
+            manifest[year_month] = month_days
+            day_counts = df.groupby(df['trade_date'].dt.strftime('%Y%m%d')).size()
+            for trade_date, rows in day_counts.items():
+                if month_start <= trade_date <= month_end:
+                    month_days[trade_date] = {"rows": int(rows), "hash": None, "cached_at": cached_at}
+            if year_month not in complete_months:
+                complete_months.append(year_month)
+                complete_months.sort()
+            _save_manifest(manifest)
+        total += int(day_counts[(day_counts.index >= month_start) & (day_counts.index <= month_end)].sum())
+        print(f"{year_month} 已缓存，共 {len(df):,} 条记录", flush=True)
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='日线数据本地缓存维护')
+    parser.add_argument('--rebuild', action='store_true', help='从数据库重建指定区间的缓存分区')
+    parser.add_argument('--start_date', type=str, required=True, help='开始日期 (yyyymmdd)')
+    parser.add_argument('--end_date', type=str, required=True, help='结束日期 (yyyymmdd)')
+    args = parser.parse_args()
+
+    if args.rebuild:
+        rows = rebuild_from_db(args.start_date, args.end_date)
+        print(f"缓存重建完成，共 {rows:,} 条记录", flush=True)
+    else:
+        fresh, stale = plan_months(args.start_date, args.end_date)
+        print(f"可用缓存月份: {[m[0] for m in fresh]}", flush=True)
+        print(f"需回退数据库的月份: {[m[0] for m in stale]}", flush=True)
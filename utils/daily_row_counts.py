@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+按交易日预聚合的日线条目数（daily_row_counts）
+====================
+功能说明：
+1. daily_row_counts表保存cn_stock_daily每个交易日的条目数，日K线抽取每写入一天即在同一事务中更新
+2. 按月统计接口与Tushare校验只对汇总表做区间查询，月度汇总在SQL中完成，不再扫描cn_stock_daily
+3. 汇总表为空（首次部署）时自动从cn_stock_daily全量重建一次；也可通过命令行按区间重建
+
+用法：
+    python utils/daily_row_counts.py --rebuild                          # 全量重建
+    python utils/daily_row_counts.py --rebuild --start 20240101 --end 20241231
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+
+from sqlalchemy import text
+
+# 添加当前目录到系统路径，以便导入 db_utils
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from db_utils import get_db_engine
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.db_utils import get_db_engine
+
+# 日K线抽取在写入单日数据的事务中执行（DB-API游标，%s占位符）
+# 新交易日直接记为当日写入条目数；已有记录时累加本次新增的条目数
+UPSERT_DAY_SQL = """
+INSERT INTO daily_row_counts (trade_date, row_count, updated_at)
+VALUES (%s, %s, %s)
+ON DUPLICATE KEY UPDATE row_count = row_count + %s, updated_at = VALUES(updated_at)
+"""
+
+_table_ready = False
+
+
+def _create_table(conn):
+    """创建daily_row_counts表（如果不存在）"""
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS daily_row_counts (
+        trade_date VARCHAR(8) PRIMARY KEY COMMENT '交易日期(YYYYMMDD)',
+        row_count INT NOT NULL COMMENT 'cn_stock_daily中该交易日的条目数',
+        updated_at DATETIME NOT NULL COMMENT '更新时间'
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='日线条目数按交易日汇总'
+    """))
+
+
+def ensure_row_count_table():
+    """创建daily_row_counts表（如果不存在）；表为空时从cn_stock_daily全量重建，每个进程只执行一次"""
+    global _table_ready
+    if _table_ready:
+        return
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        _create_table(conn)
+        empty = conn.execute(text("SELECT 1 FROM daily_row_counts LIMIT 1")).fetchone() is None
+    if empty:
+        print("📊 daily_row_counts为空，从cn_stock_daily重建...", flush=True)
+        rebuild_row_counts()
+    _table_ready = True
+
+
+def rebuild_row_counts(start_date=None, end_date=None):
+    """
+    从cn_stock_daily按交易日重新统计条目数并写入汇总表
+
+    参数：
+        start_date/end_date: 日期区间（YYYYMMDD），为空时不限制
+    返回：
+        int: 重建的交易日数
+    """
+    conditions, params = [], {"updated_at": datetime.now()}
+    if start_date:
+        conditions.append("trade_date >= :start_date")
+        params["start_date"] = start_date
+    if end_date:
+        conditions.append("trade_date <= :end_date")
+        params["end_date"] = end_date
+    where_sql = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        _create_table(conn)
+        # 区间内已不存在的交易日（数据被删除）一并清理
+        conn.execute(text(f"DELETE FROM daily_row_counts {where_sql}"), params)
+        result = conn.execute(text(f"""
+            INSERT INTO daily_row_counts (trade_date, row_count, updated_at)
+            SELECT DATE_FORMAT(trade_date, '%Y%m%d'), COUNT(*), :updated_at FROM cn_stock_daily
+            {where_sql}
+            GROUP BY trade_date
+        """), params)
+        return result.rowcount
+
+
+def get_monthly_counts(start_date=None, end_date=None):
+    """
+    按月汇总日线条目数（区间查询汇总表，月度汇总在SQL中完成）
+
+    参数：
+        start_date/end_date: 日期区间（YYYYMMDD），为空时不限制
+    返回：
+        dict: {'YYYY-MM': 条目数}
+    """
+    ensure_row_count_table()
+    engine = get_db_engine()
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT SUBSTRING(trade_date, 1, 6) AS ym, SUM(row_count)
+            FROM daily_row_counts
+            WHERE trade_date BETWEEN :start_date AND :end_date
+            GROUP BY ym
+        """), {"start_date": start_date or "00000000", "end_date": end_date or "99999999"}).fetchall()
+    return {f"{row[0][:4]}-{row[0][4:6]}": int(row[1]) for row in rows}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='日线条目数汇总表维护')
+    parser.add_argument('--rebuild', action='store_true', help='从cn_stock_daily重建汇总表')
+    parser.add_argument('--start', help='开始日期 YYYYMMDD')
+    parser.add_argument('--end', help='结束日期 YYYYMMDD')
+    cli_args = parser.parse_args()
+
+    if cli_args.rebuild:
+        days = rebuild_row_counts(cli_args.start, cli_args.end)
+        print(f"✅ 已重建 {days} 个交易日的条目数", flush=True)
+    for year_month, count in sorted(get_monthly_counts(cli_args.start, cli_args.end).items()):
+        print(f"{year_month}  {count:>12,}", flush=True)
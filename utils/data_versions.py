@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+数据版本号（data_versions）
+====================
+功能说明：
+1. data_versions表按数据名称保存一个递增的版本号，写入方在修改数据的同一事务中把版本号加一
+2. 接口的进程内缓存把版本号作为缓存键的一部分：任何进程（其他API工作进程、选股常驻进程、命令行脚本）
+   写入后，所有进程的下一次请求都会读到新版本号而重新计算，无需等待缓存过期
+3. 读取版本号是一次主键查询，远小于被缓存的COUNT(*)等统计查询
+"""
+
+import os
+import sys
+from datetime import datetime
+
+from sqlalchemy import text
+
+# 添加当前目录到系统路径，以便导入 db_utils
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from db_utils import get_db_engine
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.db_utils import get_db_engine
+
+# 选股记录（stock_selected）的版本号名称
+STOCK_SELECTED = 'stock_selected'
+
+# 在写入数据的事务中执行（DB-API游标或exec_driver_sql，%s占位符）
+BUMP_VERSION_SQL = """
+INSERT INTO data_versions (name, version, updated_at)
+VALUES (%s, 1, %s)
+ON DUPLICATE KEY UPDATE version = version + 1, updated_at = VALUES(updated_at)
+"""
+
+GET_VERSION_SQL = "SELECT version FROM data_versions WHERE name = :name"
+
+_table_ready = False
+
+
+def ensure_data_version_table():
+    """创建data_versions表（如果不存在），每个进程只执行一次"""
+    global _table_ready
+    if _table_ready:
+        return
+    with get_db_engine().begin() as conn:
+        conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name VARCHAR(50) PRIMARY KEY COMMENT '数据名称',
+            version BIGINT NOT NULL COMMENT '版本号，数据每次变更加一',
+            updated_at DATETIME NOT NULL COMMENT '最近变更时间'
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='数据版本号（跨进程缓存失效）'
+        """))
+    _table_ready = True
+
+
+def bump_data_version(conn, name):
+    """
+    数据变更后把版本号加一（在写入数据的同一事务中调用，随事务一起提交或回滚）
+
+    参数：
+        conn: SQLAlchemy连接
+        name: 数据名称，如STOCK_SELECTED
+    """
+    ensure_data_version_table()
+    conn.exec_driver_sql(BUMP_VERSION_SQL, (name, datetime.now()))
@@ -1,4 +1,8 @@
 import os
+import atexit
+import queue
+import ssl
+import threading
 from sqlalchemy import create_engine, text
 from datetime import datetime
 import traceback
@@ -12,6 +16,9 @@ load_dotenv('.env.local')
 
 # 全局缓存的数据库引擎
 _cached_engine = None
+# 全局缓存的异步数据库引擎与会话工厂（FastAPI接口使用）
+_cached_async_engine = None
+_async_session_factory = None
 
 def get_config(key, default=None):
     """
@@ -34,8 +41,43 @@ def get_config(key, default=None):
         
     return default
 
-def get_db_engine():
-    """获取数据库连接引擎"""
+def get_int_config(key, default):
+    """
+    获取整数配置项，缺失或非法时返回默认值
+    """
+    try:
+        return int(get_config(key, default))
+    except (ValueError, TypeError):
+        return default
+
+def to_yyyymmdd(value):
+    """
+    数据库读出的交易日期统一为YYYYMMDD字符串（兼容迁移前的VARCHAR(8)与迁移后的DATE类型）
+    """
+    if value is None:
+        return None
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y%m%d')
+    return str(value).replace('-', '')
+
+# cn_stock_daily写入锁（MySQL/TiDB命名锁，会话级，不随事务提交或DDL释放）：
+# 日K线抽取的每个写入线程在写入单日数据期间持有其中一个槽位（多个写入线程仍可并行），
+# cn_stock_daily重建迁移在补复制增量与RENAME期间持有全部槽位
+DAILY_WRITE_LOCK_SLOTS = 8
+
+
+def daily_write_lock_name(slot):
+    """cn_stock_daily写入锁第slot个槽位的锁名"""
+    return f"cn_stock_daily_write_{slot % DAILY_WRITE_LOCK_SLOTS}"
+
+
+def _get_db_settings():
+    """
+    读取数据库连接配置
+
+    返回：
+        tuple: (不含驱动前缀的连接串 user:password@host:port/db_name, 数据库主机, CA证书路径)
+    """
     db_host = get_config('DB_HOST')
     db_port = get_config('DB_PORT', 3306)
     db_user = get_config('DB_USER')
@@ -57,10 +99,6 @@ def get_db_engine():
     if not ssl_ca:
         ssl_ca = certifi.where()
     
-    connect_args = {}
-    if db_host and 'tidbcloud' in db_host:
-        connect_args['ssl'] = {'ca': ssl_ca, 'check_hostname': False}
-    
     # 确保端口是整数
     try:
         db_port = int(db_port)
@@ -71,7 +109,18 @@ def get_db_engine():
     safe_user = urllib.parse.quote_plus(db_user)
     safe_password = urllib.parse.quote_plus(db_password)
         
-    url = f"mysql+pymysql://{safe_user}:{safe_password}@{db_host}:{db_port}/{db_name}"
+    return f"{safe_user}:{safe_password}@{db_host}:{db_port}/{db_name}", db_host, ssl_ca
+
+
+def get_db_engine():
+    """获取数据库连接引擎"""
+    db_address, db_host, ssl_ca = _get_db_settings()
+    
+    connect_args = {}
+    if db_host and 'tidbcloud' in db_host:
+        connect_args['ssl'] = {'ca': ssl_ca, 'check_hostname': False}
+    
+    url = f"mysql+pymysql://{db_address}"
     
     # 增加连接池配置，提高稳定性
     # 使用单例模式缓存 engine，避免每次创建新的连接池
@@ -88,6 +137,54 @@ def get_db_engine():
     return _cached_engine
 
 
+def get_async_engine():
+    """
+    获取异步数据库引擎（SQLAlchemy asyncio + aiomysql），供FastAPI接口在事件循环中直接查询，
+    并发请求数不再受线程池大小限制。引擎绑定首次创建时所在的事件循环。
+    """
+    global _cached_async_engine
+    if _cached_async_engine is not None:
+        return _cached_async_engine
+
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    db_address, db_host, ssl_ca = _get_db_settings()
+    connect_args = {}
+    if db_host and 'tidbcloud' in db_host:
+        ssl_context = ssl.create_default_context(cafile=ssl_ca)
+        ssl_context.check_hostname = False
+        connect_args['ssl'] = ssl_context
+
+    _cached_async_engine = create_async_engine(
+        f"mysql+aiomysql://{db_address}",
+        connect_args=connect_args,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        pool_size=get_int_config('ASYNC_DB_POOL_SIZE', 10),
+        max_overflow=get_int_config('ASYNC_DB_MAX_OVERFLOW', 20)
+    )
+    return _cached_async_engine
+
+
+async def get_async_session():
+    """FastAPI依赖：每个请求一个异步会话（共享异步连接池），请求结束时关闭"""
+    global _async_session_factory
+    if _async_session_factory is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        _async_session_factory = async_sessionmaker(get_async_engine(), expire_on_commit=False)
+    async with _async_session_factory() as session:
+        yield session
+
+
+async def dispose_async_engine():
+    """关闭异步连接池（服务停止时调用）"""
+    global _cached_async_engine, _async_session_factory
+    if _cached_async_engine is not None:
+        await _cached_async_engine.dispose()
+    _cached_async_engine = None
+    _async_session_factory = None
+
+
 def get_db_config_debug():
     """
     返回数据库配置的调试信息 (仅用于诊断 SSL 路径问题)
@@ -117,28 +214,96 @@ def get_db_config_debug():
     
     return debug_info
 
+class TaskLogWriter:
+    """
+    任务日志异步批量写入器
+    log_task_execution只把日志记录放入队列立即返回；后台线程按批（最多batch_size条，或等待flush_interval秒）
+    通过共享连接池一次写入多条。进程退出时（atexit）写完队列中剩余的日志。
+    """
+    def __init__(self, batch_size=50, flush_interval=0.5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+
+    def submit(self, record):
+        self._ensure_started()
+        self.queue.put(record)
+
+    def _ensure_started(self):
+        # fork出的子进程不会继承父进程的后台线程，按进程号判断是否需要重新启动
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+                return
+            self.queue = queue.Queue()
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self._run, name="task-log-writer", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            stop = batch[0] is None
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                else:
+                    batch.append(record)
+            records = [r for r in batch if r is not None]
+            if records:
+                self._write(records)
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                return
+
+    def _write(self, records):
+        try:
+            with get_db_engine().begin() as conn:
+                conn.execute(text("""
+                INSERT INTO task_logs (task_name, execute_time, status, message)
+                VALUES (:task_name, :execute_time, :status, :message)
+                """), records)
+        except Exception as e:
+            print(f"❌ 写入日志失败（{len(records)} 条）: {e}", flush=True)
+            traceback.print_exc()
+
+    def flush(self):
+        """阻塞直到队列中已提交的日志全部写入"""
+        if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+            self.queue.join()
+
+    def close(self):
+        """写完剩余日志并停止后台线程"""
+        if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+            self.queue.put(None)
+            self.thread.join()
+
+
+# 进程内共享的任务日志写入器
+_task_log_writer = TaskLogWriter()
+atexit.register(_task_log_writer.close)
+
+
 def log_task_execution(task_name, status, message=""):
-    """记录任务执行日志"""
-    engine = get_db_engine()
-    try:
-        with engine.connect() as conn:
-            # 截断过长的消息
-            if len(message) > 65535:
-                message = message[:65530] + "..."
-                
-            sql = text("""
-            INSERT INTO task_logs (task_name, execute_time, status, message)
-            VALUES (:task_name, :execute_time, :status, :message)
-            """)
-            conn.execute(sql, {
-                "task_name": task_name,
-                "execute_time": datetime.now(),
-                "status": status,
-                "message": message
-            })
-            conn.commit()
-    except Exception as e:
-        print(f"❌ 写入日志失败: {e}")
-        traceback.print_exc()
-    finally:
-        engine.dispose()
+    """记录任务执行日志（放入异步写入队列后立即返回，不占用调用方的数据库连接）"""
+    # 截断过长的消息
+    if len(message) > 65535:
+        message = message[:65530] + "..."
+    _task_log_writer.submit({
+        "task_name": task_name,
+        "execute_time": datetime.now(),
+        "status": status,
+        "message": message
+    })
+
+
+def flush_task_logs():
+    """等待已提交的任务日志全部写入数据库（需要立即读取刚写入的日志时调用）"""
+    _task_log_writer.flush()
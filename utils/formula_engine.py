@@ -0,0 +1,663 @@
+# -*- coding: utf-8 -*-
+"""
+通达信公式引擎
+====================
+功能说明：
+1. 将通达信风格的选股公式（REF/MA/SUM/HHV/LLV/COUNT/CROSS等）解析为语法树，参数代入后做常量折叠
+2. 语法树展开为按依赖排序的计算计划，每一步在整列NumPy数组上向量化求值（不逐只股票循环）
+3. 每个计算步骤以规范化表达式为键缓存在FormulaContext中：同一份数据上运行多个公式时，
+   相同的子表达式（如REF(CLOSE,3)）只计算一次
+4. select_formulas表按名称保存公式，API可以按名称运行任意已保存的策略
+
+公式语法：
+- 行情序列：CLOSE/C、OPEN/O、HIGH/H、LOW/L、VOL/V、AMOUNT/AMO
+- 运算符：+ - * /，比较 > < >= <= = <>（!=），逻辑 AND/OR/NOT（&&/||）
+- 语句以分号分隔：NAME:=表达式 定义中间变量；XG:表达式 为选股输出（无XG时取最后一条语句）
+- 参数（如D1）以大写名称出现在公式中，运行时代入数值；{...}为注释
+
+窗口类函数（MA/SUM/HHV/LLV/COUNT/EVERY/EXIST/STD）在单只股票数据不足N个bar时结果为空值，
+空值参与的比较结果均为False，与pandas逐组计算的行为一致。
+"""
+
+import json
+import operator
+import os
+import re
+import sys
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from sqlalchemy import text
+
+# 添加当前目录到系统路径，以便导入 db_utils
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from db_utils import get_db_engine
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.db_utils import get_db_engine
+
+# 内置默认公式：与原select_stocks中硬编码的四个条件逐项对应，阈值作为参数便于参数扫描
+DEFAULT_FORMULA_NAME = 'tdx_shrink_after_surge'
+DEFAULT_FORMULA = """
+{条件1：当日涨幅8%以上}
+COND1:=REF(C,D1+3)/REF(C,D1+4)>GAIN;
+{条件2：成交量逐日递减}
+COND2:=REF(V,D1+0)*DECAY<REF(V,D1+3) AND REF(V,D1+1)*DECAY<REF(V,D1+2) AND REF(V,D1+2)*DECAY<REF(V,D1+3);
+{条件3：三天前放量}
+COND3:=REF(V,D1+3)>=SPIKE*REF(V,D1+4);
+{条件4：最低价递增}
+AVGP:=(REF(L,D1+3)+REF(C,D1+3))/2;
+COND4:=REF(L,D1+0)>AVGP AND REF(L,D1+1)>AVGP AND REF(L,D1+2)>AVGP;
+XG:COND1 AND COND2 AND COND3 AND COND4;
+"""
+# GAIN: 大阳线涨幅阈值；DECAY: 逐日缩量系数；SPIKE: 放量倍数
+DEFAULT_PARAMS = {'D1': 0, 'GAIN': 1.08, 'DECAY': 1.1, 'SPIKE': 1.5}
+
+# 行情序列名称 -> cn_stock_daily字段
+SERIES_COLUMNS = {
+    'CLOSE': 'price_close', 'C': 'price_close',
+    'OPEN': 'price_open', 'O': 'price_open',
+    'HIGH': 'price_high', 'H': 'price_high',
+    'LOW': 'price_low', 'L': 'price_low',
+    'VOL': 'vol', 'V': 'vol',
+    'AMOUNT': 'amount', 'AMO': 'amount',
+}
+
+# 函数名 -> 参数个数；WINDOW_FUNCTIONS的第二个参数为窗口长度（须为常量）
+FUNCTION_ARITY = {
+    'REF': 2, 'MA': 2, 'SUM': 2, 'HHV': 2, 'LLV': 2, 'STD': 2,
+    'COUNT': 2, 'EVERY': 2, 'EXIST': 2, 'CROSS': 2,
+    'ABS': 1, 'MAX': 2, 'MIN': 2, 'IF': 3,
+}
+WINDOW_FUNCTIONS = {'MA', 'SUM', 'HHV', 'LLV', 'STD', 'COUNT', 'EVERY', 'EXIST'}
+
+COMPARE_OPS = {'>': operator.gt, '<': operator.lt, '>=': operator.ge, '<=': operator.le,
+               '=': operator.eq, '<>': operator.ne}
+ARITH_OPS = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv}
+
+_TOKEN_RE = re.compile(r"\s*(?:(\d+\.?\d*|\.\d+)|([A-Za-z_][A-Za-z0-9_]*)|(:=|>=|<=|<>|!=|&&|\|\||[-+*/(),;:<>=]))")
+
+
+class FormulaError(ValueError):
+    """公式语法错误或无法求值"""
+
+
+# ========================== 语法树 ==========================
+class Node:
+    """
+    语法树节点
+
+    op取值：'num'（常量）、'series'（行情序列）、'call'（函数调用）、
+    二元运算符（+ - * / 比较 AND OR）、'neg'、'NOT'
+    key为规范化表达式字符串，作为计算缓存的键
+    """
+    __slots__ = ('op', 'args', 'value', 'key')
+
+    def __init__(self, op, args=(), value=None):
+        self.op = op
+        self.args = tuple(args)
+        self.value = value
+        if op == 'num':
+            self.key = repr(float(value))
+        elif op == 'series':
+            self.key = value
+        elif op == 'call':
+            self.key = f"{value}({','.join(a.key for a in self.args)})"
+        elif op in ('neg', 'NOT'):
+            self.key = f"{op}({self.args[0].key})"
+        else:
+            self.key = f"({self.args[0].key}{op}{self.args[1].key})"
+
+
+def _tokenize(formula_text):
+    source = re.sub(r"\{[^}]*\}", " ", formula_text)
+    tokens, pos = [], 0
+    while pos < len(source):
+        if source[pos:].strip() == '':
+            break
+        match = _TOKEN_RE.match(source, pos)
+        if not match:
+            raise FormulaError(f"无法识别的字符: {source[pos:].strip()[:10]}")
+        number, name, symbol = match.groups()
+        if number is not None:
+            tokens.append(('num', float(number)))
+        elif name is not None:
+            tokens.append(('name', name.upper()))
+        else:
+            symbol = {'!=': '<>', '&&': 'AND', '||': 'OR'}.get(symbol, symbol)
+            tokens.append(('op', symbol))
+        pos = match.end()
+    return tokens
+
+
+def _fold(op, args):
+    """参数均为常量时直接算出结果（常量折叠），使REF(C,D1+3)在D1=0时与REF(C,3)共用缓存"""
+    if all(a.op == 'num' for a in args):
+        values = [a.value for a in args]
+        if op == 'neg':
+            return Node('num', value=-values[0])
+        if op in ARITH_OPS and not (op == '/' and values[1] == 0):
+            return Node('num', value=ARITH_OPS[op](*values))
+    return Node(op, args)
+
+
+class _Parser:
+    """递归下降解析器：语句列表 -> 输出表达式的语法树（中间变量与参数已代入）"""
+
+    def __init__(self, tokens, params):
+        self.tokens = tokens
+        self.pos = 0
+        self.params = params
+        self.variables = {}
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, kind=None, value=None):
+        token = self.peek()
+        if token[0] is None or (kind and token[0] != kind) or (value and token[1] != value):
+            expected = value or kind or '表达式'
+            raise FormulaError(f"公式语法错误：期望 {expected}，实际为 {token[1] if token[0] else '公式结尾'}")
+        self.pos += 1
+        return token
+
+    def parse(self):
+        output = None
+        last = None
+        while self.peek()[0] is not None:
+            if self.peek() == ('op', ';'):
+                self.pos += 1
+                continue
+            kind, name = self.peek()
+            next_token = self.tokens[self.pos + 1] if self.pos + 1 < len(self.tokens) else (None, None)
+            if kind == 'name' and next_token in (('op', ':='), ('op', ':')):
+                self.pos += 2
+                node = self.parse_or()
+                self.variables[name] = node
+                if next_token == ('op', ':') and name == 'XG':
+                    output = node
+            else:
+                node = self.parse_or()
+            last = node
+            if self.peek()[0] is not None:
+                self.take('op', ';')
+        if last is None:
+            raise FormulaError("公式为空")
+        return output if output is not None else last
+
+    def parse_binary(self, next_level, ops):
+        node = next_level()
+        # AND/OR/NOT既可以是单词（name）也可以由&&/||转换而来（op）
+        while self.peek()[0] in ('op', 'name') and self.peek()[1] in ops:
+            op = self.take()[1]
+            node = _fold(op, (node, next_level()))
+        return node
+
+    def parse_or(self):
+        return self.parse_binary(self.parse_and, {'OR'})
+
+    def parse_and(self):
+        return self.parse_binary(self.parse_not, {'AND'})
+
+    def parse_not(self):
+        # NOT的优先级低于比较运算：NOT C>O 等价于 NOT (C>O)
+        if self.peek() == ('name', 'NOT'):
+            self.pos += 1
+            return Node('NOT', (self.parse_not(),))
+        return self.parse_compare()
+
+    def parse_compare(self):
+        return self.parse_binary(self.parse_add, COMPARE_OPS)
+
+    def parse_add(self):
+        return self.parse_binary(self.parse_mul, {'+', '-'})
+
+    def parse_mul(self):
+        return self.parse_binary(self.parse_unary, {'*', '/'})
+
+    def parse_unary(self):
+        if self.peek() == ('op', '-'):
+            self.pos += 1
+            return _fold('neg', (self.parse_unary(),))
+        if self.peek() == ('op', '+'):
+            self.pos += 1
+            return self.parse_unary()
+        return self.parse_primary()
+
+    def parse_primary(self):
+        kind, value = self.take()
+        if kind == 'num':
+            return Node('num', value=value)
+        if kind == 'op' and value == '(':
+            node = self.parse_or()
+            self.take('op', ')')
+            return node
+        if kind != 'name':
+            raise FormulaError(f"公式语法错误：意外的符号 {value}")
+        if self.peek() == ('op', '('):
+            return self.parse_call(value)
+        if value in self.variables:
+            return self.variables[value]
+        if value in self.params:
+            return Node('num', value=float(self.params[value]))
+        if value in SERIES_COLUMNS:
+            return Node('series', value=SERIES_COLUMNS[value])
+        raise FormulaError(f"未定义的变量或参数: {value}")
+
+    def parse_call(self, name):
+        if name not in FUNCTION_ARITY:
+            raise FormulaError(f"不支持的函数: {name}")
+        self.take('op', '(')
+        args = [self.parse_or()]
+        while self.peek() == ('op', ','):
+            self.pos += 1
+            args.append(self.parse_or())
+        self.take('op', ')')
+        if len(args) != FUNCTION_ARITY[name]:
+            raise FormulaError(f"函数 {name} 需要 {FUNCTION_ARITY[name]} 个参数，实际为 {len(args)} 个")
+        if name == 'REF' or name in WINDOW_FUNCTIONS:
+            period = args[1]
+            if period.op != 'num' or period.value != int(period.value) or period.value < 0:
+                raise FormulaError(f"函数 {name} 的周期参数须为非负整数常量")
+            if name in WINDOW_FUNCTIONS and period.value < 1:
+                raise FormulaError(f"函数 {name} 的周期参数须大于0")
+            args[1] = Node('num', value=float(int(period.value)))
+        return Node('call', args, value=name)
+
+
+# ========================== 编译结果与计算计划 ==========================
+class CompiledFormula:
+    """
+    编译后的公式
+
+    属性：
+        root: 输出表达式的语法树
+        plan: 按依赖顺序排列、去重后的计算步骤（子表达式节点列表，最后一步为输出）
+        lookback: 计算最新一个bar的结果所需的历史bar数量（增量选股回看窗口）
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.plan = []
+        seen = set()
+        self._collect(root, seen)
+        self.lookback = self._lookback(root)
+
+    def _collect(self, node, seen):
+        if node.key in seen or node.op == 'num':
+            return
+        for arg in node.args:
+            self._collect(arg, seen)
+        seen.add(node.key)
+        self.plan.append(node)
+
+    def _lookback(self, node):
+        if node.op in ('num', 'series'):
+            return 0
+        inner = max(self._lookback(arg) for arg in node.args)
+        if node.op == 'call':
+            if node.value == 'REF':
+                return self._lookback(node.args[0]) + int(node.args[1].value)
+            if node.value in WINDOW_FUNCTIONS:
+                return self._lookback(node.args[0]) + int(node.args[1].value) - 1
+            if node.value == 'CROSS':
+                return inner + 1
+        return inner
+
+    @property
+    def columns(self):
+        """公式用到的cn_stock_daily字段"""
+        return sorted({node.value for node in self.plan if node.op == 'series'})
+
+
+@lru_cache(maxsize=256)
+def _compile_cached(formula_text, params_items):
+    return CompiledFormula(_Parser(_tokenize(formula_text), dict(params_items)).parse())
+
+
+def compile_formula(formula_text, params=None):
+    """
+    解析公式并代入参数，返回CompiledFormula（相同公式与参数的编译结果会被缓存）
+
+    参数说明：
+    ----------
+    formula_text : str
+        通达信风格的公式文本
+    params : dict, 可选
+        参数名到数值的映射（参数名不区分大小写），如 {'D1': 0}
+
+    异常：
+    ----------
+    FormulaError: 公式语法错误、函数或参数未定义
+    """
+    params_items = tuple(sorted((str(k).upper(), float(v)) for k, v in (params or {}).items()))
+    return _compile_cached(formula_text, params_items)
+
+
+# ========================== 向量化求值 ==========================
+def ref_array(values, group_codes, n):
+    """
+    向量化的通达信REF函数：在按(ts_code, trade_date)排好序的整列数组上取N个bar之前的值
+
+    参数说明：
+    ----------
+    values : numpy.ndarray
+        已按股票代码、交易日期排序的整列数值（float64）
+    group_codes : numpy.ndarray
+        每一行所属股票的整数编码（与values等长）
+    n : int
+        滞后的bar数量，等价于按股票分组后的shift(n)
+
+    返回值：
+    ----------
+    numpy.ndarray
+        滞后值数组，跨越股票边界或数据不足的位置为NaN
+    """
+    if n == 0:
+        return values
+    shifted = np.full(values.shape, np.nan)
+    if abs(n) >= len(values):
+        return shifted
+    if n > 0:
+        shifted[n:] = values[:-n]
+        # 取到的若是另一只股票的数据（本股票内不足n个bar），置为NaN
+        shifted[n:][group_codes[n:] != group_codes[:-n]] = np.nan
+    else:
+        # n为负数时向后取值（与shift(n)一致）
+        shifted[:n] = values[-n:]
+        shifted[:n][group_codes[:n] != group_codes[-n:]] = np.nan
+    return shifted
+
+
+def _as_float(values):
+    return values.astype('float64') if values.dtype == bool else values
+
+
+def _as_bool(values):
+    if isinstance(values, np.ndarray) and values.dtype == bool:
+        return values
+    return np.nan_to_num(values, nan=0.0) != 0
+
+
+class FormulaContext:
+    """
+    一份日线数据上的公式求值上下文
+
+    构造时对数据整表排序一次；所有公式的计算步骤结果按规范化表达式缓存在cache中，
+    同一上下文内重复出现的子表达式只计算一次。
+
+    参数说明：
+    ----------
+    df : pandas.DataFrame
+        日线数据（load_stock_data的返回值，或compact_stock_frame格式的分块）
+    """
+
+    def __init__(self, df):
+        self.data = df.sort_values(['ts_code', 'trade_date'], kind='mergesort').reset_index(drop=True)
+        # 每行所属股票的整数编码，用于判断滞后取值是否跨越了股票边界
+        self.group_codes = pd.factorize(self.data['ts_code'])[0]
+        index = np.arange(len(self.data))
+        is_start = np.ones(len(self.data), dtype=bool)
+        is_start[1:] = self.group_codes[1:] != self.group_codes[:-1]
+        # 每行在本股票内的序号（0开始），窗口类函数据此判断数据是否足够
+        self.group_pos = index - np.maximum.accumulate(np.where(is_start, index, 0))
+        self.cache = {}
+
+    def __len__(self):
+        return len(self.data)
+
+    def evaluate(self, formula):
+        """
+        按计算计划求值，返回与self.data逐行对应的布尔数组（命中为True）
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for node in formula.plan:
+                if node.key not in self.cache:
+                    self.cache[node.key] = self._compute(node)
+        if formula.root.op == 'num':
+            return np.full(len(self.data), bool(formula.root.value))
+        return _as_bool(self.cache[formula.root.key])
+
+    def _arg(self, node):
+        return node.value if node.op == 'num' else self.cache[node.key]
+
+    def _window(self, values, n, reducer):
+        out = np.full(len(values), np.nan)
+        if n > len(values):
+            return out
+        out[n - 1:] = reducer(sliding_window_view(values, n), axis=1)
+        out[self.group_pos < n - 1] = np.nan
+        return out
+
+    def _compute(self, node):
+        op = node.op
+        if op == 'series':
+            if node.value not in self.data.columns:
+                raise FormulaError(f"数据缺少字段: {node.value}")
+            return self.data[node.value].to_numpy(dtype='float64')
+        args = [self._arg(a) for a in node.args]
+        if op == 'neg':
+            return -_as_float(args[0])
+        if op == 'NOT':
+            return ~_as_bool(args[0])
+        if op in ('AND', 'OR'):
+            left, right = _as_bool(args[0]), _as_bool(args[1])
+            return (left & right) if op == 'AND' else (left | right)
+        if op in ARITH_OPS or op in COMPARE_OPS:
+            left = _as_float(args[0]) if isinstance(args[0], np.ndarray) else args[0]
+            right = _as_float(args[1]) if isinstance(args[1], np.ndarray) else args[1]
+            if op in ARITH_OPS:
+                result = ARITH_OPS[op](left, right)
+            elif op == '<>':
+                # 空值参与的比较结果均为False
+                result = (left != right) & ~np.isnan(left - right)
+            else:
+                result = COMPARE_OPS[op](left, right)
+            if np.ndim(result) == 0:
+                return np.full(len(self.data), result)
+            return result
+        return self._call(node.value, node.args, args)
+
+    def _call(self, name, nodes, args):
+        n = len(self.data)
+        values = args[0]
+        if not isinstance(values, np.ndarray):
+            values = np.full(n, float(values))
+        if name == 'REF':
+            return ref_array(_as_float(values), self.group_codes, int(args[1]))
+        if name in WINDOW_FUNCTIONS:
+            period = int(args[1])
+            if name in ('COUNT', 'EVERY', 'EXIST'):
+                counts = self._window(_as_bool(values).astype('float64'), period, np.sum)
+                if name == 'COUNT':
+                    return counts
+                return counts == period if name == 'EVERY' else counts > 0
+            values = _as_float(values)
+            if name == 'SUM':
+                return self._window(values, period, np.sum)
+            if name == 'MA':
+                return self._window(values, period, np.sum) / period
+            if name == 'HHV':
+                return self._window(values, period, np.max)
+            if name == 'LLV':
+                return self._window(values, period, np.min)
+            # STD：样本标准差，用窗口和与平方和计算，避免生成N倍大小的中间数组
+            if period < 2:
+                return np.full(n, np.nan)
+            total = self._window(values, period, np.sum)
+            total_sq = self._window(values * values, period, np.sum)
+            return np.sqrt(np.maximum(total_sq - total * total / period, 0) / (period - 1))
+        if name == 'CROSS':
+            left = _as_float(values)
+            right = args[1] if isinstance(args[1], np.ndarray) else np.full(n, float(args[1]))
+            right = _as_float(right)
+            prev_left = ref_array(left, self.group_codes, 1)
+            prev_right = ref_array(right, self.group_codes, 1)
+            return (left > right) & (prev_left <= prev_right)
+        if name == 'ABS':
+            return np.abs(_as_float(values))
+        if name in ('MAX', 'MIN'):
+            other = args[1] if isinstance(args[1], np.ndarray) else np.full(n, float(args[1]))
+            func = np.maximum if name == 'MAX' else np.minimum
+            return func(_as_float(values), _as_float(other))
+        if name == 'IF':
+            a = args[1] if isinstance(args[1], np.ndarray) else np.full(n, float(args[1]))
+            b = args[2] if isinstance(args[2], np.ndarray) else np.full(n, float(args[2]))
+            return np.where(_as_bool(values), _as_float(a), _as_float(b))
+        raise FormulaError(f"不支持的函数: {name}")
+
+
+def evaluate_formulas(df, formulas):
+    """
+    在同一份数据上一次性运行多个公式（共享排序结果与子表达式缓存）
+
+    参数说明：
+    ----------
+    df : pandas.DataFrame
+        日线数据
+    formulas : dict
+        公式名称 -> CompiledFormula
+
+    返回值：
+    ----------
+    tuple
+        (FormulaContext, {公式名称: 布尔命中数组})，命中数组与context.data逐行对应
+    """
+    context = FormulaContext(df)
+    return context, {name: context.evaluate(formula) for name, formula in formulas.items()}
+
+
+# ========================== 公式存储（select_formulas表） ==========================
+def ensure_formula_table(conn):
+    """创建选股公式表（如果不存在）"""
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS select_formulas (
+        formula_name VARCHAR(50) NOT NULL PRIMARY KEY COMMENT '公式名称',
+        formula_text TEXT NOT NULL COMMENT '通达信公式文本',
+        params VARCHAR(255) COMMENT '默认参数(JSON)',
+        description VARCHAR(255) COMMENT '公式说明',
+        created_at DATETIME NOT NULL COMMENT '创建时间',
+        updated_at DATETIME NOT NULL COMMENT '更新时间'
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """))
+
+
+def _default_formula():
+    return {
+        "formula_name": DEFAULT_FORMULA_NAME,
+        "formula_text": DEFAULT_FORMULA.strip(),
+        "params": dict(DEFAULT_PARAMS),
+        "description": "内置：大阳线后缩量回调（原硬编码选股条件）",
+        "builtin": True,
+    }
+
+
+def _row_to_formula(row):
+    formula = dict(row)
+    formula["params"] = json.loads(formula["params"]) if formula.get("params") else {}
+    for col in ("created_at", "updated_at"):
+        if formula.get(col):
+            formula[col] = formula[col].isoformat()
+    formula["builtin"] = False
+    return formula
+
+
+def list_formulas():
+    """列出所有已保存的公式（内置默认公式未被覆盖时一并列出）"""
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        ensure_formula_table(conn)
+        rows = conn.execute(text("""
+            SELECT formula_name, formula_text, params, description, created_at, updated_at
+            FROM select_formulas ORDER BY formula_name
+        """)).mappings().fetchall()
+    formulas = [_row_to_formula(row) for row in rows]
+    if DEFAULT_FORMULA_NAME not in {f["formula_name"] for f in formulas}:
+        formulas.insert(0, _default_formula())
+    return formulas
+
+
+def get_formula(formula_name=None):
+    """
+    按名称读取公式，名称为空或为内置公式名且未被覆盖时返回内置默认公式
+
+    返回值：
+    ----------
+    dict: formula_name / formula_text / params / description / builtin，不存在时返回None
+    """
+    formula_name = formula_name or DEFAULT_FORMULA_NAME
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        ensure_formula_table(conn)
+        row = conn.execute(text("""
+            SELECT formula_name, formula_text, params, description, created_at, updated_at
+            FROM select_formulas WHERE formula_name = :formula_name
+        """), {"formula_name": formula_name}).mappings().fetchone()
+    if row:
+        return _row_to_formula(row)
+    if formula_name == DEFAULT_FORMULA_NAME:
+        return _default_formula()
+    return None
+
+
+def save_formula(formula_name, formula_text, params=None, description=''):
+    """
+    保存（新增或覆盖）公式，保存前先编译校验；公式文本变化时清除该公式的增量评估进度
+
+    异常：
+    ----------
+    FormulaError: 公式无法编译
+    """
+    params = {str(k).upper(): v for k, v in (params or {}).items()}
+    compile_formula(formula_text, {**DEFAULT_PARAMS, **params})
+    now = datetime.now()
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        ensure_formula_table(conn)
+        previous = conn.execute(text("SELECT formula_text FROM select_formulas WHERE formula_name = :formula_name"),
+                                {"formula_name": formula_name}).fetchone()
+        conn.execute(text("""
+            INSERT INTO select_formulas (formula_name, formula_text, params, description, created_at, updated_at)
+            VALUES (:formula_name, :formula_text, :params, :description, :now, :now)
+            ON DUPLICATE KEY UPDATE formula_text = VALUES(formula_text), params = VALUES(params),
+                description = VALUES(description), updated_at = VALUES(updated_at)
+        """), {
+            "formula_name": formula_name,
+            "formula_text": formula_text,
+            "params": json.dumps(params, sort_keys=True),
+            "description": description,
+            "now": now
+        })
+    if previous is None or previous[0] != formula_text:
+        _reset_progress(formula_name)
+    return get_formula(formula_name)
+
+
+def delete_formula(formula_name):
+    """删除已保存的公式，返回是否删除成功（内置公式被删除后恢复为内置版本）"""
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        ensure_formula_table(conn)
+        deleted = conn.execute(text("DELETE FROM select_formulas WHERE formula_name = :formula_name"),
+                               {"formula_name": formula_name}).rowcount
+    if deleted:
+        _reset_progress(formula_name)
+    return bool(deleted)
+
+
+def _reset_progress(formula_name):
+    """公式内容变化后，此前的增量评估结果不再有效"""
+    try:
+        with get_db_engine().begin() as conn:
+            conn.execute(text("DELETE FROM stock_select_progress WHERE formula_name = :formula_name"),
+                         {"formula_name": formula_name})
+    except Exception as e:
+        # 进度表尚未创建（从未运行过增量选股）时无需清理
+        print(f"⚠️ 清除公式 {formula_name} 的增量选股进度失败: {e}", flush=True)
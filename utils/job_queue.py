@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+后台任务队列（数据库持久化）
+====================
+功能说明：
+1. task_jobs表保存所有ETL任务（日K线抽取、股票名称抽取、Tushare校验、选股）的排队与执行状态
+2. 相同任务类型+相同参数的任务在排队或执行中时不重复入队，直接复用已有任务
+3. 通过带状态条件的UPDATE原子地领取任务，并按任务类型统计执行中的数量以实现并发上限；
+   入队与领取先以SELECT ... FOR UPDATE锁定task_job_locks中该任务类型的行，多个服务实例的
+   去重检查与并发计数因此串行执行，不会同时读到"执行中0个"而各自领取一个日K线抽取任务
+4. 执行中的任务定期写入心跳；服务重启后，心跳超时的任务自动退回排队状态重新执行
+
+任务状态：PENDING（排队）/ RUNNING（执行中）/ SUCCESS / FAIL / CANCELLED
+"""
+
+import json
+import os
+import socket
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, text
+
+# 添加当前目录到系统路径，以便导入 db_utils
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from db_utils import get_db_engine
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.db_utils import get_db_engine
+
+# 心跳超时时间：超过该时间未更新心跳的执行中任务视为已中断
+HEARTBEAT_TIMEOUT_SECONDS = 120
+
+# 当前进程标识（主机名:进程号），记录任务由哪个服务实例执行
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_table_ready = False
+
+
+def ensure_job_table():
+    """创建task_jobs表（如果不存在），每个进程只执行一次"""
+    global _table_ready
+    if _table_ready:
+        return
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS task_jobs (
+            job_id VARCHAR(40) PRIMARY KEY COMMENT '任务ID',
+            task_type VARCHAR(30) NOT NULL COMMENT '任务类型',
+            dedup_key VARCHAR(255) NOT NULL COMMENT '去重键(任务类型+参数)',
+            params TEXT COMMENT '任务参数(JSON)',
+            status VARCHAR(20) NOT NULL COMMENT '状态: PENDING/RUNNING/SUCCESS/FAIL/CANCELLED',
+            worker_id VARCHAR(100) COMMENT '执行实例',
+            result TEXT COMMENT '执行结果(JSON)',
+            created_at DATETIME NOT NULL COMMENT '入队时间',
+            started_at DATETIME COMMENT '开始时间',
+            heartbeat_at DATETIME COMMENT '最近心跳',
+            finished_at DATETIME COMMENT '结束时间',
+            INDEX idx_status_type (status, task_type, created_at),
+            INDEX idx_dedup (dedup_key, status)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """))
+        conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS task_job_locks (
+            task_type VARCHAR(30) PRIMARY KEY COMMENT '任务类型（每种类型一行，入队/领取时加行锁）'
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """))
+    _table_ready = True
+
+
+_lock_rows = set()
+
+
+def _lock_task_types(conn, task_types):
+    """
+    在当前事务中锁定任务类型的锁行（按类型名排序加锁，避免死锁），事务结束时释放
+
+    锁行首次使用时在独立事务中插入；之后在锁内的读取均使用FOR UPDATE（读取最新已提交数据）
+    """
+    task_types = sorted(set(task_types))
+    missing = [t for t in task_types if t not in _lock_rows]
+    if missing:
+        with get_db_engine().begin() as lock_conn:
+            for task_type in missing:
+                lock_conn.execute(text("INSERT IGNORE INTO task_job_locks (task_type) VALUES (:task_type)"),
+                                  {"task_type": task_type})
+        _lock_rows.update(missing)
+    conn.execute(
+        text("SELECT task_type FROM task_job_locks WHERE task_type IN :task_types ORDER BY task_type FOR UPDATE")
+        .bindparams(bindparam("task_types", expanding=True)),
+        {"task_types": task_types}
+    ).fetchall()
+
+
+def make_dedup_key(task_type, params):
+    """任务类型+规范化参数JSON，作为相同任务的判定依据"""
+    key = f"{task_type}:{json.dumps(params or {}, sort_keys=True, ensure_ascii=False)}"
+    return key[:255]
+
+
+def _row_to_job(row):
+    """将数据库行转换为任务字典"""
+    job = dict(row)
+    job["params"] = json.loads(job["params"]) if job.get("params") else {}
+    job["result"] = json.loads(job["result"]) if job.get("result") else None
+    for col in ("created_at", "started_at", "heartbeat_at", "finished_at"):
+        if job.get(col):
+            job[col] = job[col].isoformat()
+    return job
+
+
+def enqueue_job(task_type, params=None):
+    """
+    任务入队；若相同任务已在排队或执行中，则直接返回已有任务
+
+    返回值：
+    ----------
+    tuple: (job_id, 是否为新建任务)
+    """
+    ensure_job_table()
+    params = params or {}
+    dedup_key = make_dedup_key(task_type, params)
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        # 同类型的入队串行执行，避免两个实例同时通过去重检查
+        _lock_task_types(conn, [task_type])
+        existing = conn.execute(text("""
+            SELECT job_id FROM task_jobs
+            WHERE dedup_key = :dedup_key AND status IN ('PENDING', 'RUNNING')
+            ORDER BY created_at
+            LIMIT 1
+            FOR UPDATE
+        """), {"dedup_key": dedup_key}).fetchone()
+        if existing:
+            return existing[0], False
+
+        job_id = f"{task_type}_{uuid.uuid4().hex[:8]}"
+        conn.execute(text("""
+            INSERT INTO task_jobs (job_id, task_type, dedup_key, params, status, created_at)
+            VALUES (:job_id, :task_type, :dedup_key, :params, 'PENDING', :created_at)
+        """), {
+            "job_id": job_id,
+            "task_type": task_type,
+            "dedup_key": dedup_key,
+            "params": json.dumps(params, ensure_ascii=False),
+            "created_at": datetime.now()
+        })
+    return job_id, True
+
+
+def get_job(job_id):
+    """获取单个任务，不存在时返回None"""
+    ensure_job_table()
+    engine = get_db_engine()
+    with engine.connect() as conn:
+        row = conn.execute(
+            text("SELECT * FROM task_jobs WHERE job_id = :job_id"), {"job_id": job_id}
+        ).mappings().fetchone()
+    return _row_to_job(row) if row else None
+
+
+def list_jobs(status=None, task_type=None, limit=50):
+    """按入队时间倒序列出任务"""
+    ensure_job_table()
+    where_conditions = []
+    params = {"limit": limit}
+    if status:
+        where_conditions.append("status = :status")
+        params["status"] = status
+    if task_type:
+        where_conditions.append("task_type = :task_type")
+        params["task_type"] = task_type
+    where_clause = " WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+
+    engine = get_db_engine()
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"""
+            SELECT * FROM task_jobs
+            {where_clause}
+            ORDER BY created_at DESC
+            LIMIT :limit
+        """), params).mappings().all()
+    return [_row_to_job(row) for row in rows]
+
+
+def claim_next_jobs(concurrency_limits):
+    """
+    按任务类型的并发上限领取排队中的任务（先入先出）
+
+    参数：
+        concurrency_limits: {任务类型: 最大并发数}
+    返回：
+        list[dict]: 本实例成功领取（已置为RUNNING）的任务
+    """
+    ensure_job_table()
+    claimed = []
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        pending_types = [row[0] for row in conn.execute(text(
+            "SELECT DISTINCT task_type FROM task_jobs WHERE status = 'PENDING'"
+        )).fetchall()]
+        if not pending_types:
+            return claimed
+        # 锁定这些类型后再统计执行中的数量：其他实例的领取须等待本事务提交，计数不会过期
+        _lock_task_types(conn, pending_types)
+        running = {}
+        for row in conn.execute(
+            text("SELECT task_type FROM task_jobs WHERE status = 'RUNNING' AND task_type IN :task_types FOR UPDATE")
+            .bindparams(bindparam("task_types", expanding=True)),
+            {"task_types": pending_types}
+        ).fetchall():
+            running[row[0]] = running.get(row[0], 0) + 1
+        pending = conn.execute(text("""
+            SELECT * FROM task_jobs
+            WHERE status = 'PENDING'
+            ORDER BY created_at
+            FOR UPDATE
+        """)).mappings().all()
+
+        now = datetime.now()
+        for row in pending:
+            task_type = row["task_type"]
+            limit = concurrency_limits.get(task_type, 1)
+            if running.get(task_type, 0) >= limit:
+                continue
+            # 带状态条件的UPDATE再确认一次任务仍在排队（例如已被取消）
+            result = conn.execute(text("""
+                UPDATE task_jobs
+                SET status = 'RUNNING', worker_id = :worker_id, started_at = :now, heartbeat_at = :now
+                WHERE job_id = :job_id AND status = 'PENDING'
+            """), {"worker_id": WORKER_ID, "now": now, "job_id": row["job_id"]})
+            if result.rowcount == 1:
+                running[task_type] = running.get(task_type, 0) + 1
+                job = _row_to_job(row)
+                job["status"] = "RUNNING"
+                claimed.append(job)
+    return claimed
+
+
+def heartbeat_jobs(job_ids):
+    """为本实例执行中的任务写入心跳"""
+    if not job_ids:
+        return
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        conn.execute(
+            text("UPDATE task_jobs SET heartbeat_at = :now WHERE job_id IN :job_ids AND status = 'RUNNING'")
+            .bindparams(bindparam("job_ids", expanding=True)),
+            {"now": datetime.now(), "job_ids": list(job_ids)}
+        )
+
+
+def finish_job(job_id, status, result=None):
+    """记录任务结束状态与结构化结果"""
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE task_jobs
+            SET status = :status, result = :result, finished_at = :now
+            WHERE job_id = :job_id
+        """), {
+            "status": status,
+            "result": json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+            "now": datetime.now(),
+            "job_id": job_id
+        })
+
+
+def cancel_pending_jobs(task_type):
+    """取消指定类型所有排队中的任务，返回取消数量"""
+    ensure_job_table()
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        result = conn.execute(text("""
+            UPDATE task_jobs SET status = 'CANCELLED', finished_at = :now
+            WHERE task_type = :task_type AND status = 'PENDING'
+        """), {"task_type": task_type, "now": datetime.now()})
+    return result.rowcount
+
+
+def recover_interrupted_jobs():
+    """
+    重启恢复：心跳超时的执行中任务（所属进程已退出或服务已重启）退回排队状态，
+    并在result中标记recovered，执行时可据此只重做未完成的部分（如日K线抽取按断点续传执行）
+
+    返回：
+        int: 恢复的任务数量
+    """
+    ensure_job_table()
+    deadline = datetime.now() - timedelta(seconds=HEARTBEAT_TIMEOUT_SECONDS)
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        result = conn.execute(text("""
+            UPDATE task_jobs
+            SET status = 'PENDING', worker_id = NULL, started_at = NULL, heartbeat_at = NULL,
+                result = '{"recovered": true}'
+            WHERE status = 'RUNNING' AND (heartbeat_at IS NULL OR heartbeat_at < :deadline)
+        """), {"deadline": deadline})
+    return result.rowcount
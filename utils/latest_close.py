@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+最新收盘价快照（latest_close）
+====================
+功能说明：
+1. latest_close表保存cn_stock_daily最新一个交易日每只股票的收盘价，由日K线抽取任务在入库完成后刷新
+2. ts_code的字符集与排序规则和stock_selected一致，首页统计可以直接按主键关联，无需CAST两侧字段
+3. 首页概览统计（选股记录数、选股至今收益率）只读取快照表，不再每次扫描cn_stock_daily求MAX(trade_date)
+"""
+
+import os
+import sys
+from datetime import datetime
+
+from sqlalchemy import text
+
+# 添加当前目录到系统路径，以便导入 db_utils
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from db_utils import get_db_engine, to_yyyymmdd
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.db_utils import get_db_engine, to_yyyymmdd
+
+
+def ensure_latest_close_table(conn):
+    """创建latest_close表（如果不存在）"""
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS latest_close (
+        ts_code VARCHAR(20) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL COMMENT '股票代码',
+        trade_date VARCHAR(8) NOT NULL COMMENT '交易日期(YYYYMMDD)',
+        price_close FLOAT COMMENT '收盘价',
+        updated_at DATETIME NOT NULL COMMENT '刷新时间',
+        PRIMARY KEY (ts_code)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='最新交易日收盘价快照'
+    """))
+
+
+def refresh_latest_close(trade_date=None):
+    """
+    刷新最新收盘价快照
+
+    逻辑说明：
+        1. 快照已是更新的交易日时不处理（补抽历史数据不影响快照）
+        2. 否则在一个事务中清空快照，并写入该交易日全部股票的收盘价
+
+    参数：
+        trade_date: 本次入库的最新交易日（YYYYMMDD）；为空或快照为空时查询cn_stock_daily的最新交易日
+    返回：
+        tuple: (快照交易日, 写入条目数)；快照未变化时写入条目数为0
+    """
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        ensure_latest_close_table(conn)
+        current = conn.execute(text("SELECT MAX(trade_date) FROM latest_close")).scalar()
+        if trade_date is None or current is None:
+            trade_date = to_yyyymmdd(conn.execute(text("SELECT MAX(trade_date) FROM cn_stock_daily")).scalar())
+        if trade_date is None or (current is not None and current > trade_date):
+            return current, 0
+        conn.execute(text("DELETE FROM latest_close"))
+        result = conn.execute(text("""
+            INSERT INTO latest_close (ts_code, trade_date, price_close, updated_at)
+            SELECT ts_code, :trade_date, price_close, :updated_at
+            FROM cn_stock_daily WHERE trade_date = :trade_date
+        """), {"trade_date": trade_date, "updated_at": datetime.now()})
+        return trade_date, result.rowcount
+
+
+def get_overview_stats():
+    """
+    首页概览统计：选股记录数，以及全部选股记录按最新收盘价计算的整体收益率
+
+    快照表为空（尚未执行过日K线抽取）时先刷新一次快照。
+
+    返回：
+        dict: {'stock_count': 选股记录数, 'yield_rate': 收益率(%)或None, 'trade_date': 快照交易日}
+    """
+    engine = get_db_engine()
+    with engine.connect() as conn:
+        ensure_latest_close_table(conn)
+        trade_date = conn.execute(text("SELECT MAX(trade_date) FROM latest_close")).scalar()
+    if trade_date is None:
+        trade_date, _ = refresh_latest_close()
+
+    with engine.connect() as conn:
+        stock_count = conn.execute(text("SELECT COUNT(*) FROM stock_selected")).scalar()
+        yield_rate = conn.execute(text("""
+            SELECT SUM(l.price_close - s.price_close) / NULLIF(SUM(s.price_close), 0) * 100
+            FROM stock_selected s
+            INNER JOIN latest_close l ON l.ts_code = s.ts_code
+        """)).scalar()
+    return {
+        "stock_count": int(stock_count or 0),
+        "yield_rate": float(yield_rate) if yield_rate is not None else None,
+        "trade_date": trade_date,
+    }
+
+
+if __name__ == "__main__":
+    snapshot_date, count = refresh_latest_close()
+    print(f"最新收盘价快照: {snapshot_date}，写入 {count} 条", flush=True)
@@ -0,0 +1,536 @@
+# -*- coding: utf-8 -*-
+"""
+数据库表结构版本化迁移
+====================
+功能说明：
+1. schema_migrations表记录已执行的迁移版本，按版本号顺序执行尚未执行的迁移，执行成功后写入记录
+2. MySQL/TiDB的DDL会隐式提交，迁移无法整体回滚，因此每个迁移执行前先查询information_schema，
+   已经满足目标结构的步骤直接跳过：中途失败后修复问题重新运行即可从断点继续
+3. 迁移内容（init_tidb.py / alter_table.py 均委托本模块执行）：
+   - 001 基线表：stock_name、cn_stock_daily、stock_selected
+   - 002 stock_selected：execute_id主键、收藏/观察字段。TiDB不支持删除聚簇主键，主键不是(execute_id, ts_code)时
+         先检查新主键是否会重复（重复时中止并列出示例），再建新表、按月复制、核对条目数后原子RENAME，
+         原表保留为stock_selected_legacy；缺少execute_id的旧记录以执行日期+执行时间作为批次号
+   - 003 stock_name/stock_selected的文本字段统一为utf8mb4_unicode_ci，关联查询无需运行时转换排序规则
+   - 004 cn_stock_daily重建为紧凑类型：trade_date/update_date由VARCHAR(8)改为DATE（与stock_selected一致），
+         ts_code排序规则与其他表一致。TiDB不支持修改聚簇主键列的类型，因此采用建新表、按月分批复制、
+         核对条目数后原子RENAME的方式，原表保留为cn_stock_daily_legacy，确认无误后手工删除
+   - 005 接口筛选/排序所用的二级索引；已有以相同字段开头的索引（含主键）时跳过
+
+注意：
+- 004先在不加锁的情况下按月复制，再获取cn_stock_daily写入锁的全部槽位（日K线抽取写入单日数据时持有其中一个），
+  补复制复制期间有写入的月份后RENAME，切换期间日K线抽取等待（最长DAILY_WRITE_LOCK_TIMEOUT秒）
+- 002复制期间请勿执行选股任务（新写入的选股记录不会进入新表，核对条目数时中止）
+
+用法：
+    python utils/schema_migrations.py              # 执行全部未执行的迁移
+    python utils/schema_migrations.py --status     # 查看迁移状态
+    python utils/schema_migrations.py --dry-run    # 只列出待执行的迁移
+    python utils/schema_migrations.py --target 3   # 只迁移到指定版本
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+# 添加当前目录到系统路径，以便导入 db_utils
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from db_utils import DAILY_WRITE_LOCK_SLOTS, daily_write_lock_name, get_db_engine, get_int_config
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.db_utils import DAILY_WRITE_LOCK_SLOTS, daily_write_lock_name, get_db_engine, get_int_config
+
+TARGET_CHARSET = 'utf8mb4'
+TARGET_COLLATION = 'utf8mb4_unicode_ci'
+
+# 需要统一排序规则的文本字段（cn_stock_daily.ts_code在004重建时处理）
+COLLATED_COLUMNS = [
+    ('stock_name', 'ts_code'),
+    ('stock_name', 'ts_code_name'),
+    ('stock_selected', 'execute_id'),
+    ('stock_selected', 'ts_code'),
+    ('stock_selected', 'stock_name'),
+]
+
+# 接口筛选/排序所用的索引：(表名, 索引名, 字段列表)
+API_INDEXES = [
+    # 按月统计、最新收盘价快照、选股增量评估均按交易日区间查询；主键以ts_code开头无法使用
+    ('cn_stock_daily', 'idx_trade_date', ['trade_date']),
+    # 按批次查询/删除、批次下拉列表
+    ('stock_selected', 'idx_execute_id', ['execute_id']),
+    # 代码/名称检索解析为 ts_code IN (...)
+    ('stock_selected', 'idx_ts_code', ['ts_code']),
+    # 选股记录查询按 (trade_date, ts_code, execute_id) 倒序keyset分页
+    ('stock_selected', 'idx_trade_code_exec', ['trade_date', 'ts_code', 'execute_id']),
+    ('stock_selected', 'idx_buy_date', ['buy_date']),
+    ('stock_selected', 'idx_gold_date', ['gold_date']),
+    # 收藏/观察列表：WHERE is_xxx = 1 ORDER BY xxx_added_at DESC
+    ('stock_selected', 'idx_favorite', ['is_favorite', 'favorite_added_at']),
+    ('stock_selected', 'idx_observation', ['is_observation', 'observation_added_at']),
+]
+
+DAILY_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    ts_code VARCHAR(20) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL COMMENT '股票代码',
+    trade_date DATE NOT NULL COMMENT '交易日期',
+    price_open FLOAT COMMENT '开盘价',
+    price_high FLOAT COMMENT '最高价',
+    price_low FLOAT COMMENT '最低价',
+    price_close FLOAT COMMENT '收盘价',
+    price_pre_close FLOAT COMMENT '前收盘价',
+    amt_chg FLOAT COMMENT '涨跌额',
+    pct_chg FLOAT COMMENT '涨跌幅(%)',
+    vol BIGINT COMMENT '成交量(手)',
+    amount FLOAT COMMENT '成交额(千元)',
+    update_date DATE NOT NULL COMMENT '更新日期',
+    PRIMARY KEY (ts_code, trade_date)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='A股日线数据表'
+"""
+
+DAILY_COLUMNS = ('ts_code, trade_date, price_open, price_high, price_low, price_close, '
+                 'price_pre_close, amt_chg, pct_chg, vol, amount, update_date')
+
+SELECTED_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    execute_id VARCHAR(100) NOT NULL,
+    execute_date DATE NOT NULL COMMENT '选股执行日期',
+    execute_time TIME NOT NULL COMMENT '选股执行时间',
+    ts_code VARCHAR(20) NOT NULL COMMENT '股票代码',
+    trade_date DATE NOT NULL COMMENT '交易日期',
+    stock_name VARCHAR(50) COMMENT '股票名称',
+    price_open DECIMAL(20, 4),
+    price_high DECIMAL(20, 4),
+    price_low DECIMAL(20, 4),
+    price_close DECIMAL(20, 4),
+    price_pre_close DECIMAL(20, 4),
+    amt_chg DECIMAL(20, 4),
+    pct_chg DECIMAL(20, 4),
+    vol DECIMAL(20, 4),
+    amount DECIMAL(20, 4),
+    buy_date DATE COMMENT '建议买入日期',
+    gold_date DATE COMMENT 'AI观察日',
+    is_favorite TINYINT DEFAULT 0,
+    favorite_added_at DATETIME,
+    is_observation TINYINT DEFAULT 0,
+    observation_added_at DATETIME,
+    PRIMARY KEY (execute_id, ts_code)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+SELECTED_COLUMNS = ['execute_id', 'execute_date', 'execute_time', 'ts_code', 'trade_date', 'stock_name',
+                    'price_open', 'price_high', 'price_low', 'price_close', 'price_pre_close', 'amt_chg',
+                    'pct_chg', 'vol', 'amount', 'buy_date', 'gold_date', 'is_favorite', 'favorite_added_at',
+                    'is_observation', 'observation_added_at']
+
+# 002之前的记录没有execute_id（或添加字段后为空字符串）：以执行日期+执行时间作为批次号
+LEGACY_EXECUTE_ID_SQL = "CONCAT(DATE_FORMAT(execute_date, '%Y-%m-%d'), ' ', TIME_FORMAT(execute_time, '%H:%i:%s'))"
+
+
+# ==================== information_schema 查询 ====================
+
+def table_exists(conn, table):
+    """当前数据库中是否存在该表"""
+    return conn.execute(text("""
+        SELECT COUNT(*) FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table
+    """), {"table": table}).scalar() > 0
+
+
+def get_column(conn, table, column):
+    """
+    查询字段定义
+
+    返回：
+        dict或None: {data_type, column_type, nullable, collation, comment}
+    """
+    row = conn.execute(text("""
+        SELECT DATA_TYPE, COLUMN_TYPE, IS_NULLABLE, COLLATION_NAME, COLUMN_COMMENT
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND COLUMN_NAME = :column
+    """), {"table": table, "column": column}).fetchone()
+    if row is None:
+        return None
+    return {
+        "data_type": row[0].lower(),
+        "column_type": row[1],
+        "nullable": row[2] == 'YES',
+        "collation": row[3],
+        "comment": row[4] or '',
+    }
+
+
+def get_indexes(conn, table):
+    """
+    查询表上的全部索引
+
+    返回：
+        dict: {索引名: [字段名, ...]}（按索引内顺序，主键为PRIMARY）
+    """
+    rows = conn.execute(text("""
+        SELECT INDEX_NAME, COLUMN_NAME FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table
+        ORDER BY INDEX_NAME, SEQ_IN_INDEX
+    """), {"table": table}).fetchall()
+    indexes = {}
+    for index_name, column_name in rows:
+        indexes.setdefault(index_name, []).append(column_name.lower())
+    return indexes
+
+
+def _next_month(year_month):
+    """YYYYMM的下一个月第一天（YYYYMMDD），用作按月复制的右开区间"""
+    year, month = int(year_month[:4]), int(year_month[4:6])
+    return f"{year + month // 12:04d}{month % 12 + 1:02d}01"
+
+
+def _sql_comment(comment):
+    """DDL中的COMMENT字面量（DDL不支持绑定参数，手工转义单引号）"""
+    return "'" + comment.replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+def _month_counts(conn, table, date_column):
+    """按月统计条目数：{YYYYMM: 条目数}"""
+    rows = conn.execute(text(
+        f"SELECT DATE_FORMAT({date_column}, '%Y%m'), COUNT(*) FROM {table} GROUP BY 1"
+    )).fetchall()
+    return {row[0]: row[1] for row in rows if row[0]}
+
+
+def _copy_month(conn, source, target, insert_columns, select_columns, date_column, year_month):
+    """
+    把source中date_column落在year_month的行复制到target，单独提交
+    先删除target中该月已复制的行再整月复制：中断后重跑或补复制增量时结果一致，无需INSERT IGNORE
+
+    返回：
+        int: 复制的行数
+    """
+    params = {"start_date": f"{year_month}01", "next_month": _next_month(year_month)}
+    where = f"{date_column} >= :start_date AND {date_column} < :next_month"
+    t0 = time.perf_counter()
+    conn.execute(text(f"DELETE FROM {target} WHERE {where}"), params)
+    result = conn.execute(text(
+        f"INSERT INTO {target} ({insert_columns}) SELECT {select_columns} FROM {source} WHERE {where}"
+    ), params)
+    conn.commit()
+    print(f"  📦 {year_month}: 复制 {result.rowcount} 行 ({time.perf_counter() - t0:.1f}s)", flush=True)
+    return result.rowcount
+
+
+def _lock_daily_writes(conn):
+    """
+    获取cn_stock_daily写入锁的全部槽位：正在写入的日K线抽取完成当日事务后才能获取，之后的写入等待释放
+
+    返回：
+        list: 已获取的锁名（由_unlock_daily_writes释放）
+    异常：
+        RuntimeError: 超过DAILY_WRITE_LOCK_TIMEOUT秒仍未获取
+    """
+    timeout = get_int_config('DAILY_WRITE_LOCK_TIMEOUT', 600)
+    locked = []
+    for slot in range(DAILY_WRITE_LOCK_SLOTS):
+        lock_name = daily_write_lock_name(slot)
+        if conn.execute(text("SELECT GET_LOCK(:name, :timeout)"), {"name": lock_name, "timeout": timeout}).scalar() != 1:
+            _unlock_daily_writes(conn, locked)
+            raise RuntimeError(f"等待日K线抽取写入完成超时（{timeout}秒），请稍后重试")
+        locked.append(lock_name)
+    return locked
+
+
+def _unlock_daily_writes(conn, locked):
+    for lock_name in locked:
+        conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": lock_name})
+
+
+# ==================== 迁移定义 ====================
+
+def m001_baseline_tables(conn):
+    """基线表结构（原init_tidb.py）"""
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS stock_name (
+        ts_code VARCHAR(20) PRIMARY KEY COMMENT '股票代码',
+        ts_code_name VARCHAR(50) COMMENT '股票名称'
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """))
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS cn_stock_daily (
+        ts_code VARCHAR(20) NOT NULL COMMENT '股票代码',
+        trade_date VARCHAR(8) NOT NULL COMMENT '交易日期(YYYYMMDD)',
+        price_open FLOAT COMMENT '开盘价',
+        price_high FLOAT COMMENT '最高价',
+        price_low FLOAT COMMENT '最低价',
+        price_close FLOAT COMMENT '收盘价',
+        price_pre_close FLOAT COMMENT '前收盘价',
+        amt_chg FLOAT COMMENT '涨跌额',
+        pct_chg FLOAT COMMENT '涨跌幅(%)',
+        vol BIGINT COMMENT '成交量(手)',
+        amount FLOAT COMMENT '成交额(千元)',
+        update_date VARCHAR(8) NOT NULL COMMENT '更新时间',
+        PRIMARY KEY (ts_code, trade_date)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='A股日线数据表'
+    """))
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS stock_selected (
+        execute_date DATE NOT NULL COMMENT '选股执行日期',
+        execute_time TIME NOT NULL COMMENT '选股执行时间',
+        ts_code VARCHAR(20) NOT NULL COMMENT '股票代码',
+        trade_date DATE NOT NULL COMMENT '交易日期',
+        stock_name VARCHAR(50) COMMENT '股票名称',
+        price_open DECIMAL(20, 4),
+        price_high DECIMAL(20, 4),
+        price_low DECIMAL(20, 4),
+        price_close DECIMAL(20, 4),
+        price_pre_close DECIMAL(20, 4),
+        amt_chg DECIMAL(20, 4),
+        pct_chg DECIMAL(20, 4),
+        vol DECIMAL(20, 4),
+        amount DECIMAL(20, 4),
+        buy_date DATE COMMENT '建议买入日期',
+        gold_date DATE COMMENT 'AI观察日',
+        PRIMARY KEY (execute_date, execute_time, ts_code, trade_date)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """))
+
+
+def m002_stock_selected_columns(conn):
+    """stock_selected：execute_id主键与收藏/观察字段（原fix_stock_selected_table.py / alter_table.py）"""
+    if get_indexes(conn, 'stock_selected').get('PRIMARY') == ['execute_id', 'ts_code']:
+        # 主键已是目标结构：只补充缺少的收藏/观察字段
+        new_columns = [
+            ("is_favorite", "TINYINT DEFAULT 0"),
+            ("favorite_added_at", "DATETIME"),
+            ("is_observation", "TINYINT DEFAULT 0"),
+            ("observation_added_at", "DATETIME"),
+        ]
+        for column_name, column_def in new_columns:
+            if get_column(conn, 'stock_selected', column_name) is None:
+                conn.execute(text(f"ALTER TABLE stock_selected ADD COLUMN {column_name} {column_def}"))
+                print(f"  ✅ 添加字段 stock_selected.{column_name}", flush=True)
+        return
+    if conn.execute(text("SELECT 1 FROM stock_selected LIMIT 1")).fetchone() is None:
+        # 空表（新部署由001创建）直接按目标结构重建
+        conn.execute(text("DROP TABLE stock_selected"))
+        conn.execute(text(SELECTED_TABLE_DDL.format(table='stock_selected')))
+        print("  ✅ stock_selected（空表）按 (execute_id, ts_code) 主键重建", flush=True)
+        return
+    if table_exists(conn, 'stock_selected_legacy'):
+        raise RuntimeError("stock_selected_legacy已存在，请确认上一次迁移的备份表可以删除后手工DROP再重试")
+
+    existing = {row[0].lower() for row in conn.execute(text("""
+        SELECT COLUMN_NAME FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'stock_selected'
+    """)).fetchall()}
+    unknown = sorted(existing - set(SELECTED_COLUMNS))
+    if unknown:
+        raise RuntimeError(f"stock_selected存在迁移未知的字段 {unknown}，重建主键会丢失这些字段，请先手工处理")
+
+    # 旧主键 (execute_date, execute_time, ts_code, trade_date) 允许同一批次中同一股票出现在多个交易日，
+    # 新主键下这些记录会冲突：中止迁移并列出示例，由人工决定保留哪些记录
+    execute_id_sql = (f"COALESCE(NULLIF(execute_id, ''), {LEGACY_EXECUTE_ID_SQL})" if 'execute_id' in existing
+                      else LEGACY_EXECUTE_ID_SQL)
+    duplicates = conn.execute(text(f"""
+        SELECT {execute_id_sql} AS new_execute_id, ts_code, COUNT(*) FROM stock_selected
+        GROUP BY new_execute_id, ts_code HAVING COUNT(*) > 1 LIMIT 5
+    """)).fetchall()
+    if duplicates:
+        examples = '; '.join(f"{row[0]} {row[1]} ({row[2]}条)" for row in duplicates)
+        raise RuntimeError(f"stock_selected中存在 (execute_id, ts_code) 重复的记录，无法设为主键，"
+                           f"请删除重复记录后重试。示例: {examples}")
+
+    # 新表已存在说明上次复制中断：按月删除后重新复制，从断点继续
+    conn.execute(text(SELECTED_TABLE_DDL.format(table='stock_selected_new')))
+    conn.commit()
+    defaults = {'is_favorite': '0', 'is_observation': '0'}
+    select_columns = ', '.join(
+        execute_id_sql if col == 'execute_id' else col if col in existing else defaults.get(col, 'NULL')
+        for col in SELECTED_COLUMNS
+    )
+    for year_month in sorted(_month_counts(conn, 'stock_selected', 'execute_date')):
+        _copy_month(conn, 'stock_selected', 'stock_selected_new', ', '.join(SELECTED_COLUMNS), select_columns,
+                    'execute_date', year_month)
+
+    old_count = conn.execute(text("SELECT COUNT(*) FROM stock_selected")).scalar()
+    new_count = conn.execute(text("SELECT COUNT(*) FROM stock_selected_new")).scalar()
+    if old_count != new_count:
+        raise RuntimeError(f"stock_selected复制后条目数不一致：原表 {old_count}，新表 {new_count}"
+                           f"（复制期间有选股任务写入？），请停止选股任务后重试")
+    conn.execute(text("RENAME TABLE stock_selected TO stock_selected_legacy, stock_selected_new TO stock_selected"))
+    print(f"  ✅ stock_selected主键改为 (execute_id, ts_code)（{new_count} 行），原表保留为stock_selected_legacy",
+          flush=True)
+
+
+def m003_align_collations(conn):
+    """stock_name/stock_selected文本字段统一字符集与排序规则"""
+    for table, column in COLLATED_COLUMNS:
+        info = get_column(conn, table, column)
+        if info is None or info["collation"] == TARGET_COLLATION:
+            continue
+        null_sql = "NULL" if info["nullable"] else "NOT NULL"
+        conn.execute(text(
+            f"ALTER TABLE {table} MODIFY COLUMN {column} {info['column_type']} "
+            f"CHARACTER SET {TARGET_CHARSET} COLLATE {TARGET_COLLATION} {null_sql} "
+            f"COMMENT {_sql_comment(info['comment'])}"
+        ))
+        print(f"  ✅ {table}.{column}: {info['collation']} -> {TARGET_COLLATION}", flush=True)
+
+
+def m004_typed_daily_table(conn):
+    """cn_stock_daily重建为DATE类型的交易日期、统一排序规则（建新表 -> 按月复制 -> 核对 -> RENAME）"""
+    trade_date = get_column(conn, 'cn_stock_daily', 'trade_date')
+    update_date = get_column(conn, 'cn_stock_daily', 'update_date')
+    ts_code = get_column(conn, 'cn_stock_daily', 'ts_code')
+    if (trade_date["data_type"] == 'date' and update_date["data_type"] == 'date'
+            and ts_code["collation"] == TARGET_COLLATION):
+        return
+    if table_exists(conn, 'cn_stock_daily_legacy'):
+        raise RuntimeError("cn_stock_daily_legacy已存在，请确认上一次迁移的备份表可以删除后手工DROP再重试")
+
+    # 新表已存在说明上次复制中断：按月删除后重新复制，从断点继续
+    conn.execute(text(DAILY_TABLE_DDL.format(table='cn_stock_daily_new')))
+    conn.commit()
+    # 日K线抽取写入的行update_date为当天：复制开始当天及之后更新过的月份在切换前需要补复制
+    copy_started = datetime.now().strftime('%Y%m%d')
+    # 第一阶段不加锁：按月分批提交，避免单个事务超出TiDB事务大小限制
+    for year_month in sorted(_month_counts(conn, 'cn_stock_daily', 'trade_date')):
+        _copy_month(conn, 'cn_stock_daily', 'cn_stock_daily_new', DAILY_COLUMNS, DAILY_COLUMNS,
+                    'trade_date', year_month)
+
+    # 第二阶段持有写入锁：补复制第一阶段期间有写入的月份，核对后RENAME，期间日K线抽取等待
+    locked = _lock_daily_writes(conn)
+    try:
+        old_counts = _month_counts(conn, 'cn_stock_daily', 'trade_date')
+        new_counts = _month_counts(conn, 'cn_stock_daily_new', 'trade_date')
+        updated_months = {row[0] for row in conn.execute(text("""
+            SELECT DISTINCT DATE_FORMAT(trade_date, '%Y%m') FROM cn_stock_daily WHERE update_date >= :copy_started
+        """), {"copy_started": copy_started}).fetchall() if row[0]}
+        stale_months = sorted(updated_months | {m for m in old_counts.keys() | new_counts.keys()
+                                                if old_counts.get(m) != new_counts.get(m)})
+        if stale_months:
+            print(f"  🔁 补复制复制期间有写入的 {len(stale_months)} 个月份", flush=True)
+        for year_month in stale_months:
+            _copy_month(conn, 'cn_stock_daily', 'cn_stock_daily_new', DAILY_COLUMNS, DAILY_COLUMNS,
+                        'trade_date', year_month)
+
+        old_count = conn.execute(text("SELECT COUNT(*) FROM cn_stock_daily")).scalar()
+        new_count = conn.execute(text("SELECT COUNT(*) FROM cn_stock_daily_new")).scalar()
+        if old_count != new_count:
+            raise RuntimeError(f"cn_stock_daily复制后条目数不一致：原表 {old_count}，新表 {new_count}")
+        conn.execute(text("RENAME TABLE cn_stock_daily TO cn_stock_daily_legacy, cn_stock_daily_new TO cn_stock_daily"))
+    finally:
+        _unlock_daily_writes(conn, locked)
+    print(f"  ✅ cn_stock_daily已切换为新结构（{new_count} 行），原表保留为cn_stock_daily_legacy", flush=True)
+
+
+def m005_api_indexes(conn):
+    """接口筛选/排序所用的二级索引"""
+    for table, index_name, columns in API_INDEXES:
+        indexes = get_indexes(conn, table)
+        if index_name in indexes or any(cols[:len(columns)] == columns for cols in indexes.values()):
+            continue
+        conn.execute(text(f"ALTER TABLE {table} ADD INDEX {index_name} ({', '.join(columns)})"))
+        print(f"  ✅ 添加索引 {table}.{index_name} ({', '.join(columns)})", flush=True)
+
+
+# 迁移列表：(版本号, 名称, 迁移函数)，只能在末尾追加，已发布的版本不可修改
+MIGRATIONS = [
+    (1, 'baseline_tables', m001_baseline_tables),
+    (2, 'stock_selected_columns', m002_stock_selected_columns),
+    (3, 'align_collations', m003_align_collations),
+    (4, 'typed_daily_table', m004_typed_daily_table),
+    (5, 'api_indexes', m005_api_indexes),
+]
+
+
+# ==================== 执行 ====================
+
+def ensure_migration_table(conn):
+    """创建schema_migrations表（如果不存在）"""
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY COMMENT '迁移版本号',
+        name VARCHAR(100) NOT NULL COMMENT '迁移名称',
+        applied_at DATETIME NOT NULL COMMENT '执行完成时间'
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='表结构迁移记录'
+    """))
+
+
+def get_applied_versions(conn):
+    """已执行的迁移：{版本号: 执行完成时间}"""
+    ensure_migration_table(conn)
+    rows = conn.execute(text("SELECT version, applied_at FROM schema_migrations")).fetchall()
+    return {int(row[0]): row[1] for row in rows}
+
+
+def get_migration_status(engine=None):
+    """
+    查询迁移状态
+
+    返回：
+        list: [(版本号, 名称, 执行完成时间或None)]
+    """
+    engine = engine or get_db_engine()
+    with engine.begin() as conn:
+        applied = get_applied_versions(conn)
+    return [(version, name, applied.get(version)) for version, name, _ in MIGRATIONS]
+
+
+def run_migrations(engine=None, target=None, dry_run=False):
+    """
+    按版本号顺序执行尚未执行的迁移
+
+    参数：
+        engine: 数据库引擎，默认get_db_engine()
+        target: 目标版本号，默认迁移到最新版本
+        dry_run: 为True时只返回待执行的迁移，不执行
+    返回：
+        list: 本次执行（dry_run时为待执行）的版本号
+    """
+    engine = engine or get_db_engine()
+    with engine.begin() as conn:
+        applied = get_applied_versions(conn)
+    pending = [m for m in MIGRATIONS
+               if m[0] not in applied and (target is None or m[0] <= target)]
+    if dry_run:
+        return [version for version, _, _ in pending]
+
+    done = []
+    for version, name, migrate in pending:
+        print(f"🔧 执行迁移 {version:03d}_{name} ...", flush=True)
+        t0 = time.perf_counter()
+        with engine.connect() as conn:
+            migrate(conn)
+            conn.execute(text("""
+                INSERT INTO schema_migrations (version, name, applied_at)
+                VALUES (:version, :name, :applied_at)
+            """), {"version": version, "name": name, "applied_at": datetime.now()})
+            conn.commit()
+        done.append(version)
+        print(f"✅ 迁移 {version:03d}_{name} 完成 ({time.perf_counter() - t0:.1f}s)", flush=True)
+    return done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='数据库表结构迁移')
+    parser.add_argument('--status', action='store_true', help='查看迁移状态')
+    parser.add_argument('--dry-run', action='store_true', help='只列出待执行的迁移')
+    parser.add_argument('--target', type=int, help='迁移到指定版本')
+    cli_args = parser.parse_args()
+
+    if cli_args.status:
+        for migration_version, migration_name, applied_at in get_migration_status():
+            state = applied_at.strftime('%Y-%m-%d %H:%M:%S') if applied_at else '未执行'
+            print(f"{migration_version:03d}_{migration_name:<28} {state}", flush=True)
+    elif cli_args.dry_run:
+        pending_versions = run_migrations(target=cli_args.target, dry_run=True)
+        print(f"待执行的迁移: {pending_versions or '无'}", flush=True)
+    else:
+        applied_versions = run_migrations(target=cli_args.target)
+        print(f"🎉 本次执行 {len(applied_versions)} 个迁移，表结构已是最新版本" if applied_versions
+              else "ℹ️  没有待执行的迁移", flush=True)
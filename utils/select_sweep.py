@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+选股参数扫描
+====================
+功能说明：
+1. 按参数网格（如 D1=0..5、GAIN=1.05,1.08）展开为多组参数，每组参数编译为一个公式
+2. 日线数据只按股票分块读取一遍；每块数据上所有参数组共用一个FormulaContext，
+   相同的滞后值、比值等子表达式只计算一次（如D1=0的REF(C,4)与D1=1的REF(C,4)共用）
+3. 命中结果以稀疏的命中矩阵写入select_sweep_hits表（扫描ID + 参数组序号 + 股票 + 交易日），
+   每组参数的取值与命中条数记录在select_sweeps表
+4. 输出读取、求值、写库各阶段耗时及每组参数的平均求值耗时，便于跟踪扫描成本
+
+使用方法：
+    python utils/select_sweep.py --start 20240101 --end 20241231 --grid D1=0,1,2,3,4,5 --grid GAIN=1.05,1.08
+    python utils/select_sweep.py --start 20240101 --end 20241231 --formula my_formula --grid N=10,20 --no-write
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+# 添加当前目录到系统路径，以便导入 db_utils
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from db_utils import get_db_engine, log_task_execution
+    from formula_engine import (DEFAULT_FORMULA, DEFAULT_FORMULA_NAME, DEFAULT_PARAMS,
+                                compile_formula, evaluate_formulas, get_formula)
+    from tushare_select_stock import iter_stock_data_chunks
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.db_utils import get_db_engine, log_task_execution
+    from utils.formula_engine import (DEFAULT_FORMULA, DEFAULT_FORMULA_NAME, DEFAULT_PARAMS,
+                                      compile_formula, evaluate_formulas, get_formula)
+    from utils.tushare_select_stock import iter_stock_data_chunks
+
+# 命中矩阵每批写入的行数
+HITS_BATCH_SIZE = 5000
+
+
+def parse_grid_args(items):
+    """
+    解析命令行的参数网格：["D1=0,1,2", "GAIN=1.05,1.08"] -> {"D1": [0, 1, 2], "GAIN": [1.05, 1.08]}
+    """
+    grid = {}
+    for item in items or []:
+        name, _, values = item.partition('=')
+        if not name or not values:
+            raise ValueError(f"参数网格格式应为 名称=值1,值2：{item}")
+        grid[name.strip().upper()] = [float(v) if '.' in v else int(v) for v in values.split(',') if v.strip()]
+    return grid
+
+
+def expand_param_grid(grid, base_params=None):
+    """
+    将参数网格展开为参数组列表（笛卡尔积，按网格中参数的顺序排列）
+
+    参数说明：
+    ----------
+    grid : dict
+        参数名 -> 取值列表
+    base_params : dict, 可选
+        未出现在网格中的参数取值（如公式保存的默认参数）
+
+    返回值：
+    ----------
+    list[dict]
+        每组参数的完整取值
+    """
+    base_params = {str(k).upper(): v for k, v in (base_params or {}).items()}
+    names = [str(name).upper() for name in grid]
+    return [
+        {**base_params, **dict(zip(names, values))}
+        for values in itertools.product(*grid.values())
+    ]
+
+
+def ensure_sweep_tables(conn):
+    """创建参数扫描记录表与命中矩阵表（如果不存在）"""
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS select_sweeps (
+        sweep_id VARCHAR(40) NOT NULL PRIMARY KEY COMMENT '扫描ID',
+        formula_name VARCHAR(50) NOT NULL COMMENT '选股公式名称',
+        start_date VARCHAR(8) NOT NULL COMMENT '起始交易日',
+        end_date VARCHAR(8) NOT NULL COMMENT '结束交易日',
+        param_sets TEXT NOT NULL COMMENT '参数组列表(JSON，下标即param_index)',
+        hit_counts TEXT NOT NULL COMMENT '各参数组命中条数(JSON)',
+        rows_read BIGINT NOT NULL DEFAULT 0 COMMENT '读取的日线条数',
+        elapsed_seconds DOUBLE COMMENT '总耗时(秒)',
+        created_at DATETIME NOT NULL COMMENT '扫描时间'
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """))
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS select_sweep_hits (
+        sweep_id VARCHAR(40) NOT NULL COMMENT '扫描ID',
+        param_index SMALLINT NOT NULL COMMENT '参数组序号',
+        ts_code VARCHAR(20) NOT NULL COMMENT '股票代码',
+        trade_date VARCHAR(8) NOT NULL COMMENT '命中的交易日期(YYYYMMDD)',
+        PRIMARY KEY (sweep_id, param_index, ts_code, trade_date)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """))
+
+
+def _trade_date_keys(trade_dates):
+    """命中记录的交易日转为YYYYMMDD字符串（兼容int32日期键与datetime两种格式）"""
+    if pd.api.types.is_datetime64_any_dtype(trade_dates):
+        return trade_dates.dt.strftime('%Y%m%d').to_numpy()
+    return trade_dates.astype(str).to_numpy()
+
+
+def write_sweep_results(summary, hits):
+    """
+    写入一次参数扫描的结果（扫描记录与命中矩阵在同一事务中写入）
+
+    参数说明：
+    ----------
+    summary : dict
+        run_param_sweep返回的扫描摘要
+    hits : pandas.DataFrame
+        命中矩阵：param_index / ts_code / trade_date(YYYYMMDD)
+    """
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        ensure_sweep_tables(conn)
+        conn.execute(text("""
+            INSERT INTO select_sweeps (sweep_id, formula_name, start_date, end_date, param_sets,
+                                       hit_counts, rows_read, elapsed_seconds, created_at)
+            VALUES (:sweep_id, :formula_name, :start_date, :end_date, :param_sets,
+                    :hit_counts, :rows_read, :elapsed_seconds, :created_at)
+        """), {
+            "sweep_id": summary["sweep_id"],
+            "formula_name": summary["formula_name"],
+            "start_date": summary["start_date"],
+            "end_date": summary["end_date"],
+            "param_sets": json.dumps(summary["param_sets"], sort_keys=True),
+            "hit_counts": json.dumps(summary["hit_counts"]),
+            "rows_read": summary["rows_read"],
+            "elapsed_seconds": summary["timings"]["total"],
+            "created_at": datetime.now()
+        })
+        rows = [
+            {"sweep_id": summary["sweep_id"], "param_index": int(index), "ts_code": code, "trade_date": date}
+            for index, code, date in hits[['param_index', 'ts_code', 'trade_date']].itertuples(index=False)
+        ]
+        for i in range(0, len(rows), HITS_BATCH_SIZE):
+            conn.execute(text("""
+                INSERT INTO select_sweep_hits (sweep_id, param_index, ts_code, trade_date)
+                VALUES (:sweep_id, :param_index, :ts_code, :trade_date)
+            """), rows[i:i + HITS_BATCH_SIZE])
+
+
+def run_param_sweep(start_date, end_date, grid, formula_name=None, chunk_rows=None, write=True):
+    """
+    执行一次参数扫描：数据只读取一遍，所有参数组在同一个求值上下文中共享子表达式
+
+    参数说明：
+    ----------
+    start_date, end_date : str
+        日期区间，格式为YYYYMMDD
+    grid : dict
+        参数网格，参数名 -> 取值列表，如 {"D1": [0, 1, 2], "GAIN": [1.05, 1.08]}
+    formula_name : str, 可选
+        select_formulas表中的公式名称，默认使用内置公式
+    chunk_rows : int, 可选
+        每批读取的行数，默认读取SELECT_CHUNK_ROWS
+    write : bool, 可选
+        是否将结果写入select_sweeps/select_sweep_hits
+
+    返回值：
+    ----------
+    tuple
+        (扫描摘要dict, 命中矩阵DataFrame[param_index, ts_code, trade_date])
+        摘要包含sweep_id、param_sets、hit_counts、rows_read以及timings（各阶段耗时，秒）
+    """
+    started = time.perf_counter()
+    if formula_name is None:
+        # 未指定公式时使用内置公式（与run_stock_selection一致，不读取select_formulas表）
+        formula_name = DEFAULT_FORMULA_NAME
+        formula = {"formula_text": DEFAULT_FORMULA, "params": DEFAULT_PARAMS}
+    else:
+        formula = get_formula(formula_name)
+        if formula is None:
+            raise ValueError(f"选股公式不存在: {formula_name}")
+
+    param_sets = expand_param_grid(grid, {**DEFAULT_PARAMS, **(formula.get("params") or {})})
+    compiled = {index: compile_formula(formula["formula_text"], params) for index, params in enumerate(param_sets)}
+    plan_steps = sum(len(c.plan) for c in compiled.values())
+    print(f"📐 公式 {formula_name}：{len(param_sets)} 组参数，合计 {plan_steps} 个计算步骤", flush=True)
+
+    timings = {"read": 0.0, "evaluate": 0.0, "write": 0.0}
+    rows_read = 0
+    shared_steps = 0
+    hit_frames = []
+    chunks = iter_stock_data_chunks(start_date, end_date, chunk_rows=chunk_rows)
+    while True:
+        t0 = time.perf_counter()
+        chunk = next(chunks, None)
+        timings["read"] += time.perf_counter() - t0
+        if chunk is None:
+            break
+        rows_read += len(chunk)
+
+        t0 = time.perf_counter()
+        context, masks = evaluate_formulas(chunk, compiled)
+        shared_steps = len(context.cache)
+        codes = context.data['ts_code'].astype(str).to_numpy()
+        dates = _trade_date_keys(context.data['trade_date'])
+        for index, mask in masks.items():
+            if mask.any():
+                hit_frames.append(pd.DataFrame({
+                    'param_index': np.int16(index), 'ts_code': codes[mask], 'trade_date': dates[mask]
+                }))
+        timings["evaluate"] += time.perf_counter() - t0
+
+    hits = (pd.concat(hit_frames, ignore_index=True) if hit_frames
+            else pd.DataFrame({'param_index': pd.Series(dtype='int16'), 'ts_code': [], 'trade_date': []}))
+    hit_counts = hits['param_index'].value_counts().reindex(range(len(param_sets)), fill_value=0).tolist()
+    summary = {
+        "sweep_id": f"{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:6]}",
+        "formula_name": formula_name,
+        "start_date": start_date,
+        "end_date": end_date,
+        "grid": {str(name).upper(): list(values) for name, values in grid.items()},
+        "param_sets": param_sets,
+        "hit_counts": hit_counts,
+        "rows_read": rows_read,
+        "plan_steps": plan_steps,
+        "computed_steps": shared_steps,
+        "timings": timings,
+    }
+
+    if write:
+        t0 = time.perf_counter()
+        # 扫描记录中的耗时为读取+求值耗时（写库耗时在写入时尚未可知）
+        timings["total"] = round(t0 - started, 3)
+        write_sweep_results(summary, hits)
+        timings["write"] = time.perf_counter() - t0
+    timings["total"] = time.perf_counter() - started
+    for key in timings:
+        timings[key] = round(timings[key], 3)
+    return summary, hits
+
+
+def print_sweep_summary(summary):
+    """输出各参数组的命中条数与各阶段耗时"""
+    grid_names = list(summary["grid"])
+    print(f"\n📊 参数扫描 {summary['sweep_id']}（{summary['start_date']} ~ {summary['end_date']}，"
+          f"读取 {summary['rows_read']:,} 条日线数据）")
+    for index, (params, count) in enumerate(zip(summary["param_sets"], summary["hit_counts"])):
+        values = ', '.join(f"{name}={params[name]}" for name in grid_names)
+        print(f"  [{index:>3}] {values}: 命中 {count} 条")
+    timings = summary["timings"]
+    per_set_ms = timings["evaluate"] * 1000 / max(len(summary["param_sets"]), 1)
+    print(f"⏱️ 读取 {timings['read']:.2f}s，求值 {timings['evaluate']:.2f}s（每组参数 {per_set_ms:.1f}ms），"
+          f"写库 {timings['write']:.2f}s，合计 {timings['total']:.2f}s", flush=True)
+    print(f"♻️ 共享子表达式：计划 {summary['plan_steps']} 步，实际计算 {summary['computed_steps']} 步/块", flush=True)
+
+
+# ========================== 主程序执行入口 ==========================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='选股参数扫描：一次读取数据，评估整个参数网格')
+    parser.add_argument('--start', required=True, help='起始交易日(YYYYMMDD)')
+    parser.add_argument('--end', required=True, help='结束交易日(YYYYMMDD)')
+    parser.add_argument('--grid', action='append', default=[], help='参数网格，如 D1=0,1,2（可重复）')
+    parser.add_argument('--formula', default=None, help='select_formulas表中的公式名称（默认使用内置公式）')
+    parser.add_argument('--chunk-rows', type=int, default=None, help='每批读取的行数')
+    parser.add_argument('--no-write', action='store_true', help='只输出结果，不写入数据库')
+    args = parser.parse_args()
+
+    grid = parse_grid_args(args.grid) or {'D1': [0]}
+    # --no-write时不写入扫描结果，也不记录任务日志（日线数据与公式定义仍从数据库读取）
+    log = (lambda *log_args: None) if args.no_write else log_task_execution
+    try:
+        log("参数扫描", "RUNNING", f"开始参数扫描: {args.start} - {args.end}，网格 {grid}")
+        sweep_summary, _ = run_param_sweep(args.start, args.end, grid, formula_name=args.formula,
+                                           chunk_rows=args.chunk_rows, write=not args.no_write)
+        print_sweep_summary(sweep_summary)
+        log("参数扫描", "SUCCESS", f"扫描 {sweep_summary['sweep_id']}：{len(sweep_summary['param_sets'])} 组参数，"
+                                   f"耗时 {sweep_summary['timings']['total']}s")
+    except Exception as e:
+        print(f"❌ 参数扫描出错: {e}")
+        log("参数扫描", "FAIL", f"执行出错: {e}")
+        sys.exit(1)
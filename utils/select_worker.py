@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+选股常驻工作进程池
+====================
+功能说明：
+1. 维护一个长期存活的进程池，工作进程启动时预先导入pandas/SQLAlchemy/选股模块并建立数据库连接池
+2. API通过submit_selection_job提交选股任务，立即拿到Future，不再阻塞请求线程
+3. 选股结果为结构化字典（命中条数、影响行数等），无需再解析子进程的标准输出
+4. submit_formulas_job在同一次数据读取中运行多个已保存的公式，只返回命中结果、不写库
+5. 工作进程异常退出（OOM被杀、段错误）后进程池不可再用，下一次提交时自动重建进程池
+
+配置说明：
+- SELECT_WORKERS: 工作进程数量，默认1（选股任务较占内存）
+- SELECT_SHARD_WORKERS: 单次全量选股的默认分片进程数，默认1；请求中的workers参数优先
+- SELECT_MAX_SHARD_WORKERS: 请求可指定的分片进程数上限，默认8
+"""
+
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# 添加当前目录到系统路径，以便导入 db_utils
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from db_utils import flush_task_logs, get_config, get_int_config
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.db_utils import flush_task_logs, get_config, get_int_config
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _init_worker():
+    """工作进程初始化：预热模块导入与数据库连接池，后续任务直接复用"""
+    from tushare_select_stock import get_db_engine
+    try:
+        get_db_engine()
+    except Exception as e:
+        # 数据库配置缺失时不影响进程池启动，任务执行时会给出明确错误
+        print(f"⚠️ 选股工作进程预热数据库连接失败: {e}", flush=True)
+
+
+def _ping():
+    """空任务，用于在服务启动时提前拉起工作进程"""
+    return os.getpid()
+
+
+def resolve_shard_workers(workers=None):
+    """
+    确定单次选股的分片进程数：未指定时取SELECT_SHARD_WORKERS，并限制在[1, SELECT_MAX_SHARD_WORKERS]之间
+    """
+    if workers is None:
+        workers = get_int_config('SELECT_SHARD_WORKERS', 1)
+    return max(1, min(int(workers), get_int_config('SELECT_MAX_SHARD_WORKERS', 8)))
+
+
+def run_selection_job(start_date, end_date, select_text='', d1=0, incremental=False, workers=None, formula_name=None):
+    """
+    在工作进程中执行一次选股任务
+
+    返回值：
+    ----------
+    dict: run_stock_selection的结构化结果，附加elapsed_seconds（耗时，秒）
+    """
+    from tushare_select_stock import run_stock_selection
+
+    started = time.time()
+    workers = resolve_shard_workers(workers)
+    result = run_stock_selection(start_date, end_date, select_text, d1=d1, incremental=incremental,
+                                 workers=workers, formula_name=formula_name)
+    result["workers"] = workers
+    result["elapsed_seconds"] = round(time.time() - started, 2)
+    # 工作进程常驻不退出：任务结束前写完本次的任务日志，API收到结果时日志已可查询
+    flush_task_logs()
+    return result
+
+
+def get_select_executor():
+    """获取（必要时创建）全局选股进程池；已损坏（工作进程异常退出）的进程池会被丢弃重建"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None and getattr(_executor, '_broken', False):
+            print("⚠️ 选股进程池已损坏（工作进程异常退出），重建进程池", flush=True)
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+        if _executor is None:
+            try:
+                max_workers = int(get_config('SELECT_WORKERS', 1))
+            except (ValueError, TypeError):
+                max_workers = 1
+            # 使用spawn启动方式，避免在多线程的API进程中fork带来的锁状态问题
+            _executor = ProcessPoolExecutor(
+                max_workers=max(max_workers, 1),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker
+            )
+        return _executor
+
+
+def _reset_executor(broken):
+    """丢弃已损坏的进程池（其他线程已重建时不处理）"""
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _submit(fn, *args):
+    """提交任务；进程池在检查之后才损坏时（提交时抛出BrokenProcessPool）重建进程池并重新提交一次"""
+    executor = get_select_executor()
+    try:
+        return executor.submit(fn, *args)
+    except BrokenProcessPool:
+        print("⚠️ 选股进程池已损坏（工作进程异常退出），重建后重新提交任务", flush=True)
+        _reset_executor(executor)
+        return get_select_executor().submit(fn, *args)
+
+
+def warm_up_select_executor():
+    """提前拉起工作进程，使第一次选股请求无需等待导入与建连"""
+    return _submit(_ping)
+
+
+def submit_selection_job(start_date, end_date, select_text='', d1=0, incremental=False, workers=None,
+                         formula_name=None):
+    """提交选股任务，返回concurrent.futures.Future（workers>1时在工作进程内再按股票分片并行）"""
+    return _submit(run_selection_job, start_date, end_date, select_text, d1, incremental, workers, formula_name)
+
+
+def run_formulas_job(start_date, end_date, formula_names, d1=0, limit=200):
+    """
+    在工作进程中一次性运行多个已保存的公式（不写入stock_selected）
+
+    返回值：
+    ----------
+    dict: {"ok": True, "formulas": {公式名称: {"hit_count": 命中条数, "hits": 前limit条命中记录}}, "elapsed_seconds": 耗时}
+    """
+    from tushare_select_stock import run_saved_formulas
+
+    started = time.time()
+    results = run_saved_formulas(start_date, end_date, formula_names, d1=d1)
+    formulas = {}
+    for name, hits in results.items():
+        preview = []
+        if not hits.empty:
+            preview_df = hits[['ts_code', 'trade_date', 'buy_date', 'gold_date', 'price_close', 'vol']].head(limit).copy()
+            for col in ('trade_date', 'buy_date', 'gold_date'):
+                preview_df[col] = preview_df[col].dt.strftime('%Y%m%d')
+            preview = preview_df.to_dict(orient='records')
+        formulas[name] = {"hit_count": len(hits), "hits": preview}
+    return {"ok": True, "formulas": formulas, "elapsed_seconds": round(time.time() - started, 2)}
+
+
+def submit_formulas_job(start_date, end_date, formula_names, d1=0, limit=200):
+    """提交多公式评估任务，返回concurrent.futures.Future"""
+    return _submit(run_formulas_job, start_date, end_date, list(formula_names), d1, limit)
+
+
+def shutdown_select_executor():
+    """关闭进程池（服务退出时调用）"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
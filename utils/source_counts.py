@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Tushare每日数据条目数缓存（tushare_day_counts）
+====================
+功能说明：
+1. tushare_day_counts表持久化保存Tushare每个交易日返回的日线条目数及取数时间
+2. 日K线抽取写入每一天时顺带记录条目数（与数据在同一事务中提交），不额外调用接口
+3. 取数时间距交易日已超过TUSHARE_COUNT_FINAL_DAYS天的条目数视为最终值，校验时直接使用，不再重新拉取；
+   较新的交易日（数据源仍可能补录）每次校验重新拉取并刷新缓存
+
+配置说明（环境变量）：
+- TUSHARE_COUNT_FINAL_DAYS: 条目数定稿所需的天数，默认7
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, text
+
+# 添加当前目录到系统路径，以便导入 db_utils
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from db_utils import get_db_engine, get_int_config
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.db_utils import get_db_engine, get_int_config
+
+# 日K线抽取在写入单日数据的事务中执行（DB-API游标，%s占位符）
+UPSERT_DAY_SQL = """
+INSERT INTO tushare_day_counts (trade_date, row_count, fetched_at)
+VALUES (%s, %s, %s)
+ON DUPLICATE KEY UPDATE row_count = VALUES(row_count), fetched_at = VALUES(fetched_at)
+"""
+
+_table_ready = False
+
+
+def ensure_source_count_table():
+    """创建tushare_day_counts表（如果不存在），每个进程只执行一次"""
+    global _table_ready
+    if _table_ready:
+        return
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS tushare_day_counts (
+            trade_date VARCHAR(8) PRIMARY KEY COMMENT '交易日期(YYYYMMDD)',
+            row_count INT NOT NULL COMMENT 'Tushare返回的日线条目数',
+            fetched_at DATETIME NOT NULL COMMENT '取数时间'
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Tushare每日条目数缓存'
+        """))
+    _table_ready = True
+
+
+def is_finalized(trade_date, fetched_at, final_days=None):
+    """取数时间距交易日已超过final_days天时，条目数视为最终值"""
+    if final_days is None:
+        final_days = get_int_config('TUSHARE_COUNT_FINAL_DAYS', 7)
+    return fetched_at >= datetime.strptime(trade_date, '%Y%m%d') + timedelta(days=final_days)
+
+
+def get_final_counts(trade_dates):
+    """
+    查询已定稿的每日条目数
+
+    参数：
+        trade_dates: 交易日列表（YYYYMMDD）
+    返回：
+        dict: {trade_date: 条目数}，只包含已定稿的交易日
+    """
+    if not trade_dates:
+        return {}
+    ensure_source_count_table()
+    engine = get_db_engine()
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT trade_date, row_count, fetched_at FROM tushare_day_counts
+            WHERE trade_date BETWEEN :start_date AND :end_date
+        """), {"start_date": min(trade_dates), "end_date": max(trade_dates)}).fetchall()
+    final_days = get_int_config('TUSHARE_COUNT_FINAL_DAYS', 7)
+    wanted = set(trade_dates)
+    return {
+        str(row[0]): int(row[1]) for row in rows
+        if str(row[0]) in wanted and is_finalized(str(row[0]), row[2], final_days)
+    }
+
+
+def save_counts(day_counts, fetched_at=None):
+    """
+    批量写入（覆盖）每日条目数
+
+    参数：
+        day_counts: {trade_date: 条目数}
+        fetched_at: 取数时间，默认当前时间
+    """
+    if not day_counts:
+        return
+    ensure_source_count_table()
+    fetched_at = fetched_at or datetime.now()
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM tushare_day_counts WHERE trade_date IN :dates")
+                     .bindparams(bindparam("dates", expanding=True)), {"dates": list(day_counts)})
+        conn.execute(text("""
+            INSERT INTO tushare_day_counts (trade_date, row_count, fetched_at)
+            VALUES (:trade_date, :row_count, :fetched_at)
+        """), [{"trade_date": d, "row_count": c, "fetched_at": fetched_at} for d, c in day_counts.items()])
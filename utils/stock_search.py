@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+股票代码/名称内存检索索引
+====================
+功能说明：
+1. 从stock_name表加载全部股票，在进程内建立检索索引：
+   - 代码前缀（600、000001、000001.SZ）：有序数组 + 二分查找
+   - 拼音首字母前缀（payh -> 平安银行）：有序数组 + 二分查找（需安装pypinyin，未安装时跳过）
+   - 名称子串（银行）与代码子串：线性扫描（约5000条，毫秒级）
+2. 检索结果是精确的ts_code列表，查询接口以 ts_code IN (...) 走索引过滤，不再使用前置通配符的LIKE
+3. 输入形如股票代码（600、000001.sz）时另给出规范化的代码前缀，查询接口据此直接按代码前缀过滤，
+   已从stock_name中删除的（如退市）股票仍可按代码查到历史记录
+4. 索引超过STOCK_INDEX_TTL秒（默认3600）自动重新加载；股票名称抽取完成后由API调用invalidate立即失效
+"""
+
+import bisect
+import os
+import re
+import sys
+import threading
+import time
+
+from sqlalchemy import text
+
+# 添加当前目录到系统路径，以便导入 db_utils
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from db_utils import get_db_engine, get_int_config
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.db_utils import get_db_engine, get_int_config
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+
+def pinyin_initials(name):
+    """名称的拼音首字母（小写，只保留字母数字），如 '*ST长药' -> 'stzy'；未安装pypinyin时返回空串"""
+    if not name or lazy_pinyin is None:
+        return ''
+    return re.sub(r'[^0-9a-z]', '', ''.join(lazy_pinyin(name, style=Style.FIRST_LETTER)).lower())
+
+
+# 形如股票代码的输入：1-6位数字，可带交易所后缀
+CODE_QUERY_PATTERN = re.compile(r'^\d{1,6}(\.[A-Z]{0,2})?$')
+
+
+def code_query_prefix(query):
+    """
+    输入形如股票代码时返回规范化的代码前缀（大写），如 '000001.sz' -> '000001.SZ'，否则返回None
+
+    参数：
+        query: 用户输入
+    返回：
+        str or None: 代码前缀
+    """
+    code = (query or '').strip().upper()
+    return code if CODE_QUERY_PATTERN.match(code) else None
+
+
+def _prefix_range(keys, prefix):
+    """有序数组keys中以prefix开头的下标区间"""
+    start = bisect.bisect_left(keys, prefix)
+    end = bisect.bisect_left(keys, prefix + '\uffff')
+    return range(start, end)
+
+
+class StockNameIndex:
+    """股票代码/名称检索索引（构建后只读，可被多个请求线程共享）"""
+
+    def __init__(self, rows):
+        """
+        参数：
+            rows: 可迭代的 (ts_code, ts_code_name)
+        """
+        self.names = {}
+        for ts_code, name in rows:
+            if ts_code:
+                self.names[ts_code.upper()] = name or ''
+        self.codes = sorted(self.names)
+        # 拼音首字母：(首字母, ts_code) 有序数组
+        self.initials = sorted(
+            (initials, code) for code, initials in
+            ((code, pinyin_initials(name)) for code, name in self.names.items()) if initials
+        )
+        self.initial_keys = [item[0] for item in self.initials]
+        self.built_at = time.monotonic()
+
+    def search(self, query, limit=None):
+        """
+        检索股票
+
+        匹配优先级：代码前缀 > 拼音首字母前缀 > 名称子串 > 代码子串，同一优先级内按代码排序
+
+        参数：
+            query: 用户输入（代码、名称片段或拼音首字母）
+            limit: 最多返回条数，默认全部
+        返回：
+            list: 匹配的ts_code列表（去重）
+        """
+        query = (query or '').strip()
+        if not query:
+            return []
+        code_query = query.upper()
+        pinyin_query = query.lower()
+        result, seen = [], set()
+
+        def add(codes):
+            for code in codes:
+                if code not in seen:
+                    seen.add(code)
+                    result.append(code)
+                    if limit and len(result) >= limit:
+                        return True
+            return False
+
+        tiers = (
+            lambda: (self.codes[i] for i in _prefix_range(self.codes, code_query)),
+            lambda: sorted(self.initials[i][1] for i in _prefix_range(self.initial_keys, pinyin_query)),
+            lambda: (code for code in self.codes if query in self.names[code]),
+            lambda: (code for code in self.codes if code_query in code),
+        )
+        for tier in tiers:
+            if add(tier()):
+                break
+        return result
+
+    def suggest(self, query, limit=10):
+        """自动补全：返回 [{'ts_code', 'name'}]"""
+        return [{"ts_code": code, "name": self.names[code]} for code in self.search(query, limit)]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def load_stock_index():
+    """从stock_name表构建检索索引"""
+    engine = get_db_engine()
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT ts_code, ts_code_name FROM stock_name")).fetchall()
+    return StockNameIndex(rows)
+
+
+def get_stock_index():
+    """获取进程内共享的检索索引：首次使用或超过STOCK_INDEX_TTL秒时重新加载"""
+    global _index
+    with _index_lock:
+        ttl = get_int_config('STOCK_INDEX_TTL', 3600)
+        if _index is None or time.monotonic() - _index.built_at > ttl:
+            _index = load_stock_index()
+        return _index
+
+
+def invalidate_stock_index():
+    """股票名称更新后调用，下次检索时重新加载"""
+    global _index
+    with _index_lock:
+        _index = None
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+工作日日历查询表
+====================
+功能说明：
+1. 按覆盖的年份区间一次性构建排好序的工作日NumPy数组（基于chinese_calendar）
+2. 用searchsorted对整列日期批量回答"向后最近工作日"、"向前最近工作日"、"向前推N个工作日"
+3. 年份区间不足时自动扩展并重建，日常选股只需构建一次
+4. 交易所交易日历（工作日且非周末）：按年缓存到本地JSON文件，数据抽取与校验只遍历真实交易日
+
+说明：
+- 工作日判定与chinese_calendar.is_workday完全一致（含调休上班的周末）
+- 超出chinese_calendar支持年份范围的查询会抛出NotImplementedError，与逐日判断的行为一致
+- 交易日与工作日不同：调休上班的周末交易所不开市
+- 由chinese_calendar推算的交易日可能多出个别交易所额外休市日（如2024年除夕），
+  只会多一次返回空数据的接口调用，不会遗漏真实交易日；需要精确日历时可用load_trade_cal_snapshot导入
+- 交易日历缓存文件默认为项目根目录下 cache/trade_calendar.json（可用TRADE_CALENDAR_CACHE指定），
+  格式为 {"年份": ["YYYYMMDD", ...]}，也可直接放入由Tushare trade_cal导出的同格式快照
+"""
+
+import json
+import os
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from chinese_calendar import is_workday
+
+# 交易日历本地缓存文件
+TRADE_CALENDAR_CACHE = os.getenv(
+    'TRADE_CALENDAR_CACHE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'trade_calendar.json')
+)
+
+# 已构建的工作日数组缓存：覆盖的年份区间 + 排好序的datetime64[D]数组
+_workday_years = None
+_workday_days = np.array([], dtype='datetime64[D]')
+
+# 交易日历缓存：{年份字符串: [YYYYMMDD, ...]}，首次使用时从本地文件加载
+_trading_days = None
+
+
+def _year_supported(year):
+    """判断chinese_calendar是否提供该年份的节假日数据"""
+    try:
+        is_workday(date(year, 1, 1))
+        return True
+    except NotImplementedError:
+        return False
+
+
+def _build_workdays(first_year, last_year):
+    """构建[first_year, last_year]区间内（仅限支持的年份）所有工作日的有序数组"""
+    days = []
+    for year in range(first_year, last_year + 1):
+        if not _year_supported(year):
+            continue
+        current = date(year, 1, 1)
+        while current.year == year:
+            if is_workday(current):
+                days.append(current)
+            current += timedelta(days=1)
+    return np.array(days, dtype='datetime64[D]')
+
+
+def _as_day_array(dates):
+    """将datetime/date/Series/DatetimeIndex等输入统一转为datetime64[D]数组（去除时分秒）"""
+    if hasattr(dates, 'to_numpy'):
+        dates = dates.to_numpy()
+    return np.atleast_1d(np.asarray(dates, dtype='datetime64[D]'))
+
+
+def get_workdays(dates):
+    """
+    获取覆盖输入日期（前后各多留一年余量）的工作日数组
+
+    参数说明：
+    ----------
+    dates : numpy.ndarray
+        datetime64[D]日期数组
+
+    返回值：
+    ----------
+    numpy.ndarray
+        排好序的datetime64[D]工作日数组
+    """
+    global _workday_years, _workday_days
+
+    if dates.size == 0:
+        return _workday_days
+
+    years = dates.astype('datetime64[Y]').astype(int) + 1970
+    first_year, last_year = int(years.min()) - 1, int(years.max()) + 1
+
+    if _workday_years is None or first_year < _workday_years[0] or last_year > _workday_years[1]:
+        if _workday_years is not None:
+            first_year = min(first_year, _workday_years[0])
+            last_year = max(last_year, _workday_years[1])
+        _workday_days = _build_workdays(first_year, last_year)
+        _workday_years = (first_year, last_year)
+
+    return _workday_days
+
+
+def _take(workdays, idx, dates):
+    """按索引取工作日，索引越界说明查询超出了日历数据的覆盖范围"""
+    if idx.size and (idx.min() < 0 or idx.max() >= len(workdays)):
+        bad = dates[(idx < 0) | (idx >= len(workdays))][0]
+        raise NotImplementedError(f"no available workday data around {bad}")
+    return workdays[idx]
+
+
+def next_workday(dates):
+    """
+    日期向后顺延：每个日期之后（含当天）最近的工作日
+
+    参数说明：
+    ----------
+    dates : 日期或日期序列（datetime / pandas.Series / numpy.ndarray）
+
+    返回值：
+    ----------
+    numpy.ndarray
+        datetime64[D]数组，与输入逐个对应
+    """
+    days = _as_day_array(dates)
+    workdays = get_workdays(days)
+    idx = np.searchsorted(workdays, days, side='left')
+    return _take(workdays, idx, days)
+
+
+def previous_workday(dates):
+    """
+    日期向前回溯：每个日期之前（含当天）最近的工作日
+
+    参数说明：
+    ----------
+    dates : 日期或日期序列（datetime / pandas.Series / numpy.ndarray）
+
+    返回值：
+    ----------
+    numpy.ndarray
+        datetime64[D]数组，与输入逐个对应
+    """
+    days = _as_day_array(dates)
+    workdays = get_workdays(days)
+    idx = np.searchsorted(workdays, days, side='right') - 1
+    return _take(workdays, idx, days)
+
+
+def minus_workdays(dates, n):
+    """
+    日期向前推N个工作日：从每个日期（不含当天）向前数第N个工作日
+
+    参数说明：
+    ----------
+    dates : 日期或日期序列（datetime / pandas.Series / numpy.ndarray）
+    n : int
+        要向前推的工作日数量
+
+    返回值：
+    ----------
+    numpy.ndarray
+        datetime64[D]数组，与输入逐个对应
+    """
+    days = _as_day_array(dates)
+    if n == 0:
+        return days
+    workdays = get_workdays(days)
+    idx = np.searchsorted(workdays, days, side='left') - n
+    return _take(workdays, idx, days)
+
+
+# ===================== 交易所交易日历 =====================
+
+def _load_trading_cache():
+    """加载本地交易日历缓存文件（不存在或损坏时视为空缓存）"""
+    global _trading_days
+    if _trading_days is None:
+        try:
+            with open(TRADE_CALENDAR_CACHE, 'r', encoding='utf-8') as f:
+                _trading_days = json.load(f)
+        except (OSError, ValueError):
+            _trading_days = {}
+    return _trading_days
+
+
+def _save_trading_cache():
+    """将交易日历缓存写回本地文件（先写临时文件再替换，避免写坏缓存）"""
+    try:
+        os.makedirs(os.path.dirname(TRADE_CALENDAR_CACHE), exist_ok=True)
+        tmp_path = TRADE_CALENDAR_CACHE + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(_trading_days, f, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp_path, TRADE_CALENDAR_CACHE)
+    except OSError as e:
+        print(f"⚠️ 交易日历缓存写入失败: {e}", flush=True)
+
+
+def _build_trading_days(year):
+    """计算某一年的全部交易日（工作日且为周一至周五）"""
+    days = []
+    current = date(year, 1, 1)
+    while current.year == year:
+        if current.weekday() < 5 and is_workday(current):
+            days.append(current.strftime('%Y%m%d'))
+        current += timedelta(days=1)
+    return days
+
+
+def get_trading_days(start_date, end_date):
+    """
+    获取日期区间内的交易所交易日
+
+    参数说明：
+    ----------
+    start_date : str
+        开始日期，格式为'YYYYMMDD'
+    end_date : str
+        结束日期，格式为'YYYYMMDD'
+
+    返回值：
+    ----------
+    list[str]
+        区间内（含首尾）的交易日列表，格式为'YYYYMMDD'，升序
+
+    说明：
+    ----------
+    缓存中缺少的年份才会重新计算并写回缓存文件；chinese_calendar尚未提供节假日数据的年份
+    退化为周一至周五，且不写入缓存，待数据更新后自动重新计算
+    """
+    cache = _load_trading_cache()
+    first_year = int(start_date[:4])
+    last_year = int(end_date[:4])
+
+    days = []
+    updated = False
+    for year in range(first_year, last_year + 1):
+        key = str(year)
+        if key in cache:
+            year_days = cache[key]
+        elif _year_supported(year):
+            year_days = cache[key] = _build_trading_days(year)
+            updated = True
+        else:
+            print(f"⚠️ chinese_calendar 暂无 {year} 年节假日数据，按周一至周五处理", flush=True)
+            year_days = [d.strftime('%Y%m%d') for d in
+                         (date(year, 1, 1) + timedelta(days=i) for i in range(366))
+                         if d.year == year and d.weekday() < 5]
+        days.extend(d for d in year_days if start_date <= d <= end_date)
+
+    if updated:
+        _save_trading_cache()
+    return days
+
+
+def is_trading_day(trade_date):
+    """判断某日（'YYYYMMDD'字符串或date/datetime）是否为交易日"""
+    if isinstance(trade_date, (date, datetime)):
+        trade_date = trade_date.strftime('%Y%m%d')
+    return bool(get_trading_days(trade_date, trade_date))
+
+
+def load_trade_cal_snapshot(pro, first_year, last_year):
+    """
+    用Tushare trade_cal接口的上交所日历覆盖本地缓存中的指定年份（一次性导入）
+
+    参数说明：
+    ----------
+    pro : tushare.pro_api() 返回的接口对象
+    first_year, last_year : int
+        导入的年份区间（含首尾）
+
+    返回值：
+    ----------
+    int
+        导入的交易日数量
+    """
+    cache = _load_trading_cache()
+    df = pro.trade_cal(exchange='SSE', start_date=f"{first_year}0101", end_date=f"{last_year}1231",
+                       fields='cal_date,is_open')
+    open_days = sorted(str(d) for d in df.loc[df['is_open'].astype(int) == 1, 'cal_date'])
+    for year in range(first_year, last_year + 1):
+        cache[str(year)] = [d for d in open_days if d.startswith(str(year))]
+    _save_trading_cache()
+    return len(open_days)
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Tushare并发拉取层
+====================
+功能说明：
+1. 令牌桶限流：按配置的每分钟调用次数发放令牌，所有线程共享，突发量不超过桶容量
+2. 线程池并发调用pro.daily，多个交易日的请求同时在途
+3. 失败重试采用指数退避+随机抖动，超过重试上限后抛出TushareFetchError
+4. 结果严格按日期顺序逐日产出，调用方仍可逐日输出、逐日写库
+
+配置说明（环境变量）：
+- TUSHARE_CALLS_PER_MINUTE: 每分钟最大调用次数，默认200
+- TUSHARE_FETCH_WORKERS: 并发线程数，默认4
+- TUSHARE_MAX_RETRIES: 单日最大重试次数，默认6
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加当前目录到系统路径，以便导入 db_utils
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    from db_utils import get_int_config
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(current_dir)))
+    from utils.db_utils import get_int_config
+
+# 日线接口字段（与数据表cn_stock_daily严格对应）
+DAILY_FIELDS = [
+    "ts_code",  # 股票代码
+    "trade_date",  # 交易日期
+    "open",  # 开盘价
+    "high",  # 最高价
+    "low",  # 最低价
+    "close",  # 收盘价
+    "pre_close",  # 前收盘价
+    "change",  # 涨跌额
+    "pct_chg",  # 涨跌幅(%)
+    "vol",  # 成交量(手)
+    "amount"  # 成交额(千元)
+]
+
+
+class TushareFetchError(Exception):
+    """单日数据在重试上限内仍未拉取成功"""
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶
+
+    参数：
+        rate_per_minute: 每分钟补充的令牌数（即每分钟允许的调用次数）
+        capacity: 桶容量（允许的最大突发调用数），默认为1秒的配额（1~10之间）
+    """
+
+    def __init__(self, rate_per_minute, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute 必须大于0")
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else max(1.0, min(rate_per_minute / 60.0, 10.0)))
+        self.tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """获取一个令牌，令牌不足时阻塞等待"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self._sleep(wait)
+
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=60.0):
+    """
+    第attempt次重试前的等待时间：指数退避 + 全抖动
+
+    参数：
+        attempt: 重试序号（从1开始）
+    返回：
+        float: 等待秒数，取值范围 [0, min(max_delay, base_delay * 2^(attempt-1))]
+    """
+    return random.uniform(0, min(max_delay, base_delay * (2 ** (attempt - 1))))
+
+
+class TushareFetcher:
+    """
+    Tushare日线数据并发拉取器
+
+    参数：
+        pro: tushare.pro_api() 返回的接口对象（测试时可传入模拟对象）
+        calls_per_minute: 每分钟最大调用次数
+        max_workers: 并发线程数
+        max_retries: 单日最大重试次数（不含首次调用）
+        base_delay / max_delay: 指数退避的初始与最大等待秒数
+    """
+
+    def __init__(self, pro, calls_per_minute=None, max_workers=None, max_retries=None,
+                 base_delay=1.0, max_delay=60.0, sleep=time.sleep):
+        self.pro = pro
+        self.calls_per_minute = calls_per_minute or get_int_config('TUSHARE_CALLS_PER_MINUTE', 200)
+        self.max_workers = max(1, max_workers or get_int_config('TUSHARE_FETCH_WORKERS', 4))
+        self.max_retries = max_retries if max_retries is not None else get_int_config('TUSHARE_MAX_RETRIES', 6)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+        self.bucket = TokenBucket(self.calls_per_minute, capacity=self.max_workers, sleep=sleep)
+
+    def fetch_daily(self, trade_date, fields=None):
+        """
+        拉取单日日线数据（限流 + 指数退避重试）
+
+        参数：
+            trade_date: 交易日，格式为'YYYYMMDD'
+            fields: 返回字段列表，默认DAILY_FIELDS
+        返回：
+            DataFrame: 单日数据，非交易日为空DataFrame
+        异常：
+            TushareFetchError: 超过重试上限仍失败
+        """
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                return self.pro.daily(trade_date=trade_date, fields=fields or DAILY_FIELDS)
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise TushareFetchError(f"获取 {trade_date} 数据失败，已重试{self.max_retries}次: {e}") from e
+                delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+                print(f"获取 {trade_date} 数据时出错 (第{attempt}次重试): {e}", flush=True)
+                print(f"等待 {delay:.1f} 秒后重试...", flush=True)
+                self._sleep(delay)
+
+    def iter_daily(self, trade_dates, fields=None):
+        """
+        并发拉取多个交易日，按输入顺序逐日产出 (trade_date, DataFrame)
+
+        在途请求数最多为并发线程数的2倍，避免长区间一次性提交导致内存占用过高；
+        某一天重试耗尽时，在轮到该日产出时抛出TushareFetchError，并取消尚未开始的请求。
+        """
+        trade_dates = list(trade_dates)
+        window = self.max_workers * 2
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tushare") as executor:
+            pending = deque()
+            next_index = 0
+            try:
+                while next_index < len(trade_dates) or pending:
+                    while next_index < len(trade_dates) and len(pending) < window:
+                        trade_date = trade_dates[next_index]
+                        pending.append((trade_date, executor.submit(self.fetch_daily, trade_date, fields)))
+                        next_index += 1
+                    trade_date, future = pending.popleft()
+                    yield trade_date, future.result()
+            finally:
+                for _, future in pending:
+                    future.cancel()
@@ -3,16 +3,18 @@
 股票选股分析程序
 ====================
 功能说明：
-1. 从MySQL数据库读取指定日期区间的股票日线数据
-2. 根据通达信公式筛选符合条件的股票
+1. 读取指定日期区间的股票日线数据（优先本地Parquet缓存，缺失或过期的月份回退MySQL），全量选股按股票分块流式读取
+2. 根据通达信公式筛选符合条件的股票（公式由formula_engine解析为向量化计算计划，可选用select_formulas表中保存的公式）
 3. 处理日期格式（节假日/工作日调整、YYYYMMDD格式转换）
 4. 清理临时字段，调整结果表字段顺序
 5. 将选股结果写入MySQL数据库
+6. 增量模式（--incremental）：只评估尚未评估过的新交易日，只写入新命中记录
 
 使用依赖：
 - pandas: 数据处理
+- numpy: 向量化选股计算
 - pymysql/sqlalchemy: MySQL数据库交互
-- chinese_calendar: 节假日/工作日判断
+- chinese_calendar: 节假日/工作日判断（经trade_calendar预构建为工作日查询表）
 - Python 3.7+
 
 配置说明：
@@ -25,12 +27,15 @@
 
 import pandas as pd
 import pymysql
-from sqlalchemy import create_engine, text
+from sqlalchemy import bindparam, create_engine, text
 from datetime import datetime, timedelta
-# 导入节假日判断库，用于工作日/节假日识别
-from chinese_calendar import is_holiday, is_workday
+import json
+import multiprocessing
 import os
 import sys
+import zlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
 
 # 添加当前目录到系统路径，以便导入 db_utils
@@ -39,23 +44,37 @@ if current_dir not in sys.path:
     sys.path.append(current_dir)
 
 try:
-    from db_utils import get_db_engine, log_task_execution
+    from db_utils import flush_task_logs, get_db_engine, log_task_execution
+    from trade_calendar import next_workday, previous_workday, minus_workdays
+    from daily_cache import load_daily, plan_months, iter_cached_ticker_chunks
+    from daily_row_counts import ensure_row_count_table
+    from data_versions import BUMP_VERSION_SQL, STOCK_SELECTED, ensure_data_version_table
+    from db_utils import get_int_config, to_yyyymmdd
+    from source_counts import ensure_source_count_table
+    from formula_engine import (DEFAULT_FORMULA, DEFAULT_FORMULA_NAME, DEFAULT_PARAMS,
+                                compile_formula, evaluate_formulas, get_formula)
 except ImportError:
     sys.path.append(os.path.join(os.path.dirname(current_dir)))
-    from utils.db_utils import get_db_engine, log_task_execution
+    from utils.db_utils import flush_task_logs, get_db_engine, log_task_execution
+    from utils.trade_calendar import next_workday, previous_workday, minus_workdays
+    from utils.daily_cache import load_daily, plan_months, iter_cached_ticker_chunks
+    from utils.daily_row_counts import ensure_row_count_table
+    from utils.data_versions import BUMP_VERSION_SQL, STOCK_SELECTED, ensure_data_version_table
+    from utils.db_utils import get_int_config, to_yyyymmdd
+    from utils.source_counts import ensure_source_count_table
+    from utils.formula_engine import (DEFAULT_FORMULA, DEFAULT_FORMULA_NAME, DEFAULT_PARAMS,
+                                      compile_formula, evaluate_formulas, get_formula)
 
 # 加载环境变量
 load_dotenv()
 load_dotenv('.env.local')
 
-# 获取数据库连接引擎
-engine = get_db_engine()
-
 
 # ========================== 数据读取模块 ==========================
 def load_stock_data(start_date='20200101', end_date='20251231'):
     """
-    从MySQL的cn_stock_daily表读取指定日期区间的股票日线数据
+    读取指定日期区间的股票日线数据（cn_stock_daily）
+    优先读取本地Parquet缓存，缓存缺失或过期的月份回退到MySQL查询
 
     参数说明：
     ----------
@@ -67,7 +86,7 @@ def load_stock_data(start_date='20200101', end_date='20251231'):
     返回值：
     ----------
     pandas.DataFrame
-        包含股票日线数据的DataFrame，字段说明：
+        包含股票日线数据的DataFrame，按ts_code、trade_date排序，字段说明：
         - ts_code: 股票代码
         - trade_date: 交易日期（datetime类型）
         - price_open/price_high/price_low/price_close: 开/高/低/收盘价
@@ -77,21 +96,438 @@ def load_stock_data(start_date='20200101', end_date='20251231'):
         - vol: 成交量（手）
         - amount: 成交金额（元）
     """
-    # 构造SQL查询语句，读取指定字段和日期区间的数据
+    return load_daily(start_date, end_date)
+
+
+# ========================== 分块流式读取 ==========================
+def compact_stock_frame(df):
+    """
+    将日线数据转换为紧凑类型：ts_code为category，trade_date为int32日期键(YYYYMMDD)
+
+    价格与成交量保持float64：公式在float64上比较（如 REF(C,3)/REF(C,4)>1.08），降为float32会使
+    恰好落在阈值上的比值（8.64/8.00）与全量路径的结果不一致，写入stock_selected的价格也会带上误差
+
+    参数说明：
+    ----------
+    df : pandas.DataFrame
+        日线数据，trade_date为YYYYMMDD字符串、日期（DATE字段读出）或datetime类型
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        紧凑类型的DataFrame（原DataFrame不修改）
+    """
+    df = df.copy()
+    df['ts_code'] = df['ts_code'].astype('category')
+    if pd.api.types.is_datetime64_any_dtype(df['trade_date']):
+        dates = df['trade_date'].dt
+        df['trade_date'] = (dates.year * 10000 + dates.month * 100 + dates.day).astype('int32')
+    else:
+        df['trade_date'] = df['trade_date'].astype(str).str.replace('-', '', regex=False).astype('int32')
+    return df
+
+
+def iter_stock_data_chunks(start_date, end_date, chunk_rows=None, shard=None):
+    """
+    按股票代码顺序分块读取日线数据，每块包含若干只股票在整个区间内的完整数据
+
+    数据来源：
+    ----------
+    - 区间内所有月份的本地缓存均新鲜时：按股票代码区间逐块读取Parquet分区
+    - 否则：数据库按(ts_code, trade_date)排序的流式查询（服务端游标），按chunk_rows行分批读取，
+      每批末尾尚未读完的股票留到下一批，保证产出的每只股票数据完整
+
+    参数说明：
+    ----------
+    start_date, end_date : str
+        日期区间，格式为YYYYMMDD
+    chunk_rows : int, 可选
+        每批读取的行数，默认读取SELECT_CHUNK_ROWS（500000）
+    shard : tuple, 可选
+        (分片序号, 分片总数)：只读取CRC32(ts_code) % 分片总数 == 分片序号的股票
+
+    返回值：
+    ----------
+    generator
+        逐块产出compact_stock_frame格式的DataFrame
+    """
+    chunk_rows = chunk_rows or get_int_config('SELECT_CHUNK_ROWS', 500000)
+    fresh, stale = plan_months(start_date, end_date)
+    if fresh and not stale:
+        # 每只股票每月约22行，按行数上限折算每块的股票数量
+        chunk_tickers = max(1, chunk_rows // (22 * len(fresh)))
+        ticker_filter = None
+        if shard is not None:
+            ticker_filter = lambda code: shard_of(code, shard[1]) == shard[0]
+        for chunk in iter_cached_ticker_chunks(fresh, chunk_tickers=chunk_tickers, ticker_filter=ticker_filter):
+            yield compact_stock_frame(chunk)
+        return
+
+    shard_clause = ""
+    if shard is not None:
+        shard_clause = f"AND CRC32(ts_code) % {int(shard[1])} = {int(shard[0])}"
     sql = f"""
-    SELECT ts_code, trade_date, price_open, price_high, price_low, 
+    SELECT ts_code, trade_date, price_open, price_high, price_low,
            price_close, price_pre_close, amt_chg, pct_chg, vol, amount
     FROM cn_stock_daily
-    WHERE trade_date BETWEEN '{start_date}' AND '{end_date}'
+    WHERE trade_date BETWEEN '{start_date}' AND '{end_date}' {shard_clause}
     ORDER BY ts_code, trade_date
     """
-    # 执行SQL查询并读取数据
-    df = pd.read_sql(sql, engine)
-    # 将trade_date字段从字符串转换为datetime类型（便于后续日期计算）
-    df['trade_date'] = pd.to_datetime(df['trade_date'], format='%Y%m%d')
+    carry = None
+    with get_db_engine().connect() as conn:
+        stream_conn = conn.execution_options(stream_results=True)
+        for chunk in pd.read_sql(text(sql), stream_conn, chunksize=chunk_rows):
+            if carry is not None:
+                chunk = pd.concat([carry, chunk], ignore_index=True)
+            last_code = chunk['ts_code'].iloc[-1]
+            is_last = (chunk['ts_code'] == last_code).to_numpy()
+            carry = chunk[is_last]
+            if not is_last.all():
+                yield compact_stock_frame(chunk[~is_last])
+    if carry is not None and not carry.empty:
+        yield compact_stock_frame(carry)
+
+
+def shard_of(ts_code, shard_count):
+    """股票所属分片：CRC32(ts_code) % 分片总数（与MySQL/TiDB的CRC32函数结果一致）"""
+    return zlib.crc32(ts_code.encode('utf-8')) % shard_count
+
+
+def select_stocks_chunked(start_date, end_date, d1=0, chunk_rows=None, shard=None, formula=None):
+    """
+    分块执行选股：逐块读取完整的股票数据并选股，峰值内存只与单块大小相关
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        与select_stocks(load_stock_data(...))结构一致的命中记录（ts_code为字符串）
+    """
+    hits = []
+    total_rows = 0
+    for chunk in iter_stock_data_chunks(start_date, end_date, chunk_rows=chunk_rows, shard=shard):
+        total_rows += len(chunk)
+        selected = select_stocks(chunk, d1=d1, formula=formula)
+        if not selected.empty:
+            selected['ts_code'] = selected['ts_code'].astype(str)
+            hits.append(selected)
+    shard_text = f"（分片 {shard[0] + 1}/{shard[1]}）" if shard is not None else ""
+    print(f"共读取 {total_rows:,} 条日线数据{shard_text}", flush=True)
+    if not hits:
+        return pd.DataFrame()
+    return pd.concat(hits, ignore_index=True)
+
+
+def run_saved_formulas(start_date, end_date, formula_names, d1=0, chunk_rows=None):
+    """
+    在同一次分块读取中运行多个已保存的公式（每块数据只排序一次，公式间共享子表达式缓存）
+
+    参数说明：
+    ----------
+    start_date, end_date : str
+        日期区间，格式为YYYYMMDD
+    formula_names : list[str]
+        select_formulas表中的公式名称
+    d1 : int, 可选
+        选股公式中的D1参数
+
+    返回值：
+    ----------
+    dict
+        公式名称 -> 命中记录DataFrame（结构同select_stocks的返回值）
+    """
+    formulas = {}
+    for name in formula_names:
+        formula = get_formula(name)
+        if formula is None:
+            raise ValueError(f"选股公式不存在: {name}")
+        formulas[name] = formula
+
+    hits = {name: [] for name in formulas}
+    for chunk in iter_stock_data_chunks(start_date, end_date, chunk_rows=chunk_rows):
+        for name, selected in select_stocks_multi(chunk, formulas, d1=d1).items():
+            if not selected.empty:
+                selected['ts_code'] = selected['ts_code'].astype(str)
+                hits[name].append(selected)
+    return {
+        name: pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        for name, frames in hits.items()
+    }
+
+
+def select_stocks_sharded(start_date, end_date, d1=0, workers=2, chunk_rows=None, formula=None):
+    """
+    多进程分片选股：按CRC32(ts_code)将股票哈希分为workers个分片，每个工作进程只读取并评估自己的分片，
+    父进程合并各分片的命中记录
+
+    参数说明：
+    ----------
+    start_date, end_date : str
+        日期区间，格式为YYYYMMDD
+    d1 : int, 可选
+        选股公式中的D1参数
+    workers : int, 可选
+        工作进程数（即分片数），小于等于1时在当前进程内分块执行
+    formula : dict, 可选
+        公式定义（formula_text/params），默认为内置公式
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        与select_stocks_chunked一致的命中记录，按ts_code、trade_date排序
+    """
+    if workers <= 1:
+        return select_stocks_chunked(start_date, end_date, d1=d1, chunk_rows=chunk_rows, formula=formula)
+
+    # 每次选股使用独立的进程池，结束时关闭：分片选股通常在选股常驻进程（select_worker）中执行，
+    # 缓存的子进程池不会被shutdown_select_executor回收，常驻进程被替换后会遗留空闲的子进程
+    # 使用spawn启动方式，与选股常驻进程池一致
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [
+            executor.submit(select_stocks_chunked, start_date, end_date, d1, chunk_rows, (index, workers), formula)
+            for index in range(workers)
+        ]
+        hits = [f.result() for f in futures]
+    hits = [h for h in hits if not h.empty]
+    if not hits:
+        return pd.DataFrame()
+    return pd.concat(hits, ignore_index=True).sort_values(
+        ['ts_code', 'trade_date'], kind='mergesort', ignore_index=True
+    )
+
+
+# ========================== 增量选股模块 ==========================
+# 默认选股公式名称（与参数一起标识一组已评估的交易日）
+SELECT_FORMULA_NAME = DEFAULT_FORMULA_NAME
+# 回看窗口在lookback_bars个工作日之外额外预留的日历天数（停牌余量）：
+# 回看期间累计停牌超过该天数的股票，复牌前最早的bar可能不在窗口内
+INCREMENTAL_LOOKBACK_DAYS = 60
+
+
+def get_params_key(d1=0, params=None):
+    """
+    选股参数的规范化JSON表示，用于区分不同参数组合的评估进度（params为公式的其他参数）
+
+    与内置默认公式默认值相同的参数不计入，默认参数下的键仍为{"d1": D1}，与已有进度记录兼容
+    """
+    key = {
+        name.lower(): value for name, value in (params or {}).items()
+        if name.upper() != 'D1' and DEFAULT_PARAMS.get(name.upper()) != value
+    }
+    key['d1'] = d1
+    return json.dumps(key, sort_keys=True)
+
+
+def ensure_progress_table(conn):
+    """创建增量选股进度表（如果不存在）"""
+    conn.execute(text("""
+    CREATE TABLE IF NOT EXISTS stock_select_progress (
+        formula_name VARCHAR(50) NOT NULL COMMENT '选股公式名称',
+        params_key VARCHAR(255) NOT NULL COMMENT '选股参数(JSON)',
+        trade_date VARCHAR(8) NOT NULL COMMENT '已评估的交易日期(YYYYMMDD)',
+        hit_count INT NOT NULL DEFAULT 0 COMMENT '当日命中条数',
+        evaluated_at DATETIME NOT NULL COMMENT '评估时间',
+        PRIMARY KEY (formula_name, params_key, trade_date)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """))
+
+
+def get_pending_trade_dates(start_date, end_date, d1=0, formula_name=SELECT_FORMULA_NAME, params=None):
+    """
+    获取日期区间内已入库、但尚未被指定公式+参数评估过的交易日
+
+    参数说明：
+    ----------
+    start_date, end_date : str
+        日期区间，格式为YYYYMMDD
+    d1 : int, 可选
+        选股公式中的D1参数
+    formula_name : str, 可选
+        选股公式名称
+    params : dict, 可选
+        公式的其他参数
+
+    返回值：
+    ----------
+    list[str]
+        升序排列的待评估交易日（YYYYMMDD）
+    """
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        ensure_progress_table(conn)
+        rows = conn.execute(text("""
+            SELECT d.trade_date
+            FROM (
+                SELECT DISTINCT trade_date FROM cn_stock_daily
+                WHERE trade_date BETWEEN :start_date AND :end_date
+            ) d
+            LEFT JOIN stock_select_progress p
+                ON p.trade_date = d.trade_date
+                AND p.formula_name = :formula_name
+                AND p.params_key = :params_key
+            WHERE p.trade_date IS NULL
+            ORDER BY d.trade_date
+        """), {
+            "start_date": start_date,
+            "end_date": end_date,
+            "formula_name": formula_name,
+            "params_key": get_params_key(d1, params)
+        }).fetchall()
+    return [to_yyyymmdd(r[0]) for r in rows]
+
+
+def load_incremental_stock_data(pending_dates, d1=0, lookback_bars=None):
+    """
+    读取增量评估所需的最小数据集：待评估交易日的数据 + 每只股票此前lookback_bars个bar的回看窗口
+
+    参数说明：
+    ----------
+    pending_dates : list[str]
+        待评估交易日（YYYYMMDD，升序）
+    d1 : int, 可选
+        选股公式中的D1参数，未指定lookback_bars时回看D1+4个bar（内置默认公式所需）
+    lookback_bars : int, 可选
+        回看bar数量，通常取CompiledFormula.lookback
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        字段与load_stock_data一致
+    """
+    first_date, last_date = pending_dates[0], pending_dates[-1]
+    if lookback_bars is None:
+        lookback_bars = d1 + 4
+    # 从首个待评估日向前推lookback_bars个工作日，再预留停牌余量
+    floor_date = (minus_n_workdays(datetime.strptime(first_date, '%Y%m%d'), lookback_bars)
+                  - timedelta(days=INCREMENTAL_LOOKBACK_DAYS)).strftime('%Y%m%d')
+
+    sql = text("""
+    SELECT ts_code, trade_date, price_open, price_high, price_low,
+           price_close, price_pre_close, amt_chg, pct_chg, vol, amount
+    FROM (
+        SELECT ts_code, trade_date, price_open, price_high, price_low,
+               price_close, price_pre_close, amt_chg, pct_chg, vol, amount,
+               ROW_NUMBER() OVER (PARTITION BY ts_code ORDER BY trade_date DESC) AS rn
+        FROM cn_stock_daily
+        WHERE trade_date >= :floor_date AND trade_date < :first_date
+    ) lookback
+    WHERE rn <= :lookback_bars
+    UNION ALL
+    SELECT ts_code, trade_date, price_open, price_high, price_low,
+           price_close, price_pre_close, amt_chg, pct_chg, vol, amount
+    FROM cn_stock_daily
+    WHERE trade_date BETWEEN :first_date AND :last_date
+    ORDER BY ts_code, trade_date
+    """)
+    df = pd.read_sql(sql, get_db_engine(), params={
+        "floor_date": floor_date,
+        "first_date": first_date,
+        "last_date": last_date,
+        "lookback_bars": lookback_bars
+    })
+    df['trade_date'] = pd.to_datetime(df['trade_date'].astype(str).str.replace('-', '', regex=False), format='%Y%m%d')
     return df
 
 
+def get_complete_trade_dates(trade_dates):
+    """
+    筛选日线数据已完整入库的交易日
+
+    判断依据（daily_row_counts为库中实际条目数）：
+        1. 有抽取检查点（ingest_checkpoints）时，实际条目数须不少于检查点记录的条目数
+        2. 无检查点但有Tushare条目数缓存（tushare_day_counts）时，实际条目数须不少于数据源条目数
+        3. 两者都没有时，只有早于最新检查点的交易日（检查点机制之前入库的历史数据）视为完整；
+           从未写过检查点时无从判断，视为完整
+
+    参数说明：
+    ----------
+    trade_dates : list[str]
+        交易日（YYYYMMDD）
+
+    返回值：
+    ----------
+    list[str]
+        其中已完整入库的交易日（保持原顺序）
+    """
+    if not trade_dates:
+        return []
+    ensure_row_count_table()
+    ensure_source_count_table()
+    params = {"dates": list(trade_dates)}
+
+    def query(conn, sql):
+        rows = conn.execute(text(sql).bindparams(bindparam("dates", expanding=True)), params).fetchall()
+        return {to_yyyymmdd(row[0]): int(row[1]) for row in rows}
+
+    engine = get_db_engine()
+    with engine.connect() as conn:
+        stored = query(conn, "SELECT trade_date, row_count FROM daily_row_counts WHERE trade_date IN :dates")
+        expected = query(conn, "SELECT trade_date, row_count FROM tushare_day_counts WHERE trade_date IN :dates")
+    try:
+        with engine.connect() as conn:
+            expected.update(query(conn, "SELECT trade_date, row_count FROM ingest_checkpoints WHERE trade_date IN :dates"))
+            latest_checkpoint = to_yyyymmdd(conn.execute(text("SELECT MAX(trade_date) FROM ingest_checkpoints")).scalar())
+    except Exception as e:
+        # 检查点表不存在（从未运行过日K线抽取任务）
+        print(f"⚠️ 读取抽取检查点失败: {e}", flush=True)
+        latest_checkpoint = None
+
+    complete = []
+    for trade_date in trade_dates:
+        if trade_date in expected:
+            if stored.get(trade_date, 0) >= expected[trade_date]:
+                complete.append(trade_date)
+        elif latest_checkpoint is None or trade_date < latest_checkpoint:
+            complete.append(trade_date)
+    return complete
+
+
+def mark_trade_dates_evaluated(pending_dates, Stock_Selected, d1=0, formula_name=SELECT_FORMULA_NAME, params=None):
+    """
+    记录已评估的交易日及其命中条数，下次增量运行时跳过这些日期
+
+    只记录数据已完整入库的交易日（get_complete_trade_dates）：评估时某日只入库了一部分
+    （抽取任务正在写入或中断后尚未续传），该日下次增量运行时重新评估，补入的股票不会被遗漏
+
+    参数说明：
+    ----------
+    pending_dates : list[str]
+        本次评估的交易日（YYYYMMDD）
+    Stock_Selected : pandas.DataFrame
+        本次命中的记录（trade_date为YYYYMMDD字符串），可以为空
+    """
+    if not pending_dates:
+        return
+    complete_dates = get_complete_trade_dates(pending_dates)
+    deferred = sorted(set(pending_dates) - set(complete_dates))
+    if deferred:
+        print(f"⏳ {len(deferred)} 个交易日数据尚未完整入库，暂不记录为已评估: {', '.join(deferred)}", flush=True)
+    pending_dates = complete_dates
+    if not pending_dates:
+        return
+    hit_counts = {}
+    if not Stock_Selected.empty:
+        hit_counts = Stock_Selected['trade_date'].value_counts().to_dict()
+
+    evaluated_at = datetime.now()
+    params_key = get_params_key(d1, params)
+    rows = [{
+        "formula_name": formula_name,
+        "params_key": params_key,
+        "trade_date": trade_date,
+        "hit_count": int(hit_counts.get(trade_date, 0)),
+        "evaluated_at": evaluated_at
+    } for trade_date in pending_dates]
+
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        ensure_progress_table(conn)
+        conn.execute(text("""
+            INSERT INTO stock_select_progress (formula_name, params_key, trade_date, hit_count, evaluated_at)
+            VALUES (:formula_name, :params_key, :trade_date, :hit_count, :evaluated_at)
+            ON DUPLICATE KEY UPDATE hit_count = VALUES(hit_count), evaluated_at = VALUES(evaluated_at)
+        """), rows)
+
+
 # ========================== 日期处理辅助函数 ==========================
 def get_nearest_workday_forward(date):
     """
@@ -111,19 +547,8 @@ def get_nearest_workday_forward(date):
     ----------
     用于计算buy_date字段
     """
-    # 提取date对象的date部分（去除时分秒），适配chinese_calendar库的参数要求
-    check_date = date.date()
-
-    # 循环判断，直到找到工作日
-    while True:
-        # 判断当前日期是否为工作日（非周末+非法定节假日）
-        if is_workday(check_date):
-            break
-        # 非工作日则向后顺延1天
-        check_date += timedelta(days=1)
-
-    # 将date对象转换回datetime对象（时分秒设为0）并返回
-    return datetime.combine(check_date, datetime.min.time())
+    # 在预先构建的工作日数组上二分查找（当天为工作日则返回当天）
+    return pd.Timestamp(next_workday(date)[0]).to_pydatetime()
 
 
 def get_nearest_workday_backward(date):
@@ -144,19 +569,8 @@ def get_nearest_workday_backward(date):
     ----------
     用于计算gold_date字段
     """
-    # 提取date对象的date部分（去除时分秒），适配chinese_calendar库的参数要求
-    check_date = date.date()
-
-    # 循环判断，直到找到工作日
-    while True:
-        # 判断当前日期是否为工作日（非周末+非法定节假日）
-        if is_workday(check_date):
-            break
-        # 非工作日则向前回溯1天
-        check_date -= timedelta(days=1)
-
-    # 将date对象转换回datetime对象（时分秒设为0）并返回
-    return datetime.combine(check_date, datetime.min.time())
+    # 在预先构建的工作日数组上二分查找（当天为工作日则返回当天）
+    return pd.Timestamp(previous_workday(date)[0]).to_pydatetime()
 
 
 def minus_n_workdays(date, n):
@@ -179,27 +593,133 @@ def minus_n_workdays(date, n):
     ----------
     用于计算gold_date的基准日期（buy_date向前推4个工作日）
     """
-    # 提取date对象的date部分（去除时分秒）
-    current_date = date.date()
-    # 计数器：已找到的工作日数量
-    count = 0
+    # 在预先构建的工作日数组上定位当天之前的第N个工作日
+    return pd.Timestamp(minus_workdays(date, n)[0]).to_pydatetime()
 
-    # 循环向前找，直到凑够N个工作日
-    while count < n:
-        # 日期向前推1天
-        current_date -= timedelta(days=1)
-        # 如果是工作日，计数器+1
-        if is_workday(current_date):
-            count += 1
 
-    # 将date对象转换回datetime对象（时分秒设为0）并返回
-    return datetime.combine(current_date, datetime.min.time())
+# ========================== 核心选股逻辑模块 ==========================
+def resolve_formulas(formulas=None, d1=0):
+    """
+    将公式定义编译为CompiledFormula：未保存的参数取内置默认值，D1参数统一取本次运行的d1
 
+    参数说明：
+    ----------
+    formulas : dict, 可选
+        公式名称 -> 公式定义（get_formula返回的dict，或formula_text/params两个键的dict），
+        默认只包含内置默认公式
+    d1 : int, 可选
+        选股公式中的D1参数
 
-# ========================== 核心选股逻辑模块 ==========================
-def select_stocks(df, d1=0):
+    返回值：
+    ----------
+    dict: 公式名称 -> CompiledFormula
+    """
+    if not formulas:
+        formulas = {DEFAULT_FORMULA_NAME: {"formula_text": DEFAULT_FORMULA, "params": DEFAULT_PARAMS}}
+    return {
+        name: compile_formula(formula["formula_text"], {**DEFAULT_PARAMS, **(formula.get("params") or {}), "D1": d1})
+        for name, formula in formulas.items()
+    }
+
+
+def _finish_selected(data, hit_mask, d1=0):
+    """取出命中记录，并计算buy_date/gold_date（仅针对命中记录）"""
+    Stock_Selected = data[hit_mask].reset_index(drop=True)
+
+    # 紧凑格式的int32日期键(YYYYMMDD)：仅对命中记录转换为datetime
+    if pd.api.types.is_integer_dtype(Stock_Selected['trade_date']):
+        Stock_Selected['trade_date'] = pd.to_datetime(Stock_Selected['trade_date'].astype(str), format='%Y%m%d')
+
+    # 整列日期在工作日查询表上批量二分查找，结果沿用trade_date列的日期类型
+    date_dtype = Stock_Selected['trade_date'].dtype
+
+    # 1. 计算原始buy_date并调整为最近的工作日
+    raw_buy_date = Stock_Selected['trade_date'] - timedelta(days=d1 - 1)
+    buy_date = next_workday(raw_buy_date)
+    Stock_Selected['buy_date'] = pd.Series(buy_date).astype(date_dtype)
+
+    # 2. 基于buy_date向前推4个工作日，再调整为最近的工作日（得到gold_date）
+    gold_date = previous_workday(minus_workdays(buy_date, 4))
+    Stock_Selected['gold_date'] = pd.Series(gold_date).astype(date_dtype)
+
+    return Stock_Selected
+
+
+def select_stocks_multi(df, formulas=None, d1=0):
+    """
+    在同一份数据上一次性运行多个选股公式：整表只排序一次，公式之间相同的子表达式
+    （如REF(CLOSE,D1+3)）只计算一次
+
+    参数说明：
+    ----------
+    df : pandas.DataFrame
+        输入的股票日线数据（load_stock_data的返回值，或compact_stock_frame格式的分块）
+    formulas : dict, 可选
+        公式名称 -> 公式定义，见resolve_formulas
+    d1 : int, 可选
+        选股公式中的D1参数
+
+    返回值：
+    ----------
+    dict
+        公式名称 -> 命中记录DataFrame（结构同select_stocks的返回值，无命中时为空DataFrame）
+    """
+    compiled = resolve_formulas(formulas, d1)
+    if df.empty:
+        return {name: pd.DataFrame() for name in compiled}
+
+    context, masks = evaluate_formulas(df, compiled)
+    return {
+        name: _finish_selected(context.data, mask, d1) if mask.any() else pd.DataFrame()
+        for name, mask in masks.items()
+    }
+
+
+def select_stocks(df, d1=0, formula=None):
+    """
+    核心选股逻辑（向量化版本）：基于通达信公式筛选符合条件的股票
+
+    公式由formula_engine编译为整列NumPy计算计划：整表只排序一次，所有REF滞后值在
+    整列数组上一次算出，条件以整列布尔掩码求值；buy_date/gold_date仅对命中记录计算。
+    使用内置默认公式时，返回结果与select_stocks_by_group逐行一致。
+
+    参数说明：
+    ----------
+    df : pandas.DataFrame
+        输入的股票日线数据（load_stock_data的返回值，或compact_stock_frame格式的分块）
+    d1 : int, 可选
+        选股公式中的D1参数，用于调整滞后值计算，默认值0
+    formula : dict, 可选
+        公式定义（formula_text/params），默认为内置公式DEFAULT_FORMULA
+
+    返回值：
+    ----------
+    pandas.DataFrame
+        符合选股条件的股票数据（trade_date为datetime类型），包含新增字段：
+        - buy_date: 买入日期（datetime类型）
+        - gold_date: 黄金日期（datetime类型）
+
+    内置默认公式的选股条件（需同时满足）：
+    ----------
+    1. 当日涨幅8%以上：REF(CLOSE,D1+3)/REF(CLOSE,D1+4) > 1.08
+    2. 成交量逐日递减：REF(VOL,D1+0)*1.1 < REF(VOL,D1+3)
+                       AND REF(VOL,D1+1)*1.1 < REF(VOL,D1+2)
+                       AND REF(VOL,D1+2)*1.1 < REF(VOL,D1+3)
+    3. 三天前放量：REF(VOL,D1+3) >= 1.5 * REF(VOL,D1+4)
+    4. 最低价递增：REF(LOW,D1+0) > (REF(LOW,D1+3)+REF(CLOSE,D1+3))/2
+                   AND REF(LOW,D1+1) > (REF(LOW,D1+3)+REF(CLOSE,D1+3))/2
+                   AND REF(LOW,D1+2) > (REF(LOW,D1+3)+REF(CLOSE,D1+3))/2
+    """
+    formulas = {"selected": formula} if formula else None
+    return next(iter(select_stocks_multi(df, formulas, d1=d1).values()))
+
+
+def select_stocks_by_group(df, d1=0):
     """
-    核心选股逻辑：基于通达信公式筛选符合条件的股票
+    逐只股票分组计算的原始选股实现（保留用于结果核对与性能基准对比）
+
+    与select_stocks的参数、返回值和选股条件完全一致，但每只股票都要单独排序并
+    构造11个滞后列，数据量大时耗时较长，生产流程请使用select_stocks。
 
     参数说明：
     ----------
@@ -301,8 +821,290 @@ def select_stocks(df, d1=0):
     return Stock_Selected
 
 
+# ========================== 选股执行与结果入库模块 ==========================
+def format_date_for_display(date_str):
+    """格式化日期显示为YYYY-MM-DD"""
+    if len(date_str) == 8:
+        return f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:8]}"
+    return date_str
+
+
+def format_m_d(date_str):
+    """格式化日期为 m.d 格式（去除前导0）"""
+    if len(date_str) == 8:
+        month = date_str[4:6].lstrip('0') or '0'
+        day = date_str[6:8].lstrip('0') or '0'
+        return f"{month}.{day}"
+    elif '-' in date_str:
+        parts = date_str.split('-')
+        if len(parts) >= 3:
+            month = parts[1].lstrip('0') or '0'
+            day = parts[2].lstrip('0') or '0'
+            return f"{month}.{day}"
+    return date_str
+
+
+def format_short_date(date_str):
+    """格式化日期范围显示为 mm/dd"""
+    if len(date_str) == 8:
+        return f"{date_str[4:6]}/{date_str[6:8]}"
+    elif '-' in date_str:
+        parts = date_str.split('-')
+        if len(parts) >= 3:
+            return f"{parts[1]}/{parts[2]}"
+    return date_str
+
+
+def prepare_selected_for_db(Stock_Selected, start_date, end_date, select_text=''):
+    """
+    选股结果入库前处理：添加execute_id/execute_date/execute_time字段、调整字段顺序、日期转为YYYYMMDD
+
+    返回值：
+    ----------
+    tuple: (处理后的DataFrame, execute_id)
+    """
+    # 清理所有ref_开头的临时字段（双重保障）
+    ref_columns = [col for col in Stock_Selected.columns if col.startswith('ref_')]
+    if ref_columns:
+        Stock_Selected = Stock_Selected.drop(columns=ref_columns)
+
+    # 添加程序执行时间字段
+    # 获取当前时间（程序执行结束时间）
+    execute_end_time = datetime.now()
+
+    # execute_id：当前日期+空格+交易日期（Start）+"-"+交易日期（End）+选股说明
+    execute_id_value = execute_end_time.strftime('%Y-%m-%d')
+    start_m_d = format_m_d(start_date)
+    end_m_d = format_m_d(end_date)
+    execute_id_value = f"{execute_id_value} {start_m_d}-{end_m_d}"
+    if select_text:
+        execute_id_value = f"{execute_id_value}{select_text}"
+    Stock_Selected['execute_id'] = execute_id_value
+
+    # 添加 execute_date 和 execute_time 字段（线上数据库主键需要）
+    Stock_Selected['execute_date'] = execute_end_time.date()
+    Stock_Selected['execute_time'] = execute_end_time.time()
+
+    # 调整字段顺序：将execute_id放到最前面
+    if not Stock_Selected.empty:
+        cols = Stock_Selected.columns.tolist()
+        if 'execute_id' in cols:
+            cols.remove('execute_id')
+        new_cols = ['execute_id'] + cols
+        Stock_Selected = Stock_Selected[new_cols]
+
+        # 日期格式转换：将trade_date/buy_date/gold_date转为YYYYMMDD字符串格式
+        Stock_Selected['trade_date'] = Stock_Selected['trade_date'].dt.strftime('%Y%m%d')
+        Stock_Selected['buy_date'] = Stock_Selected['buy_date'].dt.strftime('%Y%m%d')
+        Stock_Selected['gold_date'] = Stock_Selected['gold_date'].dt.strftime('%Y%m%d')
+
+    return Stock_Selected, execute_id_value
+
+
+def write_selected_to_mysql(Stock_Selected):
+    """
+    将选股结果写入stock_selected表（INSERT ... ON DUPLICATE KEY UPDATE，1000条/批），
+    并在同一事务中递增stock_selected的数据版本号（各API进程据此刷新选股记录总数缓存）
+
+    返回值：
+    ----------
+    int: 影响行数
+    异常：
+    ----------
+    写入失败时回滚事务并重新抛出异常
+    """
+    ensure_data_version_table()
+    conn = get_db_engine().raw_connection()
+    cursor = conn.cursor()
+    try:
+        # 提取字段列表（排除索引）
+        columns = Stock_Selected.columns.tolist()
+        # 构建字段字符串
+        cols_str = ', '.join(columns)
+        # 构建占位符字符串
+        placeholders = ', '.join(['%s'] * len(columns))
+        # 构建更新字符串（主键字段不更新，其他字段更新）
+        update_str = ', '.join([
+            f"{col} = VALUES({col})"
+            for col in columns
+            if col not in ['execute_date', 'execute_time', 'ts_code', 'trade_date']
+        ])
+
+        # 构建批量插入SQL语句（MySQL特有ON DUPLICATE KEY UPDATE）
+        sql = f"""
+        INSERT INTO stock_selected ({cols_str}) 
+        VALUES ({placeholders}) 
+        ON DUPLICATE KEY UPDATE {update_str}
+        """
+
+        # 批量处理数据
+        batch_size = 1000
+        total_rows = len(Stock_Selected)
+        affected_count = 0
+
+        for i in range(0, total_rows, batch_size):
+            # 截取批次数据并转换为元组列表
+            batch_data = Stock_Selected.iloc[i:i + batch_size]
+            values = [tuple(row) for row in batch_data.values]
+
+            # 执行批量插入/更新，统计影响行数
+            cursor.executemany(sql, values)
+            affected_count += cursor.rowcount
+
+        cursor.execute(BUMP_VERSION_SQL, (STOCK_SELECTED, datetime.now()))
+        # 提交事务
+        conn.commit()
+        return affected_count
+    except Exception:
+        # 出错时回滚事务
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def run_stock_selection(start_date, end_date, select_text='', d1=0, incremental=False, workers=1, formula_name=None):
+    """
+    执行一次完整的选股任务：读取数据、选股、写入stock_selected并记录任务日志
+
+    参数说明：
+    ----------
+    start_date, end_date : str
+        交易日期区间，格式为YYYYMMDD
+    select_text : str, 可选
+        选股说明，拼接在execute_id末尾
+    d1 : int, 可选
+        选股公式中的D1参数
+    incremental : bool, 可选
+        增量模式：只评估尚未评估过的新交易日
+    workers : int, 可选
+        全量模式下的分片进程数，大于1时按股票哈希分片多进程并行选股
+    formula_name : str, 可选
+        select_formulas表中保存的公式名称，默认使用内置公式
+
+    返回值：
+    ----------
+    dict
+        结构化的执行结果：
+        - ok: 是否成功
+        - stocks_selected: 命中条数
+        - affected_rows: 数据库影响行数
+        - evaluated_dates: 增量模式下本次评估的交易日数量
+        - execute_id: 本次选股批次标识
+        - formula_name: 使用的公式名称
+        - error: 失败原因（成功时为None）
+    """
+    result = {
+        "ok": False,
+        "formula_name": formula_name or SELECT_FORMULA_NAME,
+        "stocks_selected": 0,
+        "affected_rows": 0,
+        "evaluated_dates": 0,
+        "execute_id": None,
+        "error": None
+    }
+
+    display_start = format_date_for_display(start_date)
+    display_end = format_date_for_display(end_date)
+    date_range_str = f"{format_short_date(display_start)} ~ {format_short_date(display_end)}"
+
+    try:
+        log_task_execution("选股", "RUNNING", f"开始执行选股: {display_start} - {display_end}")
+
+        # ===================== 选股公式 =====================
+        formula = None
+        if formula_name:
+            formula = get_formula(formula_name)
+            if formula is None:
+                raise ValueError(f"选股公式不存在: {formula_name}")
+            print(f"📐 使用选股公式: {formula_name}")
+        progress_key = {"formula_name": result["formula_name"], "params": (formula or {}).get("params")}
+        compiled = resolve_formulas({result["formula_name"]: formula} if formula else None, d1)
+        lookback_bars = next(iter(compiled.values())).lookback
+
+        # ===================== 数据加载与选股 =====================
+        pending_dates = []
+        if incremental:
+            # 增量模式：只读取未评估交易日及其回看窗口，只保留新交易日的命中记录
+            pending_dates = get_pending_trade_dates(start_date, end_date, d1=d1, **progress_key)
+            if pending_dates:
+                print(f"\n📥 增量模式：{len(pending_dates)} 个交易日待评估 ({pending_dates[0]} 至 {pending_dates[-1]})")
+                stock_df = load_incremental_stock_data(pending_dates, d1=d1, lookback_bars=lookback_bars)
+                print("🔍 正在执行选股逻辑...")
+                Stock_Selected = select_stocks(stock_df, d1=d1, formula=formula)
+                if not Stock_Selected.empty:
+                    is_new = Stock_Selected['trade_date'].isin(pd.to_datetime(pending_dates, format='%Y%m%d'))
+                    Stock_Selected = Stock_Selected[is_new].reset_index(drop=True)
+            else:
+                print(f"\n✅ 增量模式：{start_date} 至 {end_date} 没有新的交易日需要评估")
+                Stock_Selected = pd.DataFrame()
+        else:
+            # 按股票分块读取日线数据并执行核心选股逻辑（峰值内存只与单块大小相关）
+            print(f"\n📥 正在分块读取 {start_date} 至 {end_date} 的股票日线数据并执行选股逻辑...")
+            if workers > 1:
+                print(f"⚙️ 分片并行：{workers} 个进程")
+            Stock_Selected = select_stocks_sharded(start_date, end_date, d1=d1, workers=workers, formula=formula)
+        result["evaluated_dates"] = len(pending_dates)
+
+        # ===================== 结果数据处理 =====================
+        Stock_Selected, execute_id_value = prepare_selected_for_db(Stock_Selected, start_date, end_date, select_text)
+        result["execute_id"] = execute_id_value
+        result["stocks_selected"] = len(Stock_Selected)
+
+        # ===================== 结果输出与数据库写入 =====================
+        print("\n📊 ===== 选股结果 ======")
+        if Stock_Selected.empty:
+            print("⚠️ 未筛选出符合条件的股票")
+            mark_trade_dates_evaluated(pending_dates, Stock_Selected, d1=d1, **progress_key)
+            log_task_execution("选股", "SUCCESS", f"未筛选出符合条件的股票 (日期范围: {date_range_str})")
+            result["ok"] = True
+            return result
+
+        # 输出选股结果统计信息
+        print(f"✅ 共筛选出 {len(Stock_Selected)} 条符合条件的股票记录")
+        # 展示核心字段的结果（便于快速查看）
+        print("\n核心结果预览：")
+        print(Stock_Selected[['execute_id', 'ts_code', 'trade_date',
+                              'gold_date', 'buy_date', 'price_close', 'vol', 'price_low']])
+
+        # 将结果写入MySQL数据库
+        print("\n📤 开始写入MySQL数据库...")
+        try:
+            affected_count = write_selected_to_mysql(Stock_Selected)
+        except Exception as e:
+            print(f"❌ 数据库写入失败：{str(e)}")
+            log_task_execution("选股", "FAIL", f"数据库写入失败: {str(e)}")
+            result["error"] = f"数据库写入失败: {str(e)}"
+            return result
+        print(f"✅ 数据库写入完成！影响行数: {affected_count}")
+        result["affected_rows"] = affected_count
+
+        # 增量模式：记录本次评估过的交易日
+        mark_trade_dates_evaluated(pending_dates, Stock_Selected, d1=d1, **progress_key)
+
+        log_message = f"日期范围：{date_range_str}；新增条目：{len(Stock_Selected)}条；{select_text}"
+        log_task_execution("选股", "SUCCESS", log_message)
+        result["ok"] = True
+        return result
+
+    except Exception as e:
+        print(f"❌ 执行选股出错: {e}")
+        log_task_execution("选股", "FAIL", f"执行出错: {e}")
+        result["error"] = str(e)
+        return result
+
+
 # ========================== 主程序执行入口 ==========================
 if __name__ == "__main__":
+    # 命令行参数：--incremental 只评估尚未评估过的新交易日；--workers 分片并行进程数；
+    # --formula 选股公式名称（日期区间仍通过stdin传入）
+    parser = argparse.ArgumentParser(description='通达信公式选股')
+    parser.add_argument('--incremental', action='store_true', help='增量模式：只评估新入库的交易日')
+    parser.add_argument('--workers', type=int, default=1, help='全量模式下的分片进程数')
+    parser.add_argument('--formula', default=None, help='select_formulas表中保存的公式名称（默认使用内置公式）')
+    args = parser.parse_args()
+
     # ===================== 初始化日期参数 =====================
     # 获取当前时间，用于计算默认的起始/结束日期
     today = datetime.now()
@@ -314,7 +1116,6 @@ if __name__ == "__main__":
     # 接收用户输入的起始/结束日期（为空则使用默认值）
     # 在 Streamlit 中调用时，通常通过 stdin 传递参数
     try:
-        import sys
         # 尝试读取所有标准输入
         lines = sys.stdin.read().splitlines()
         # 过滤空行
@@ -334,189 +1135,12 @@ if __name__ == "__main__":
         end_date = default_end_date
         select_text = ''
 
-    # ===================== 数据加载与选股 =====================
-    try:
-        # 格式化日期显示为YYYY-MM-DD
-        def format_date_for_display(date_str):
-            if len(date_str) == 8:
-                return f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:8]}"
-            return date_str
-        
-        display_start = format_date_for_display(start_date)
-        display_end = format_date_for_display(end_date)
-        
-        log_task_execution("选股", "RUNNING", f"开始执行选股: {display_start} - {display_end}")
-        
-        # 加载指定日期区间的股票日线数据
-        print(f"\n📥 正在读取 {start_date} 至 {end_date} 的股票日线数据...")
-        stock_df = load_stock_data(start_date=start_date, end_date=end_date)
-
-        # 执行核心选股逻辑
-        print("🔍 正在执行选股逻辑...")
-        Stock_Selected = select_stocks(stock_df, d1=0)
-
-        # ===================== 结果数据处理 =====================
-        # 清理所有ref_开头的临时字段（双重保障）
-        ref_columns = [col for col in Stock_Selected.columns if col.startswith('ref_')]
-        if ref_columns:
-            Stock_Selected = Stock_Selected.drop(columns=ref_columns)
-
-        # 添加程序执行时间字段
-        # 获取当前时间（程序执行结束时间）
-        execute_end_time = datetime.now()
-        
-        # 格式化日期为 m.d 格式（去除前导0）
-        def format_m_d(date_str):
-            if len(date_str) == 8:
-                month = date_str[4:6].lstrip('0') or '0'
-                day = date_str[6:8].lstrip('0') or '0'
-                return f"{month}.{day}"
-            elif '-' in date_str:
-                parts = date_str.split('-')
-                if len(parts) >= 3:
-                    month = parts[1].lstrip('0') or '0'
-                    day = parts[2].lstrip('0') or '0'
-                    return f"{month}.{day}"
-            return date_str
-        
-        # execute_id：当前日期+空格+交易日期（Start）+"-"+交易日期（End）+选股说明
-        execute_id_value = execute_end_time.strftime('%Y-%m-%d')
-        start_m_d = format_m_d(start_date)
-        end_m_d = format_m_d(end_date)
-        execute_id_value = f"{execute_id_value} {start_m_d}-{end_m_d}"
-        if select_text:
-            execute_id_value = f"{execute_id_value}{select_text}"
-        Stock_Selected['execute_id'] = execute_id_value
-        
-        # 添加 execute_date 和 execute_time 字段（线上数据库主键需要）
-        Stock_Selected['execute_date'] = execute_end_time.date()
-        Stock_Selected['execute_time'] = execute_end_time.time()
-
-        # 调整字段顺序：将execute_id放到最前面
-        if not Stock_Selected.empty:
-            cols = Stock_Selected.columns.tolist()
-            if 'execute_id' in cols:
-                cols.remove('execute_id')
-            new_cols = ['execute_id'] + cols
-            Stock_Selected = Stock_Selected[new_cols]
-
-            # 日期格式转换：将trade_date/buy_date/gold_date转为YYYYMMDD字符串格式
-            Stock_Selected['trade_date'] = Stock_Selected['trade_date'].dt.strftime('%Y%m%d')
-            Stock_Selected['buy_date'] = Stock_Selected['buy_date'].dt.strftime('%Y%m%d')
-            Stock_Selected['gold_date'] = Stock_Selected['gold_date'].dt.strftime('%Y%m%d')
-
-        # ===================== 结果输出与数据库写入 =====================
-        print("\n📊 ===== 选股结果 ======")
-        if not Stock_Selected.empty:
-            # 输出选股结果统计信息
-            print(f"✅ 共筛选出 {len(Stock_Selected)} 条符合条件的股票记录")
-            # 展示核心字段的结果（便于快速查看）
-            print("\n核心结果预览：")
-            print(Stock_Selected[['execute_id', 'ts_code', 'trade_date',
-                                  'gold_date', 'buy_date', 'price_close', 'vol', 'price_low']])
-
-            # 将结果写入MySQL数据库
-            print("\n📤 开始写入MySQL数据库...")
-            try:
-                # 1. 先创建数据库连接游标
-                conn = engine.raw_connection()
-                cursor = conn.cursor()
-
-                # 2. 遍历每条数据，执行INSERT ... ON DUPLICATE KEY UPDATE逻辑
-                # 提取字段列表（排除索引）
-                columns = Stock_Selected.columns.tolist()
-                # 构建字段字符串
-                cols_str = ', '.join(columns)
-                # 构建占位符字符串
-                placeholders = ', '.join(['%s'] * len(columns))
-                # 构建更新字符串（主键字段不更新，其他字段更新）
-                update_str = ', '.join([
-                    f"{col} = VALUES({col})"
-                    for col in columns
-                    if col not in ['execute_date', 'execute_time', 'ts_code', 'trade_date']
-                ])
-
-                # 3. 批量处理数据
-                batch_size = 1000
-                total_rows = len(Stock_Selected)
-                inserted_count = 0
-                updated_count = 0
-
-                for i in range(0, total_rows, batch_size):
-                    # 截取批次数据
-                    batch_data = Stock_Selected.iloc[i:i + batch_size]
-                    # 转换为元组列表
-                    values = [tuple(row) for row in batch_data.values]
-
-                    # 构建批量插入SQL语句（MySQL特有ON DUPLICATE KEY UPDATE）
-                    sql = f"""
-                    INSERT INTO stock_selected ({cols_str}) 
-                    VALUES ({placeholders}) 
-                    ON DUPLICATE KEY UPDATE {update_str}
-                    """
-
-                    # 执行批量插入/更新
-                    cursor.executemany(sql, values)
-                    # 统计插入/更新行数
-                    rowcount = cursor.rowcount
-                    inserted_count += rowcount 
-                    
-                # 4. 提交事务
-                conn.commit()
-                print(f"✅ 数据库写入完成！影响行数: {inserted_count}")
-
-                # 5. 关闭游标和连接
-                cursor.close()
-                conn.close()
-                
-                # 格式化日期范围显示为 mm/dd ~ mm/dd
-                def format_short_date(date_str):
-                    if len(date_str) == 8:
-                        return f"{date_str[4:6]}/{date_str[6:8]}"
-                    elif '-' in date_str:
-                        parts = date_str.split('-')
-                        if len(parts) >= 3:
-                            return f"{parts[1]}/{parts[2]}"
-                    return date_str
-                
-                date_range_str = f"{format_short_date(display_start)} ~ {format_short_date(display_end)}"
-                log_message = f"日期范围：{date_range_str}；新增条目：{len(Stock_Selected)}条；{select_text}"
-                
-                log_task_execution("选股", "SUCCESS", log_message)
-
-            except Exception as e:
-                print(f"❌ 数据库写入失败：{str(e)}")
-                log_task_execution("选股", "FAIL", f"数据库写入失败: {str(e)}")
-                # 出错时回滚事务
-                if 'conn' in locals() and conn.open:
-                    conn.rollback()
-        else:
-            print("⚠️ 未筛选出符合条件的股票")
-            def format_short_date(date_str):
-                if len(date_str) == 8:
-                    return f"{date_str[4:6]}/{date_str[6:8]}"
-                elif '-' in date_str:
-                    parts = date_str.split('-')
-                    if len(parts) >= 3:
-                        return f"{parts[1]}/{parts[2]}"
-                return date_str
-            
-            date_range_str = f"{format_short_date(display_start)} ~ {format_short_date(display_end)}"
-            log_task_execution("选股", "SUCCESS", f"未筛选出符合条件的股票 (日期范围: {date_range_str})")
-            
-    except Exception as e:
-        print(f"❌ 执行选股出错: {e}")
-        log_task_execution("选股", "FAIL", f"执行出错: {e}")
-
-
-        # 可选：将结果保存到Excel文件
-        # Stock_Selected.to_excel('选股结果.xlsx', index=False)
-        # print("📄 结果已保存到选股结果.xlsx文件")
-    else:
-        # 无符合条件的记录时的提示
-        print("❌ 未找到符合条件的股票，无需写入数据库")
+    # ===================== 执行选股 =====================
+    run_stock_selection(start_date, end_date, select_text, d1=0, incremental=args.incremental,
+                        workers=args.workers, formula_name=args.formula)
 
     # ===================== 资源释放 =====================
-    # 关闭数据库连接引擎，释放资源
-    engine.dispose()
+    # 写完任务日志后关闭数据库连接引擎，释放资源
+    flush_task_logs()
+    get_db_engine().dispose()
     print("\n🔚 程序执行完成，数据库连接已关闭")
@@ -2,18 +2,27 @@
 """
 A股日线数据批量拉取与MySQL入库工具
 功能说明：
-1. 按日期范围拉取Tushare的A股日线数据，支持无限重试机制
-2. 单日数据实时写入MySQL，内存仅保留单日数据，避免内存累积
+1. 按日期范围并发拉取Tushare的A股日线数据，令牌桶限流，失败按指数退避重试
+2. 拉取与写入流水线重叠执行，有界队列背压，内存仅保留少量几天的数据
 3. 以(ts_code, trade_date)为联合主键，实现重复数据更新、新增数据插入
 4. 精准统计总记录数、更新数、新增数，无负数统计异常
+5. 每个交易日写入完成后记录检查点（条目数+内容哈希），支持断点续传（--resume）与只补缺口（--gaps-only）
+6. 入库的同时写入本地Parquet缓存（按年/月分区），供选股、校验与统计接口读取
+7. 每日写入时在同一事务中更新按交易日汇总的条目数（daily_row_counts），供按月统计与校验读取
+8. 同时记录Tushare当日返回的条目数（tushare_day_counts），数据校验时无需重新拉取
+9. 全部交易日写入完成后刷新最新收盘价快照（latest_close），供首页统计读取
 """
 
 import tushare as ts
 import pandas as pd
-from datetime import datetime, timedelta
-import time
+from datetime import datetime
+import argparse
+import hashlib
+import itertools
 import os
+import queue
 import sys
+import threading
 from dotenv import load_dotenv
 
 # 添加当前目录到系统路径，以便导入 db_utils
@@ -22,11 +31,25 @@ if current_dir not in sys.path:
     sys.path.append(current_dir)
 
 try:
-    from db_utils import get_db_engine, log_task_execution
+    from db_utils import daily_write_lock_name, get_db_engine, get_int_config, log_task_execution, to_yyyymmdd
+    from sqlalchemy import text
+    from tushare_fetcher import DAILY_FIELDS, TushareFetcher
+    from daily_cache import write_day as write_cache_day
+    from daily_row_counts import UPSERT_DAY_SQL as UPSERT_ROW_COUNT_SQL, ensure_row_count_table
+    from latest_close import refresh_latest_close
+    from source_counts import UPSERT_DAY_SQL as UPSERT_SOURCE_COUNT_SQL, ensure_source_count_table
+    from trade_calendar import get_trading_days
 except ImportError:
     # 如果作为模块导入时可能需要这样
     sys.path.append(os.path.join(os.path.dirname(current_dir)))
-    from utils.db_utils import get_db_engine, log_task_execution
+    from utils.db_utils import daily_write_lock_name, get_db_engine, get_int_config, log_task_execution, to_yyyymmdd
+    from sqlalchemy import text
+    from utils.tushare_fetcher import DAILY_FIELDS, TushareFetcher
+    from utils.daily_cache import write_day as write_cache_day
+    from utils.daily_row_counts import UPSERT_DAY_SQL as UPSERT_ROW_COUNT_SQL, ensure_row_count_table
+    from utils.latest_close import refresh_latest_close
+    from utils.source_counts import UPSERT_DAY_SQL as UPSERT_SOURCE_COUNT_SQL, ensure_source_count_table
+    from utils.trade_calendar import get_trading_days
 
 # 加载环境变量
 load_dotenv()
@@ -36,108 +59,273 @@ load_dotenv('.env.local')
 # Tushare Pro接口初始化（优先从环境变量读取）
 tushare_token = os.getenv('TUSHARE_TOKEN', '1f18885fdd078e681cf087e23c1d6f28226103f470ccf8f30fc38809')
 pro = ts.pro_api(tushare_token)
+# 并发拉取器（限流、并发数、重试上限见 tushare_fetcher 模块配置说明）
+fetcher = TushareFetcher(pro)
 
 # ===================== 数据库操作函数 =====================
 
+# 数据表cn_stock_daily的写入字段，与Tushare返回字段一一对应
+DB_COLUMNS = [
+    'ts_code', 'trade_date', 'price_open', 'price_high', 'price_low', 'price_close',
+    'price_pre_close', 'amt_chg', 'pct_chg', 'vol', 'amount', 'update_date'
+]
+SOURCE_COLUMNS = ['ts_code', 'trade_date', 'open', 'high', 'low', 'close', 'pre_close', 'change', 'pct_chg', 'vol', 'amount']
+NUMERIC_COLUMNS = SOURCE_COLUMNS[2:]
+
+# 会话级临时表：单日数据先写入临时表，再与正式表合并
+STAGING_TABLE = 'cn_stock_daily_staging'
+# 单条多行VALUES语句包含的行数
+INSERT_BATCH_SIZE = 1000
+# 等待cn_stock_daily写入锁的秒数（表结构迁移切换新表期间持有全部槽位），超时则当日写入失败
+DAILY_WRITE_LOCK_TIMEOUT = get_int_config('DAILY_WRITE_LOCK_TIMEOUT', 600)
+
+# 每个写入线程固定使用一个写入锁槽位，多个写入线程之间互不等待
+_write_lock_slot = threading.local()
+_write_lock_slots = itertools.count()
+
+
+def ensure_checkpoint_table():
+    """创建抽取检查点表ingest_checkpoints（如果不存在）"""
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+            trade_date VARCHAR(8) PRIMARY KEY COMMENT '交易日期(YYYYMMDD)',
+            row_count INT NOT NULL COMMENT 'Tushare返回并写入的条目数',
+            content_hash CHAR(32) NOT NULL COMMENT '当日数据内容哈希(MD5)',
+            completed_at DATETIME NOT NULL COMMENT '写入完成时间'
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='日K线抽取检查点'
+        """))
+
+
+def content_hash(df_data):
+    """计算单日数据的内容哈希（按股票代码排序，与返回顺序无关）"""
+    df_sorted = df_data[SOURCE_COLUMNS].sort_values('ts_code', kind='mergesort')
+    row_hashes = pd.util.hash_pandas_object(df_sorted, index=False).to_numpy()
+    return hashlib.md5(row_hashes.tobytes()).hexdigest()
+
+
+def get_checkpoints(start_date, end_date):
+    """
+    查询日期区间内已完成的检查点
+
+    返回：
+        dict: {trade_date: row_count}
+    """
+    engine = get_db_engine()
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT trade_date, row_count FROM ingest_checkpoints
+            WHERE trade_date BETWEEN :start_date AND :end_date
+        """), {"start_date": start_date, "end_date": end_date}).fetchall()
+    return {row[0]: row[1] for row in rows}
+
+
+def get_stored_counts(start_date, end_date):
+    """
+    查询日期区间内数据库中每个交易日实际存储的条目数
+
+    返回：
+        dict: {trade_date: 条目数}
+    """
+    engine = get_db_engine()
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT trade_date, COUNT(*) FROM cn_stock_daily
+            WHERE trade_date BETWEEN :start_date AND :end_date
+            GROUP BY trade_date
+        """), {"start_date": start_date, "end_date": end_date}).fetchall()
+    return {to_yyyymmdd(row[0]): row[1] for row in rows}
+
+
+def filter_trade_dates(trade_dates, mode):
+    """
+    按运行模式筛选需要处理的交易日
+
+    参数：
+        trade_dates: 区间内全部交易日（升序）
+        mode: 'full' 全部处理 / 'resume' 跳过已有检查点的交易日 /
+              'gaps' 只处理没有检查点、或数据库条目数少于检查点条目数的交易日
+    返回：
+        list: 需要处理的交易日
+    """
+    if mode == 'full' or not trade_dates:
+        return trade_dates
+    checkpoints = get_checkpoints(trade_dates[0], trade_dates[-1])
+    if mode == 'resume':
+        return [d for d in trade_dates if d not in checkpoints]
+    stored = get_stored_counts(trade_dates[0], trade_dates[-1])
+    return [d for d in trade_dates if d not in checkpoints or stored.get(d, 0) < checkpoints[d]]
+
+
+def build_daily_rows(df_data, update_date):
+    """
+    按列构造批量写入的参数元组（不逐行遍历DataFrame）
+
+    参数：
+        df_data: 单日数据DataFrame（Tushare字段）
+        update_date: 更新日期，格式为'YYYYMMDD'
+    返回：
+        list[tuple]: 与DB_COLUMNS顺序一致的参数元组列表
+    """
+    # nan值替换为0；tolist()直接得到Python原生类型，可被驱动直接转义
+    columns = [df_data['ts_code'].tolist(), df_data['trade_date'].tolist()]
+    columns += [df_data[col].fillna(0).tolist() for col in NUMERIC_COLUMNS]
+    columns.append([update_date] * len(df_data))
+    return list(zip(*columns))
+
+
+def raise_on_warnings(cursor, step):
+    """
+    检查上一条语句产生的警告：非严格模式下截断、类型转换失败只产生警告并写入被强制转换的值，
+    此处将其视为错误，由调用方回滚当日事务（不写检查点，续传时重新抽取该日）
+    """
+    cursor.execute("SHOW WARNINGS")
+    warnings = [row for row in cursor.fetchall() if row[0] in ('Warning', 'Error')]
+    if warnings:
+        details = '; '.join(f"{row[1]}: {row[2]}" for row in warnings[:3])
+        raise ValueError(f"{step}产生 {len(warnings)} 条警告（数据被截断或转换）：{details}")
+
+
+def acquire_daily_write_lock(cursor):
+    """
+    获取当前线程的cn_stock_daily写入锁槽位（db_utils.daily_write_lock_name），返回锁名
+    表结构迁移正在切换cn_stock_daily时等待其完成，超过DAILY_WRITE_LOCK_TIMEOUT秒抛出RuntimeError
+    """
+    if not hasattr(_write_lock_slot, 'slot'):
+        _write_lock_slot.slot = next(_write_lock_slots)
+    lock_name = daily_write_lock_name(_write_lock_slot.slot)
+    cursor.execute("SELECT GET_LOCK(%s, %s)", (lock_name, DAILY_WRITE_LOCK_TIMEOUT))
+    if cursor.fetchone()[0] != 1:
+        raise RuntimeError(f"等待cn_stock_daily写入锁超时（{DAILY_WRITE_LOCK_TIMEOUT}秒），表结构迁移可能正在切换新表")
+    return lock_name
+
+
+def insert_multi_values(cursor, insert_prefix, rows, batch_size=INSERT_BATCH_SIZE):
+    """
+    以多行VALUES语句分批写入，每批一次网络往返；每批写入后检查警告，数据被截断或转换时抛出ValueError
+
+    参数：
+        cursor: DB-API游标
+        insert_prefix: 'INSERT INTO 表名 (字段...)' 语句前缀
+        rows: 参数元组列表
+    返回：
+        int: 各批次affected rows之和
+    """
+    if not rows:
+        return 0
+    row_placeholder = '(' + ', '.join(['%s'] * len(rows[0])) + ')'
+    affected = 0
+    for i in range(0, len(rows), batch_size):
+        batch = rows[i:i + batch_size]
+        sql = f"{insert_prefix} VALUES {', '.join([row_placeholder] * len(batch))}"
+        cursor.execute(sql, [value for row in batch for value in row])
+        affected += cursor.rowcount
+        raise_on_warnings(cursor, insert_prefix.split('(')[0].strip())
+    return affected
+
+
 def write_to_mysql_with_update(df_data):
     """
     数据写入MySQL核心函数（插入/更新）
     逻辑说明：
         1. 以(ts_code, trade_date)为联合主键，存在则更新，不存在则插入
-        2. 先查询已存在的主键数，精准统计更新数（避免依赖cursor.rowcount的兼容性问题）
-        3. 批量写入（1000条/批），避免单次写入数据量过大导致超时
+        2. 单日数据以多行VALUES语句写入会话级临时表，再用两条语句与正式表合并：
+           UPDATE ... JOIN 更新已存在的行，INSERT ... SELECT ... WHERE NOT EXISTS 插入新行
+        3. 插入语句的affected rows即为新增数，更新数 = 总数 - 新增数，无需额外查询主键是否存在；
+           不使用INSERT IGNORE：截断、类型转换错误不会被静默跳过，每步写入后检查警告，有警告时当日失败回滚
+        4. 检查点（条目数+内容哈希）、当日条目数汇总与数据在同一事务中提交，进程中断时不会出现有检查点而无数据的情况
+        5. 提交后同步写入本地列式缓存（daily_cache）
+        6. 写入期间持有cn_stock_daily写入锁的一个槽位，表结构迁移（004）切换新表时不会丢失正在写入的数据
 
     参数：
         df_data: 待写入的单日数据DataFrame
     返回：
-        tuple: (总条目数, 更新条目数)
+        tuple: (总条目数, 更新条目数)；写入失败（已回滚）时返回None
     """
-    
+
     # 获取当前日期（yyyymmdd格式）
     today = datetime.now().strftime('%Y%m%d')
-    
-    # 插入/更新SQL语句（字段与数据表cn_stock_daily严格对应）
-    insert_sql = """
-    INSERT INTO cn_stock_daily (
-        ts_code, trade_date, price_open, price_high, price_low, price_close,
-        price_pre_close, amt_chg, pct_chg, vol, amount, update_date
-    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-    ON DUPLICATE KEY UPDATE
-        price_open = VALUES(price_open),
-        price_high = VALUES(price_high),
-        price_low = VALUES(price_low),
-        price_close = VALUES(price_close),
-        price_pre_close = VALUES(price_pre_close),
-        amt_chg = VALUES(amt_chg),
-        pct_chg = VALUES(pct_chg),
-        vol = VALUES(vol),
-        amount = VALUES(amount),
-        update_date = VALUES(update_date);
-    """
-
-    # ========== 新增：处理nan值，替换为0 ==========
-    # 定义需要处理的列名（对应DataFrame中的实际列名）
-    cols_to_clean = ['open', 'high', 'low', 'close', 'pre_close', 'change', 'pct_chg', 'vol', 'amount']
-    # 将指定列的nan值替换为0（inplace=True直接修改原DataFrame，避免创建副本）
-    df_data[cols_to_clean] = df_data[cols_to_clean].fillna(0)
+    columns_sql = ', '.join(DB_COLUMNS)
+    update_sql = ', '.join(f"d.{col} = s.{col}" for col in DB_COLUMNS[2:])
 
     total_count = len(df_data)  # 当日待写入总条目数
-    update_count = 0  # 实际更新的条目数（主键重复）
-    insert_count = 0  # 实际插入的条目数（新数据）
+    day_hash = content_hash(df_data) if total_count else None  # 当日内容哈希（检查点与本地缓存共用）
     conn = None  # 数据库连接对象
     cursor = None  # 数据库游标对象
+    lock_name = None  # 持有的写入锁
 
     try:
         # 建立数据库连接
         engine = get_db_engine()
         conn = engine.raw_connection()
         cursor = conn.cursor()
-
-        # 将DataFrame转换为SQL批量插入的元组列表
-        data_tuples = [
-            (
-                row['ts_code'], row['trade_date'], row['open'], row['high'], row['low'],
-                row['close'], row['pre_close'], row['change'], row['pct_chg'],
-                row['vol'], row['amount'], today
-            ) for _, row in df_data.iterrows()
-        ]
-
-        # 分批执行插入/更新（每批1000条）
-        batch_size = 1000
-        for i in range(0, total_count, batch_size):
-            batch = data_tuples[i:i + batch_size]
-            batch_len = len(batch)
-
-            # 步骤1：查询当前批次中已存在的主键数量（即需要更新的条目数）
-            key_tuples = [(item[0], item[1]) for item in batch]  # 提取(ts_code, trade_date)
-            placeholders = ', '.join(['(%s, %s)'] * batch_len)  # 构造IN查询占位符
-            check_sql = f"""
-            SELECT COUNT(*) FROM cn_stock_daily 
-            WHERE (ts_code, trade_date) IN ({placeholders});
-            """
-            
-            flat_keys = [k for t in key_tuples for k in t]  # 扁平化元组列表（适配SQL参数）
-            cursor.execute(check_sql, flat_keys)
-            batch_update_count = cursor.fetchone()[0]  # 获取当前批次更新数
-            update_count += batch_update_count
-            insert_count += (batch_len - batch_update_count)  # 计算当前批次插入数
-
-            # 步骤2：执行插入/更新操作
-            cursor.executemany(insert_sql, batch)
+        lock_name = acquire_daily_write_lock(cursor)
+
+        # 临时表只对当前连接可见；连接池复用连接时清空上一次残留的数据
+        cursor.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS {STAGING_TABLE} LIKE cn_stock_daily")
+        cursor.execute(f"DELETE FROM {STAGING_TABLE}")
+
+        # 步骤1：多行VALUES写入临时表
+        insert_multi_values(cursor, f"INSERT INTO {STAGING_TABLE} ({columns_sql})", build_daily_rows(df_data, today))
+
+        # 步骤2：更新正式表中已存在的行
+        cursor.execute(f"""
+        UPDATE cn_stock_daily d
+        JOIN {STAGING_TABLE} s ON d.ts_code = s.ts_code AND d.trade_date = s.trade_date
+        SET {update_sql}
+        """)
+        raise_on_warnings(cursor, "更新cn_stock_daily")
+
+        # 步骤3：插入正式表中不存在的行，affected rows即为新增条目数
+        cursor.execute(f"""
+        INSERT INTO cn_stock_daily ({columns_sql})
+        SELECT {', '.join(f's.{col}' for col in DB_COLUMNS)} FROM {STAGING_TABLE} s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM cn_stock_daily d WHERE d.ts_code = s.ts_code AND d.trade_date = s.trade_date
+        )
+        """)
+        insert_count = cursor.rowcount
+        raise_on_warnings(cursor, "写入cn_stock_daily")
+
+        # 步骤4：记录当日检查点，更新当日条目数汇总（新增的行计入汇总）与Tushare条目数缓存
+        if total_count:
+            trade_date = str(df_data['trade_date'].iloc[0])
+            cursor.execute(UPSERT_ROW_COUNT_SQL, (trade_date, total_count, datetime.now(), insert_count))
+            cursor.execute(UPSERT_SOURCE_COUNT_SQL, (trade_date, total_count, datetime.now()))
+            cursor.execute("""
+            INSERT INTO ingest_checkpoints (trade_date, row_count, content_hash, completed_at)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                row_count = VALUES(row_count),
+                content_hash = VALUES(content_hash),
+                completed_at = VALUES(completed_at)
+            """, (trade_date, total_count, day_hash, datetime.now()))
 
         conn.commit()  # 提交事务
 
-        # 数据一致性校验：总条目数必须等于插入数+更新数
-        # assert total_count == insert_count + update_count, "统计异常：总条目数≠插入数+更新数"
-        return total_count, update_count
+        # 步骤5：同步写入本地列式缓存（失败不影响入库，读取时该月会回退数据库查询）
+        try:
+            cache_frame = df_data[SOURCE_COLUMNS].rename(columns=dict(zip(SOURCE_COLUMNS, DB_COLUMNS)))
+            cache_frame[DB_COLUMNS[2:11]] = cache_frame[DB_COLUMNS[2:11]].fillna(0)
+            write_cache_day(cache_frame, day_hash)
+        except Exception as cache_err:
+            print(f"⚠️ 本地缓存写入失败：{cache_err}", flush=True)
+        return total_count, total_count - insert_count
 
     except Exception as err:
         # 异常处理：回滚事务并提示具体错误
         if conn:
             conn.rollback()
         print(f"❌ 数据写入失败：{err}", flush=True)
-        return total_count, 0
+        return None
     finally:
+        # 命名锁属于会话而非事务，连接归还连接池前必须释放
+        if lock_name:
+            try:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (lock_name,))
+            except Exception as lock_err:
+                print(f"⚠️ 释放写入锁失败（连接断开时锁随会话释放）：{lock_err}", flush=True)
         # 资源释放：无论是否异常，都关闭游标和连接
         if cursor:
             cursor.close()
@@ -146,72 +334,124 @@ def write_to_mysql_with_update(df_data):
 
 
 # ===================== 数据拉取函数 =====================
-def get_single_day_data(trade_date):
+def print_day_result(trade_date, record_count):
+    """输出单日拉取结果（区分交易日和非交易日）"""
+    if record_count > 0:
+        # 格式化日期输出，提升可读性
+        print(f"{trade_date[:4]}-{trade_date[4:6]}-{trade_date[6:]} 成功，共 {record_count} 条记录", flush=True)
+    else:
+        print(f"没有数据（可能是非交易日） {trade_date[:4]}-{trade_date[4:6]}-{trade_date[6:]}", flush=True)
+
+
+# ===================== 拉取/写入流水线 =====================
+_STOP = object()  # 写入线程的结束标记
+
+
+def run_ingest_pipeline(trade_dates, writers=None, queue_days=None):
     """
-    拉取单日A股日线数据（带无限重试机制）
+    拉取与写入重叠执行的有界流水线
+
     逻辑说明：
-        1. 调用Tushare pro.daily接口拉取指定日期数据
-        2. 接口调用失败时，等待65秒后无限重试（直到成功或无数据）
-        3. 区分交易日（有数据）和非交易日（无数据）
+        1. 拉取线程通过fetcher并发拉取，按日期顺序将单日DataFrame放入有界队列
+        2. 一个或多个写入线程从队列取出数据写库；队列满时拉取线程阻塞（背压），内存只保留少量几天的数据
+        3. 写入结果在调用方线程按日期顺序产出，保证逐日进度输出的顺序
 
     参数：
-        trade_date: 交易日，格式为'YYYYMMDD'
+        trade_dates: 交易日列表，格式为'YYYYMMDD'，升序
+        writers: 写入线程数，默认读取INGEST_WRITERS（1）
+        queue_days: 待写入队列最多缓存的天数，默认读取INGEST_QUEUE_DAYS（4）
     返回：
-        DataFrame: 成功返回单日数据，无数据返回空DataFrame
+        generator: 按日期顺序产出 (trade_date, 当日记录数, 写入条目数, 更新条目数)；
+                   当日写入失败时写入条目数与更新条目数为None
+    异常：
+        拉取或写入线程中的异常（如TushareFetchError）在调用方线程重新抛出
     """
-    retry_count = 0  # 重试次数计数器
+    writers = max(1, writers or get_int_config('INGEST_WRITERS', 1))
+    queue_days = max(1, queue_days or get_int_config('INGEST_QUEUE_DAYS', 4))
+    day_queue = queue.Queue(maxsize=queue_days)
+    result_queue = queue.Queue()
+    stop_event = threading.Event()
+
+    def put_with_stop(item):
+        """放入待写入队列；流水线被中止时放弃"""
+        while not stop_event.is_set():
+            try:
+                day_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
 
-    while True:
+    def fetch_worker():
         try:
-            # 调用Tushare接口拉取数据（字段与数据表严格对应）
-            df = pro.daily(
-                trade_date=trade_date,
-                fields=[
-                    "ts_code",  # 股票代码
-                    "trade_date",  # 交易日期
-                    "open",  # 开盘价
-                    "high",  # 最高价
-                    "low",  # 最低价
-                    "close",  # 收盘价
-                    "pre_close",  # 前收盘价
-                    "change",  # 涨跌额
-                    "pct_chg",  # 涨跌幅(%)
-                    "vol",  # 成交量(手)
-                    "amount"  # 成交额(千元)
-                ]
-            )
-
-            # 数据返回处理
-            if not df.empty:
-                # 格式化日期输出，提升可读性
-                print(f"{trade_date[:4]}-{trade_date[4:6]}-{trade_date[6:]} 成功，共 {len(df)} 条记录", flush=True)
-                return df
-            else:
-                print(f"没有数据（可能是非交易日） {trade_date[:4]}-{trade_date[4:6]}-{trade_date[6:]}", flush=True)
-                return df  # 返回空DataFrame
-
+            for index, (trade_date, df) in enumerate(fetcher.iter_daily(trade_dates, DAILY_FIELDS)):
+                if not put_with_stop((index, trade_date, df)):
+                    return
         except Exception as e:
-            # 接口调用失败，重试逻辑
-            retry_count += 1
-            print(f"获取 {trade_date} 数据时出错 (第{retry_count}次重试): {e}", flush=True)
-            print(f"等待 15 秒后重试...", flush=True)
-            time.sleep(15)  # 重试间隔15秒
+            result_queue.put(e)
+        finally:
+            for _ in range(writers):
+                put_with_stop(_STOP)
+
+    def write_worker():
+        while not stop_event.is_set():
+            try:
+                item = day_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is _STOP:
+                return
+            index, trade_date, df = item
+            try:
+                if df.empty:
+                    result_queue.put((index, trade_date, 0, 0, 0))
+                else:
+                    written = write_to_mysql_with_update(df)
+                    day_total, day_updated = written if written is not None else (None, None)
+                    result_queue.put((index, trade_date, len(df), day_total, day_updated))
+            except Exception as e:
+                result_queue.put(e)
+                return
+
+    threads = [threading.Thread(target=fetch_worker, name="ingest-fetch", daemon=True)]
+    threads += [threading.Thread(target=write_worker, name=f"ingest-write-{i}", daemon=True) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+
+    # 多个写入线程可能乱序完成，先缓存再按日期顺序产出
+    finished = {}
+    next_index = 0
+    try:
+        while next_index < len(trade_dates):
+            item = result_queue.get()
+            if isinstance(item, Exception):
+                raise item
+            finished[item[0]] = item[1:]
+            while next_index in finished:
+                yield finished.pop(next_index)
+                next_index += 1
+    finally:
+        stop_event.set()
+        for thread in threads:
+            thread.join()
 
 
 # ===================== 主逻辑函数 =====================
-def get_daily_data_by_day(start_date, end_date):
+def get_daily_data_by_day(start_date, end_date, mode='full'):
     """
     按日期范围批量拉取+写入数据（内存优化版）
     核心优化：
-        1. 内存仅保留单日数据，循环结束后立即释放，避免内存累积
-        2. 独立变量累加统计，不依赖最终合并的DataFrame
-        3. 单日数据拉取完成后，立即写入数据库
+        1. 仅拉取交易日，多个日期并发拉取（令牌桶限流）
+        2. 拉取与写库通过有界队列重叠执行，内存只保留少量几天的数据
+        3. 独立变量累加统计，不依赖最终合并的DataFrame，进度按日期顺序输出
 
     参数：
         start_date: 开始日期，格式为'YYYYMMDD'
         end_date: 结束日期，格式为'YYYYMMDD'
+        mode: 'full' 全量 / 'resume' 跳过已完成的交易日 / 'gaps' 只补条目数不足的交易日
     返回：
-        tuple: (是否获取到数据, 总记录数, 累计写入数, 累计更新数)
+        tuple: (是否获取到数据, 总记录数, 累计写入数, 累计更新数, 按年统计, 写入失败的交易日列表)
+               写入失败的交易日不计入统计
     """
     # 日期格式转换：字符串→datetime对象（便于日期遍历）
     start = datetime.strptime(start_date, '%Y%m%d')
@@ -222,31 +462,43 @@ def get_daily_data_by_day(start_date, end_date):
     total_write_count = 0  # 累计写入数据库条目数
     total_update_count = 0  # 累计更新条目数（主键重复）
     has_data = False  # 标记是否获取到有效数据
+    latest_date = None  # 本次写入的最新交易日
+    failed_dates = []  # 写入失败（已回滚）的交易日
     # 新增：按年统计的字典，结构 {年份: {'累计写入': 0, '累计更新': 0, '新增': 0}}
     year_stats = {}
 
-    # 计算需要处理的总天数
+    # 只处理交易所交易日（周末、节假日不调用接口）
     total_days = (end - start).days + 1
-    print(f"共需要处理 {total_days} 天", flush=True)
-
-    # 按日期循环拉取+写入数据
-    for day_count in range(total_days):
-        current_date = start + timedelta(days=day_count)  # 计算当前循环日期
-        trade_date = current_date.strftime('%Y%m%d')  # 转换为YYYYMMDD格式
+    all_trade_dates = get_trading_days(start_date, end_date)
+
+    # 断点续传/补缺口：根据检查点跳过已完成的交易日
+    ensure_checkpoint_table()
+    ensure_row_count_table()
+    ensure_source_count_table()
+    trade_dates = filter_trade_dates(all_trade_dates, mode)
+    if len(trade_dates) < len(all_trade_dates):
+        print(f"根据检查点跳过已完成的 {len(all_trade_dates) - len(trade_dates)} 个交易日", flush=True)
+    print(f"共需要处理 {len(trade_dates)} 个交易日（区间共 {total_days} 天）", flush=True)
+
+    # 拉取与写入流水线并行执行，按日期顺序汇总统计与输出
+    for trade_date, day_record_count, day_total, day_updated in run_ingest_pipeline(trade_dates):
         current_year = trade_date[:4]  # 提取当前日期的年份
+        print_day_result(trade_date, day_record_count)
 
-        # 拉取单日数据
-        df = get_single_day_data(trade_date)
+        # 写入失败的日期不计入统计，也不参与最新交易日的判断
+        if day_total is None:
+            failed_dates.append(trade_date)
+            print(f"           ❌ 写入失败：当日 {day_record_count} 条记录未入库", flush=True)
+            continue
 
         # 仅处理有数据的日期
-        if not df.empty:
+        if day_record_count > 0:
             has_data = True
+            latest_date = max(latest_date or trade_date, trade_date)
             # 累加当日记录数到总统计
-            day_record_count = len(df)
             total_record_count += day_record_count
 
-            # 写入数据库并更新统计值
-            day_total, day_updated = write_to_mysql_with_update(df)
+            # 更新写入统计值
             day_new = day_total - day_updated  # 当日新增数
             total_write_count += day_total
             total_update_count += day_updated
@@ -260,16 +512,19 @@ def get_daily_data_by_day(start_date, end_date):
 
             # 输出当日写入结果（格式化输出，提升可读性）
             print(
-                f"           ✅ 写入完成：当日总条目 {day_record_count} 条，更新 {day_updated} 条，新增 {day_total - day_updated} 条", flush=True)
+                f"           ✅ 写入完成：当日总条目 {day_record_count} 条，更新 {day_updated} 条，新增 {day_new} 条", flush=True)
 
-            # 显式清空当日DataFrame，释放内存（Python自动回收，显式更清晰）
-            df = None
-        
-        # 每次调用后等待0.5秒，避免触发Tushare频率限制
-        time.sleep(0.5)
+    # 刷新最新收盘价快照（本次只补抽历史数据时快照保持不变）
+    if has_data:
+        try:
+            snapshot_date, snapshot_count = refresh_latest_close(latest_date)
+            if snapshot_count:
+                print(f"📌 最新收盘价快照已刷新：{snapshot_date}，共 {snapshot_count} 条", flush=True)
+        except Exception as snapshot_err:
+            print(f"⚠️ 最新收盘价快照刷新失败：{snapshot_err}", flush=True)
 
     # 返回统计结果（无合并DataFrame，降低内存占用）
-    return has_data, total_record_count, total_write_count, total_update_count, year_stats
+    return has_data, total_record_count, total_write_count, total_update_count, year_stats, failed_dates
 
 
 # ===================== 程序入口 =====================
@@ -277,6 +532,14 @@ if __name__ == "__main__":
     # 基础配置：获取当前日期作为默认值
     today = datetime.now().strftime('%Y%m%d')
 
+    # 运行模式：默认全量；--resume 跳过已完成的交易日；--gaps-only 只补条目数不足的交易日
+    parser = argparse.ArgumentParser(description='A股日线数据批量拉取与入库')
+    mode_group = parser.add_mutually_exclusive_group()
+    mode_group.add_argument('--resume', action='store_true', help='跳过已有检查点的交易日')
+    mode_group.add_argument('--gaps-only', action='store_true', help='只处理没有检查点或条目数不足的交易日')
+    cli_args = parser.parse_args()
+    mode = 'resume' if cli_args.resume else 'gaps' if cli_args.gaps_only else 'full'
+
     # 用户输入：日期范围（支持默认值，直接回车使用当天）
     # 在 Streamlit 中调用时，通常通过 stdin 传递参数
     try:
@@ -298,18 +561,20 @@ if __name__ == "__main__":
         end_date = today
 
     # 输出任务信息
-    print(f"开始按天获取数据，日期范围: {start_date} 到 {end_date}", flush=True)
+    mode_text = {'full': '全量', 'resume': '断点续传', 'gaps': '只补缺口'}[mode]
+    print(f"开始按天获取数据，日期范围: {start_date} 到 {end_date}，模式: {mode_text}", flush=True)
     print("=" * 50, flush=True)
 
     try:
         # 记录任务开始
         try:
-            log_task_execution("日K线抽取", "RUNNING", f"开始执行: {start_date} - {end_date}")
+            log_task_execution("日K线抽取", "RUNNING", f"开始执行: {start_date} - {end_date} ({mode_text})")
         except Exception as e:
             print(f"日志记录失败: {e}", flush=True)
 
         # 执行主逻辑：拉取+写入数据
-        has_data, total_record, total_write, total_update, year_stats = get_daily_data_by_day(start_date, end_date)
+        has_data, total_record, total_write, total_update, year_stats, failed_dates = get_daily_data_by_day(
+            start_date, end_date, mode)
 
         # 新增：按年展示数据条目统计（标题和数值严格右对齐）
         if has_data:
@@ -329,6 +594,18 @@ if __name__ == "__main__":
                 print(f"{year:<10}{write_count}{update_count}{new_count}", flush=True)
             print("-" * 60, flush=True)
 
+        # 有交易日写入失败：列出失败日期，记录失败日志并以非零状态退出（任务队列据此记为失败）
+        if failed_dates:
+            failed_msg = f"{len(failed_dates)} 个交易日写入失败: {', '.join(failed_dates)}"
+            print("=" * 50, flush=True)
+            print(f"❌ {failed_msg}", flush=True)
+            print("可使用 --resume 或 --gaps-only 重新处理失败的交易日", flush=True)
+            try:
+                log_task_execution("日K线抽取", "FAIL", f"日期范围: {start_date} - {end_date}, {failed_msg}")
+            except Exception:
+                pass
+            sys.exit(1)
+
         # 输出最终统计结果
         if has_data:
             print("=" * 50, flush=True)
@@ -355,3 +632,4 @@ if __name__ == "__main__":
             log_task_execution("日K线抽取", "FAIL", f"执行出错: {str(e)}")
         except Exception:
             pass
+        sys.exit(1)
@@ -5,13 +5,13 @@ Tushare 月度数据校验工具
 1. 获取按月统计的 Tushare API 数据条目数（作为校验数）
 2. 与数据库中实际存储的数据条目数进行对比
 3. 计算差异并标记异常
-4. 处理接口频率限制，自动等待
+4. 只遍历交易日，按令牌桶限流并发调用接口，失败按指数退避重试
+5. 每日条目数持久化缓存（tushare_day_counts，日K线抽取时顺带记录），已定稿的交易日不再调用接口
 """
 
 import tushare as ts
 import pandas as pd
 from datetime import datetime, timedelta
-import time
 import os
 import sys
 import json
@@ -24,13 +24,17 @@ if current_dir not in sys.path:
     sys.path.append(current_dir)
 
 try:
-    from db_utils import get_db_engine
-    from sqlalchemy import text
+    from tushare_fetcher import TushareFetcher
+    from trade_calendar import get_trading_days
+    from daily_row_counts import get_monthly_counts
+    from source_counts import get_final_counts, save_counts
 except ImportError:
     # 如果作为模块导入时可能需要这样
     sys.path.append(os.path.join(os.path.dirname(current_dir)))
-    from utils.db_utils import get_db_engine
-    from sqlalchemy import text
+    from utils.tushare_fetcher import TushareFetcher
+    from utils.trade_calendar import get_trading_days
+    from utils.daily_row_counts import get_monthly_counts
+    from utils.source_counts import get_final_counts, save_counts
 
 # 加载环境变量
 load_dotenv()
@@ -39,133 +43,79 @@ load_dotenv('.env.local')
 # Tushare Pro接口初始化（优先从环境变量读取）
 tushare_token = os.getenv('TUSHARE_TOKEN', '1f18885fdd078e681cf087e23c1d6f28226103f470ccf8f30fc38809')
 pro = ts.pro_api(tushare_token)
+# 并发拉取器（令牌桶限流 + 指数退避重试）
+fetcher = TushareFetcher(pro)
+
+
+def print_day_count(trade_date, count):
+    """输出单日条目数（区分有数据和无数据）"""
+    if count > 0:
+        # 格式化日期输出，提升可读性
+        print(f"{trade_date[:4]}-{trade_date[4:6]}-{trade_date[6:]} 成功，共 {count} 条记录", flush=True)
+    else:
+        print(f"没有数据（可能是非交易日） {trade_date[:4]}-{trade_date[4:6]}-{trade_date[6:]}", flush=True)
 
 
 def get_single_day_count(trade_date):
     """
-    获取单日Tushare数据条目数（带无限重试机制）
-    逻辑说明：
-        1. 调用Tushare pro.daily接口拉取指定日期数据
-        2. 接口调用失败时，等待65秒后无限重试（直到成功或无数据）
-        3. 区分交易日（有数据）和非交易日（无数据）
+    获取单日Tushare数据条目数（令牌桶限流 + 指数退避重试）
 
     参数：
         trade_date: 交易日，格式为'YYYYMMDD'
     返回：
-        int: 成功返回数据条目数，失败持续重试直到成功
+        int: 数据条目数，无数据返回0
+    异常：
+        TushareFetchError: 超过重试上限仍失败
     """
-    retry_count = 0  # 重试次数计数器
-
-    while True:
-        try:
-            # 调用Tushare接口拉取数据
-            df = pro.daily(
-                trade_date=trade_date,
-                fields=["ts_code", "trade_date"]
-            )
-
-            # 数据返回处理
-            if not df.empty:
-                # 格式化日期输出，提升可读性
-                print(f"{trade_date[:4]}-{trade_date[4:6]}-{trade_date[6:]} 成功，共 {len(df)} 条记录", flush=True)
-                return len(df)
-            else:
-                print(f"没有数据（可能是非交易日） {trade_date[:4]}-{trade_date[4:6]}-{trade_date[6:]}", flush=True)
-                return 0
-
-        except Exception as e:
-            # 接口调用失败，重试逻辑
-            retry_count += 1
-            print(f"获取 {trade_date} 数据时出错 (第{retry_count}次重试): {e}", flush=True)
-            print(f"等待 15 秒后重试...", flush=True)
-            time.sleep(15)  # 重试间隔15秒
+    count = len(fetcher.fetch_daily(trade_date, ["ts_code", "trade_date"]))
+    print_day_count(trade_date, count)
+    return count
 
 
 def get_monthly_tushare_counts(start_date, end_date):
     """
     获取指定日期范围内的月度Tushare数据条目数
-    参照 tushare-Update_CN_stock_daily-final.py 的方式
+    只遍历交易所交易日；已定稿的交易日直接使用缓存的条目数，
+    其余交易日并发拉取，拉取结果写回缓存，按日期顺序汇总
     """
-    # 日期格式转换：字符串→datetime对象（便于日期遍历）
-    start = datetime.strptime(start_date, '%Y%m%d')
-    end = datetime.strptime(end_date, '%Y%m%d')
+    # 只处理交易日（周末、节假日不调用接口）
+    trade_dates = get_trading_days(start_date, end_date)
+    try:
+        day_counts = get_final_counts(trade_dates)
+    except Exception as e:
+        print(f"⚠️ 读取条目数缓存失败，全部重新拉取：{e}", flush=True)
+        day_counts = {}
+    to_fetch = [d for d in trade_dates if d not in day_counts]
+    print(f"共 {len(trade_dates)} 个交易日，其中 {len(day_counts)} 个使用已定稿的缓存条目数，"
+          f"需要拉取 {len(to_fetch)} 个", flush=True)
+
+    fetched = {}
+    for trade_date, df in fetcher.iter_daily(to_fetch, ["ts_code", "trade_date"]):
+        fetched[trade_date] = len(df)
+        print_day_count(trade_date, len(df))
+    try:
+        save_counts(fetched)
+    except Exception as e:
+        print(f"⚠️ 条目数缓存写入失败：{e}", flush=True)
+    day_counts.update(fetched)
 
-    # 统计变量初始化（仅保留统计值，不存储原始数据）
+    # 仅统计有数据的日期
     monthly_counts = {}
-
-    # 计算需要处理的总天数
-    total_days = (end - start).days + 1
-    print(f"共需要处理 {total_days} 天", flush=True)
-
-    # 按日期循环拉取数据
-    for day_count in range(total_days):
-        current_date = start + timedelta(days=day_count)  # 计算当前循环日期
-        trade_date = current_date.strftime('%Y%m%d')  # 转换为YYYYMMDD格式
-        current_year = trade_date[:4]  # 提取当前日期的年份
-        year_month = f"{trade_date[:4]}-{trade_date[4:6]}"
-
-        # 拉取单日数据
-        count = get_single_day_count(trade_date)
-
-        # 仅处理有数据的日期
+    for trade_date in trade_dates:
+        count = day_counts.get(trade_date, 0)
         if count > 0:
-            if year_month not in monthly_counts:
-                monthly_counts[year_month] = 0
-            monthly_counts[year_month] += count
-
-        # 每次调用后等待0.5秒，避免触发Tushare频率限制
-        if day_count < total_days - 1:
-            time.sleep(0.5)
+            year_month = f"{trade_date[:4]}-{trade_date[4:6]}"
+            monthly_counts[year_month] = monthly_counts.get(year_month, 0) + count
 
     return monthly_counts
 
 
 def get_monthly_db_counts(start_date=None, end_date=None):
     """
-    从数据库获取月度数据条目数
+    获取数据库月度数据条目数
+    读取日K线抽取维护的按交易日条目数汇总表（daily_row_counts），月度汇总在SQL中完成
     """
-    engine = get_db_engine()
-    try:
-        with engine.connect() as conn:
-            # 构建查询条件
-            where_conditions = []
-            params = {}
-            
-            if start_date:
-                where_conditions.append("trade_date >= :start_date")
-                params["start_date"] = start_date
-            
-            if end_date:
-                where_conditions.append("trade_date <= :end_date")
-                params["end_date"] = end_date
-            
-            where_clause = " WHERE " + " AND ".join(where_conditions) if where_conditions else ""
-            
-            # 查询按天统计的数据，然后在Python中聚合
-            query = text(f"""
-                SELECT 
-                    trade_date,
-                    COUNT(*) as total_count
-                FROM cn_stock_daily
-                {where_clause}
-                GROUP BY trade_date
-                ORDER BY trade_date DESC
-            """)
-            result = conn.execute(query, params).mappings()
-            
-            # 在Python中处理年月分组
-            monthly_data = {}
-            for row in result:
-                trade_date = str(row["trade_date"])
-                if len(trade_date) >= 6:
-                    year_month = f"{trade_date[:4]}-{trade_date[4:6]}"
-                    if year_month not in monthly_data:
-                        monthly_data[year_month] = 0
-                    monthly_data[year_month] += row["total_count"]
-            
-            return monthly_data
-    finally:
-        engine.dispose()
+    return get_monthly_counts(start_date, end_date)
 
 
 def get_verify_stats(start_date=None, end_date=None):